@@ -0,0 +1,250 @@
+"""Benchmark what mincepy_sci adds to process startup and to the first save, load, hash and eq of
+each of the supported types.  Every measurement is taken in a fresh interpreter so that nothing
+is already imported or cached, and the results are written to a JSON file, e.g.:
+
+    python benchmarks/startup.py --output startup.json
+
+By default, objects are saved to an in-memory mongomock archive so no database is needed.
+"""
+
+import argparse
+import copy
+import datetime
+import gc
+import importlib
+import importlib.metadata
+import json
+import platform
+import subprocess
+import sys
+import time
+from typing import Callable, Optional
+
+DEFAULT_URI = "mongomock://localhost#mincepy-benchmarks"
+
+
+def _ase_sample():
+    import ase.build
+
+    return ase.build.bulk("Cu", cubic=True) * (3, 3, 3)
+
+
+def _e3nn_sample():
+    from e3nn import o3
+
+    irreps = o3.Irreps("8x0e + 8x1o + 4x2e")
+    return o3.FullyConnectedTensorProduct(irreps, irreps, irreps)
+
+
+def _flax_sample():
+    from flax import linen
+
+    return linen.Sequential([linen.Dense(64), linen.relu, linen.Dense(8)])
+
+
+def _jax_sample():
+    import jax.numpy as jnp
+
+    return jnp.linspace(0.0, 1.0, 100_000).reshape(1000, 100)
+
+
+def _numpy_sample():
+    import numpy
+
+    return numpy.random.default_rng(0).random((1000, 100))
+
+
+def _pandas_sample():
+    import numpy
+    import pandas
+
+    rng = numpy.random.default_rng(0)
+    return pandas.DataFrame({"a": numpy.arange(10_000), "b": rng.random(10_000)})
+
+
+def _plams_sample():
+    from scm import plams
+
+    settings = plams.Settings()
+    settings.input.ams.task = "SinglePoint"
+    return settings
+
+
+def _pymatgen_sample():
+    import pymatgen.core
+
+    return pymatgen.core.Structure(
+        pymatgen.core.Lattice.cubic(5.64), ["Na", "Cl"], [[0, 0, 0], [0.5, 0.5, 0.5]]
+    )
+
+
+def _pytorch_sample():
+    import torch
+
+    return torch.linspace(0.0, 1.0, 100_000).reshape(1000, 100)
+
+
+def _rdkit_sample():
+    from rdkit import Chem
+
+    return Chem.MolFromSmiles("c1ccccc1O")
+
+
+#: A function creating a typical object for each plugin, `None` if there is no sensible one
+SAMPLES: dict[str, Optional[Callable]] = {
+    "ase_types": _ase_sample,
+    "e3nn_types": _e3nn_sample,
+    "flax_types": _flax_sample,
+    "jax_types": _jax_sample,
+    "numpy_types": _numpy_sample,
+    "pandas_types": _pandas_sample,
+    "plams_types": _plams_sample,
+    "pyilt2_types": None,
+    "pymatgen_types": _pymatgen_sample,
+    "pytorch_types": _pytorch_sample,
+    "rdkit_types": _rdkit_sample,
+}
+
+
+def measure_import(plugin: str) -> dict:
+    """Time importing a plugin module, which includes the library it supports"""
+    import mincepy  # pylint: disable=unused-import
+
+    start = time.perf_counter()
+    importlib.import_module(f"mincepy_sci.{plugin}")
+    return {"import": time.perf_counter() - start}
+
+
+def measure_get_types() -> dict:
+    """Time getting the types from the plugin entry point"""
+    import mincepy  # pylint: disable=unused-import
+
+    start = time.perf_counter()
+    from mincepy_sci import provides
+
+    types = provides.get_types()
+    return {"get_types": time.perf_counter() - start, "num_types": len(types)}
+
+
+def measure_first_calls(plugin: str, uri: str) -> dict:
+    """Time the first save, load, hash and eq of an object supported by the plugin"""
+    import mincepy
+
+    results = measure_import(plugin)
+    sample = SAMPLES[plugin]
+    if sample is None:
+        return results
+
+    # The plugins for everything imported so far, which includes those this one depends on
+    historian = mincepy.create_historian(uri)
+    obj = sample()
+
+    start = time.perf_counter()
+    obj_hash = historian.hash(obj)
+    results["hash"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    obj_id = historian.save_one(obj)
+    results["save"] = time.perf_counter() - start
+
+    expected = copy.deepcopy(obj)
+    del obj
+    gc.collect()
+    start = time.perf_counter()
+    loaded = historian.load(obj_id)
+    results["load"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    equal = historian.eq(loaded, expected)
+    results["eq"] = time.perf_counter() - start
+
+    results["round_trip"] = bool(equal)
+    results["same_hash"] = historian.hash(loaded) == obj_hash
+    return results
+
+
+def run_child(*args: str) -> dict:
+    """Run a measurement in a fresh interpreter"""
+    result = subprocess.run(
+        [sys.executable, __file__, "--child", *args],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if result.returncode:
+        lines = result.stderr.strip().splitlines()
+        return {"error": lines[-1] if lines else f"exit code {result.returncode}"}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run(plugins: list[str], uri: str, repeats: int) -> dict:
+    """Run all the benchmarks, keeping the fastest of the repeats of each measurement"""
+
+    def best(*args: str) -> dict:
+        runs = [run_child(*args) for _ in range(repeats)]
+        for entry in runs:
+            if "error" in entry or "skipped" in entry:
+                return entry
+        return {
+            key: min(entry[key] for entry in runs) if isinstance(runs[0][key], float) else value
+            for key, value in runs[0].items()
+        }
+
+    return {
+        "meta": {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "mincepy_sci": importlib.metadata.version("mincepy-sci"),
+            "mincepy": importlib.metadata.version("mincepy"),
+            "uri": uri,
+            "repeats": repeats,
+        },
+        "baseline": best("baseline"),
+        "get_types": best("get_types"),
+        "plugins": {plugin: best("first_calls", plugin, uri) for plugin in plugins},
+    }
+
+
+def _child(args: list[str]) -> dict:
+    kind = args[0]
+    if kind == "baseline":
+        start = time.perf_counter()
+        import mincepy  # pylint: disable=unused-import
+
+        return {"import_mincepy": time.perf_counter() - start}
+    if kind == "get_types":
+        return measure_get_types()
+    try:
+        return measure_first_calls(*args[1:])
+    except ModuleNotFoundError as exc:
+        # The library isn't installed
+        return {"skipped": str(exc)}
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        print(json.dumps(_child(sys.argv[2:])))
+        return
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default="startup.json", help="the JSON file to write")
+    parser.add_argument("--uri", default=DEFAULT_URI, help="the archive to save objects to")
+    parser.add_argument("--repeats", type=int, default=3, help="keep the fastest of this many")
+    parser.add_argument("plugins", nargs="*", default=list(SAMPLES), help="default: all of them")
+    args = parser.parse_args()
+
+    results = run(args.plugins, args.uri, args.repeats)
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+
+    for plugin, timings in results["plugins"].items():
+        summary = ", ".join(
+            f"{key}={value * 1000:.1f}ms" if isinstance(value, float) else f"{key}={value}"
+            for key, value in timings.items()
+        )
+        print(f"{plugin}: {summary}")
+
+
+if __name__ == "__main__":
+    main()
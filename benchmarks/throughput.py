@@ -0,0 +1,172 @@
+"""Benchmark saving, loading and hashing large objects against the approaches that they replaced,
+and check each speedup against its target.  Each measurement keeps the fastest of a number of
+repeats, and the results are written to a JSON file, e.g.:
+
+    python benchmarks/throughput.py --output throughput.json
+
+By default, objects are saved to an in-memory mongomock archive so no database is needed.  These
+timings depend on the machine and its load, which is why they are kept out of the test suite.
+"""
+
+import argparse
+import datetime
+import gc
+import hashlib
+import importlib.metadata
+import io
+import json
+import platform
+import time
+from typing import Callable
+
+import mincepy
+
+DEFAULT_URI = "mongomock://localhost#mincepy-benchmarks"
+
+
+def best_of(repeats: int, func: Callable, setup: Callable = lambda: None) -> float:
+    """Get the fastest time of calling `func` with the result of a fresh call to `setup`"""
+    times = []
+    for _ in range(repeats):
+        arg = setup()
+        gc.collect()
+        start = time.perf_counter()
+        func(arg)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def packed_module(historian: mincepy.Historian, repeats: int) -> dict:
+    """Save and load a module tree as a packed checkpoint rather than an object per submodule,
+    parameter and tensor"""
+    import torch  # pylint: disable=import-outside-toplevel
+
+    from mincepy_sci import pytorch_types  # pylint: disable=import-outside-toplevel
+
+    def make_model():
+        return torch.nn.ModuleList([torch.nn.Linear(1024, 1024) for _ in range(8)])
+
+    def save_and_load() -> tuple[float, float]:
+        obj_ids = []
+        save = best_of(repeats, lambda model: obj_ids.append(historian.save(model)), make_model)
+        load = best_of(repeats, historian.load, obj_ids.pop)
+        return save, load
+
+    unpacked_save, unpacked_load = save_and_load()
+    historian.register_type(pytorch_types.ModuleListHelper(packed=True))
+    packed_save, packed_load = save_and_load()
+    return {
+        "unpacked_save": unpacked_save,
+        "unpacked_load": unpacked_load,
+        "packed_save": packed_save,
+        "packed_load": packed_load,
+        "speedup": min(unpacked_save / packed_save, unpacked_load / packed_load),
+        "target": 10.0,
+    }
+
+
+def tensor_hashing(historian: mincepy.Historian, repeats: int) -> dict:
+    """Hash a 100 MB tensor from its buffer rather than from what `torch.save()` writes"""
+    import torch  # pylint: disable=import-outside-toplevel
+
+    tensor = torch.rand(25_000_000)
+
+    def pickle_hash(_):
+        with io.BytesIO() as buffer:
+            torch.save(tensor, buffer)
+            hashlib.blake2b(buffer.getvalue()).digest()
+
+    buffer_time = best_of(repeats, lambda _: historian.hash(tensor))
+    pickle_time = best_of(repeats, pickle_hash)
+    return {
+        "buffer": buffer_time,
+        "torch_save": pickle_time,
+        "speedup": pickle_time / buffer_time,
+        "target": 1.0,
+    }
+
+
+def array_hashing(historian: mincepy.Historian, repeats: int) -> dict:
+    """Hash a numpy array from its buffer rather than from `array.tolist()`"""
+    import numpy  # pylint: disable=import-outside-toplevel
+
+    from mincepy_sci import numpy_types  # pylint: disable=import-outside-toplevel
+
+    array = numpy.random.rand(100_000)
+    buffer_time = best_of(repeats, lambda _: historian.hash(array))
+    historian.register_type(numpy_types.ArrayHelper(legacy_hashing=True))
+    legacy_time = best_of(repeats, lambda _: historian.hash(array))
+    return {
+        "buffer": buffer_time,
+        "legacy": legacy_time,
+        "speedup": legacy_time / buffer_time,
+        "target": 10.0,
+    }
+
+
+#: The benchmarks by name, each takes a historian and the number of repeats
+BENCHMARKS: dict[str, Callable[[mincepy.Historian, int], dict]] = {
+    "array_hashing": array_hashing,
+    "packed_module": packed_module,
+    "tensor_hashing": tensor_hashing,
+}
+
+
+def run(names: list[str], uri: str, repeats: int) -> dict:
+    """Run the benchmarks, each with a fresh historian"""
+    results = {}
+    for name in names:
+        historian = mincepy.create_historian(uri)
+        try:
+            results[name] = BENCHMARKS[name](historian, repeats)
+        except ModuleNotFoundError as exc:
+            # The library isn't installed
+            results[name] = {"skipped": str(exc)}
+        finally:
+            historian.archive.database.client.drop_database(historian.archive.database)
+
+    return {
+        "meta": {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "mincepy_sci": importlib.metadata.version("mincepy-sci"),
+            "mincepy": importlib.metadata.version("mincepy"),
+            "uri": uri,
+            "repeats": repeats,
+        },
+        "benchmarks": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default="throughput.json", help="the JSON file to write")
+    parser.add_argument("--uri", default=DEFAULT_URI, help="the archive to save objects to")
+    parser.add_argument("--repeats", type=int, default=3, help="keep the fastest of this many")
+    parser.add_argument("names", nargs="*", default=list(BENCHMARKS), help="default: all of them")
+    args = parser.parse_args()
+
+    results = run(args.names, args.uri, args.repeats)
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+
+    for name, timings in results["benchmarks"].items():
+        if "skipped" in timings:
+            print(f"{name}: skipped ({timings['skipped']})")
+            continue
+        verdict = "meets" if timings["speedup"] >= timings["target"] else "MISSES"
+        print(
+            f"{name}: {timings['speedup']:.1f}x faster, {verdict} the {timings['target']:g}x "
+            "target ("
+            + ", ".join(
+                f"{key}={value * 1000:.1f}ms"
+                for key, value in timings.items()
+                if key not in ("speedup", "target")
+            )
+            + ")"
+        )
+
+
+if __name__ == "__main__":
+    main()
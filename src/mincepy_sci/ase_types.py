@@ -1,14 +1,25 @@
 """Module that provides interoperability between ase and mincepy"""
 
+import collections
+import collections.abc
+import hashlib
+import math
+from typing import Iterable, Iterator, Optional, Union
 import uuid
 
 import ase.calculators.calculator as ase_calculator
+import ase.calculators.singlepoint
 import ase.cell
+import ase.constraints
 import ase.db.row
+import bson
 import mincepy
+import numpy as np
 from typing_extensions import override
 
-__all__ = "AtomsHelper", "CellHelper"
+from . import fingerprints, numpy_types, utils
+
+__all__ = "AtomsHelper", "CellHelper", "Trajectory", "TrajectoryHelper", "save_atoms"
 
 
 class AtomsHelper(
@@ -16,38 +27,203 @@ class AtomsHelper(
     obj_type=ase.Atoms,
     type_id=uuid.UUID("ad4ca7ae-6ebc-4594-947d-ac42f5d96c1f"),
 ):
+    """Saves atoms as a single record in which the cell, pbc and per-atom arrays (positions,
+    numbers and any others, e.g. momenta or tags) are packed into one buffer using
+    `numpy_types.pack_arrays()`, as are any array results of the calculator.  The info dict and
+    constraints are stored as they are.  When loading, the arrays are filled straight from the
+    buffer without going through the checks and copies of `Atoms.__init__`.
+
+    Records saved by older versions (using `ase.db.row.atoms2dict`) can still be loaded.
+
+    The record also holds a fingerprint of the atoms, so that saved atoms matching some given ones
+    can be found quickly using `fingerprints.find_matching()`.
+
+    Hashes are computed directly from the buffers of all the saved arrays along with the info,
+    constraints and calculator results.  If `hash_tolerance` is given, floating point values are
+    rounded to the nearest multiple of it before being hashed, so that atoms that only differ by
+    less than this (e.g. from successive steps of a relaxation) will usually hash the same, and can
+    be found using the snapshot hash, see `save_atoms()`.  Note that values either side of a
+    rounding boundary still hash differently, and that changes smaller than the tolerance are not
+    seen as modifications when saving again.  Pass `legacy_hashing=True` to reproduce the hashes
+    of older versions, which only covered the cell, pbc, positions and numbers."""
+
     INJECT_CREATION_TRACKING = True
 
-    def __init__(self, load_original_calculator=False):
+    ARRAYS = "arrays"
+    CELL = "cell"
+    PBC = "pbc"
+    CELLDISP = "celldisp"
+    INFO = "info"
+    CONSTRAINTS = "constraints"
+    CALCULATOR = "calculator"
+    FINGERPRINT = fingerprints.FINGERPRINT
+
+    def __init__(
+        self,
+        load_original_calculator=False,
+        file_threshold: int = numpy_types.DEFAULT_FILE_THRESHOLD,
+        hash_tolerance: Optional[float] = None,
+        legacy_hashing=False,
+    ):
         super().__init__()
         self._load_original_calculator = load_original_calculator
+        self._file_threshold = file_threshold
+        self._hash_tolerance = hash_tolerance
+        self._legacy_hashing = legacy_hashing
 
     @override
     def yield_hashables(self, atoms: ase.Atoms, hasher, /):
-        yield from hasher.yield_hashables(atoms.cell)
-        yield from hasher.yield_hashables(atoms.pbc)
-        yield from hasher.yield_hashables(atoms.positions)
-        yield from hasher.yield_hashables(atoms.numbers)
+        if self._legacy_hashing:
+            yield from hasher.yield_hashables(atoms.cell.array.tolist())
+            yield from hasher.yield_hashables(atoms.pbc.tolist())
+            yield from hasher.yield_hashables(atoms.positions.tolist())
+            yield from hasher.yield_hashables(atoms.numbers.tolist())
+            return
+
+        arrays = {"cell": atoms.cell.array, "pbc": atoms.pbc, "celldisp": atoms.get_celldisp()}
+        arrays.update((f"arrays.{name}", array) for name, array in sorted(atoms.arrays.items()))
+        results = _get_results(atoms) if atoms.calc is not None else {}
+        arrays.update((f"results.{name}", value) for name, value in sorted(results.items()))
+        buffers = []
+        for name, array in arrays.items():
+            array = np.asarray(array, order="C")
+            if self._hash_tolerance is not None and array.dtype.kind == "f":
+                array = np.round(array / self._hash_tolerance).astype(np.int64)
+            arrays[name] = (str(array.dtype), array.shape)
+            buffers.append(numpy_types.raw_bytes(array))
+
+        # Describe all the arrays in one go, going through the hasher for each is comparatively slow
+        yield repr((arrays, len(atoms.constraints), bool(atoms.info))).encode()
+        yield from map(memoryview, buffers)
+        if atoms.constraints:
+            yield from hasher.yield_hashables([c.todict() for c in atoms.constraints])
+        if atoms.info:
+            yield from hasher.yield_hashables(atoms.info)
 
     @override
     def eq(self, one, other, /) -> bool:
         if not (isinstance(one, ase.Atoms) and isinstance(other, ase.Atoms)):
             return False
 
-        return (
+        # Compare the cheapest things first, so that we can stop as soon as there is a difference
+        if not (
             len(one) == len(other)
-            and (one.positions == other.positions).all()
-            and (one.numbers == other.numbers).all()
-            and (one.cell == other.cell).all()
-            and (one.pbc == other.pbc).all()
+            and one.arrays.keys() == other.arrays.keys()
+            and numpy_types.array_eq(one.pbc, other.pbc)
+            and numpy_types.array_eq(one.cell.array, other.cell.array)
+            and numpy_types.array_eq(one.get_celldisp(), other.get_celldisp())
+            and (one.calc is None) == (other.calc is None)
+            and len(one.constraints) == len(other.constraints)
+        ):
+            return False
+
+        if not all(
+            numpy_types.array_eq(array, other.arrays[name]) for name, array in one.arrays.items()
+        ):
+            return False
+
+        return (
+            _values_eq(
+                [constraint.todict() for constraint in one.constraints],
+                [constraint.todict() for constraint in other.constraints],
+            )
+            and _values_eq(one.info, other.info)
+            and (one.calc is None or _values_eq(_get_results(one), _get_results(other)))
         )
 
     @override
     def save_instance_state(self, atoms: ase.Atoms, saver, /):
-        return ase.db.row.atoms2dict(atoms)
+        celldisp = atoms.get_celldisp()
+        results = _get_results(atoms) if atoms.calc is not None else {}
+        arrays = [atoms.cell.array, atoms.pbc, *atoms.arrays.values()]
+        if celldisp.any():
+            arrays.append(celldisp)
+        arrays.extend(value for value in results.values() if isinstance(value, np.ndarray))
+
+        index, packed = numpy_types.pack_arrays(arrays)
+        entries = iter(index)
+        state = {
+            self.CELL: next(entries),
+            self.PBC: next(entries),
+            self.ARRAYS: {name: next(entries) for name in atoms.arrays},
+        }
+        if celldisp.any():
+            state[self.CELLDISP] = next(entries)
+        if atoms.info:
+            state[self.INFO] = atoms.info
+        if atoms.constraints:
+            state[self.CONSTRAINTS] = [constraint.todict() for constraint in atoms.constraints]
+        if atoms.calc is not None:
+            state[self.CALCULATOR] = {
+                "name": atoms.calc.name.lower(),
+                "parameters": atoms.calc.todict(),
+                "results": {
+                    name: next(entries) if isinstance(value, np.ndarray) else value
+                    for name, value in results.items()
+                },
+            }
+
+        state[self.FINGERPRINT] = self.fingerprint(atoms)
+        state.update(numpy_types.save_buffer(packed, saver, self._file_threshold, copy=False))
+        return state
 
     @override
-    def load_instance_state(self, atoms: ase.Atoms, saved_state, _referencer, /):
+    def load_instance_state(self, atoms: ase.Atoms, saved_state, loader: mincepy.Loader, /):
+        if "positions" in saved_state:
+            # Legacy encoding using `atoms2dict`
+            self._load_legacy_state(atoms, saved_state)
+            return
+
+        calculator = saved_state.get(self.CALCULATOR)
+        index = [saved_state[self.CELL], saved_state[self.PBC]]
+        index.extend(saved_state[self.ARRAYS].values())
+        if self.CELLDISP in saved_state:
+            index.append(saved_state[self.CELLDISP])
+        if calculator is not None:
+            index.extend(value for value in calculator["results"].values() if _is_entry(value))
+
+        packed = np.empty(numpy_types.packed_size(index), np.uint8)
+        numpy_types.load_buffer(saved_state, packed, 0, loader.get_archive().file_store)
+        arrays = iter(numpy_types.unpack_arrays(index, packed))
+
+        _fill_atoms(
+            atoms,
+            next(arrays),
+            next(arrays),
+            {name: next(arrays) for name in saved_state[self.ARRAYS]},
+            next(arrays) if self.CELLDISP in saved_state else None,
+            saved_state.get(self.CONSTRAINTS, []),
+            saved_state.get(self.INFO, {}),
+        )
+
+        if calculator is not None:
+            results = {
+                name: next(arrays) if _is_entry(value) else value
+                for name, value in calculator["results"].items()
+            }
+            self._set_calculator(atoms, calculator["name"], calculator["parameters"], results)
+
+    def fingerprint(self, atoms: ase.Atoms) -> dict:
+        """Get the fingerprint stored in the record of the atoms, see `fingerprints`"""
+        return fingerprints.make_fingerprint(
+            collections.Counter(atoms.get_chemical_symbols()),
+            atoms.cell.volume if atoms.pbc.all() else None,
+            atoms.cell.array,
+            atoms.positions,
+            atoms.pbc,
+        )
+
+    def _set_calculator(self, atoms: ase.Atoms, name: str, parameters: dict, results: dict):
+        if self._load_original_calculator:
+            try:
+                atoms.calc = ase_calculator.get_calculator_class(name)(**parameters)
+            except (AttributeError, ImportError, ValueError):
+                pass  # Not a calculator that we can create
+        elif results:
+            atoms.calc = ase.calculators.singlepoint.SinglePointCalculator(atoms, **results)
+            atoms.calc.name = name
+
+    def _load_legacy_state(self, atoms: ase.Atoms, saved_state):
         """Much of this is taken from ase.db.row.AtomsRow.toatoms() and therefore may
         need to be updated if the ase code changes"""
         row = ase.db.row.AtomsRow(saved_state)
@@ -88,8 +264,6 @@ class AtomsHelper(
         if data:
             atoms.info["data"] = data
 
-        return atoms
-
 
 class CellHelper(
     mincepy.TypeHelper,
@@ -100,14 +274,14 @@ class CellHelper(
 
     @override
     def yield_hashables(self, cell: ase.cell.Cell, hasher, /):
-        yield from hasher.yield_hashables(cell.array.tolist())
+        yield from hasher.yield_hashables(cell.array)
 
     @override
     def eq(self, one, other, /) -> bool:
-        if not isinstance(other, ase.cell.Cell):
+        if not (isinstance(one, ase.cell.Cell) and isinstance(other, ase.cell.Cell)):
             return False
 
-        return (one == other).all()
+        return numpy_types.array_eq(one.array, other.array)
 
     def save_instance_state(self, cell: ase.cell.Cell, _referencer, /):
         # Here we emulate what cell's todict method started to do in 3.20 because
@@ -121,4 +295,341 @@ class CellHelper(
         return cell
 
 
-TYPES = CellHelper, AtomsHelper
+class Trajectory(collections.abc.Sequence):
+    """A sequence of atoms, e.g. the frames of an MD run, that is saved as a single record.  The
+    frames can be given as any iterable of atoms, such as a list or an `ase.io.Trajectory`.
+
+    Fields that are the same in every frame (often the numbers, cell and pbc) are stored once,
+    while the others (e.g. the positions and the forces and energy of the calculator) are stacked
+    into arrays of frames and written to a file in the archive's file store.  Indexing a loaded
+    trajectory with a frame or a slice of frames only reads those frames from the file.  All frames
+    must have the same number of atoms and the same arrays and calculator results.  The
+    constraints are those of the first frame.
+
+    Trajectories can't be changed once created, and indexing gives new atoms each time."""
+
+    def __init__(self, frames: Iterable[ase.Atoms] = ()):
+        fields: dict[tuple, list[np.ndarray]] = {}
+        infos = []
+        self._constraints: list[dict] = []
+        self._calculator: Optional[str] = None
+        for atoms in frames:
+            frame_fields = _frame_fields(atoms)
+            if not infos:
+                fields = {key: [] for key in frame_fields}
+                self._constraints = [constraint.todict() for constraint in atoms.constraints]
+                self._calculator = atoms.calc.name.lower() if atoms.calc is not None else None
+            elif len(atoms) != len(fields[("arrays", "numbers")][0]):
+                raise ValueError(
+                    f"Frame {len(infos)} has {len(atoms)} atoms but the first frame has "
+                    f"{len(fields[('arrays', 'numbers')][0])}"
+                )
+            elif frame_fields.keys() != fields.keys():
+                raise ValueError(
+                    f"Frame {len(infos)} has different fields to the first frame: "
+                    f"{sorted(frame_fields)} != {sorted(fields)}"
+                )
+            for key, value in frame_fields.items():
+                fields[key].append(value)
+            infos.append(dict(atoms.info))
+
+        self._num_frames = len(infos)
+        self._constant: dict[tuple, np.ndarray] = {}
+        self._varying: dict[tuple, np.ndarray] = {}
+        for key, values in fields.items():
+            if all(numpy_types.array_eq(values[0], value) for value in values[1:]):
+                self._constant[key] = values[0].copy()
+            else:
+                self._varying[key] = np.stack(values)
+        # The info is stored once, if it is the same for all frames, otherwise for each frame
+        self._info: Union[dict, list[dict]] = infos
+        if not infos or all(_values_eq(info, infos[0]) for info in infos[1:]):
+            self._info = infos[0] if infos else {}
+        self._digest = _digest(self._constant, self._varying)
+        # Set for a loaded trajectory, the varying fields are then read from the file as needed
+        self._varying_state: Optional[dict] = None
+        self.file_store = None
+
+    def __len__(self) -> int:
+        return self._num_frames
+
+    def __getitem__(self, item):
+        frames = range(self._num_frames)[item]
+        if isinstance(frames, range):
+            return self._read(frames)
+        return self._read(range(frames, frames + 1))[0]
+
+    def __repr__(self) -> str:
+        return f"Trajectory(<{self._num_frames} frames>)"
+
+    def _read(self, frames: range) -> list[ase.Atoms]:
+        if self._varying_state is None:
+            selection = np.asarray(frames, dtype=np.intp)
+            varying = {key: array[selection] for key, array in self._varying.items()}
+        else:
+            varying = _read_frames(self._varying_state, frames, self.file_store)
+
+        result = []
+        for i, frame in enumerate(frames):
+            fields = {key: value.copy() for key, value in self._constant.items()}
+            fields.update((key, array[i]) for key, array in varying.items())
+            arrays = {key[1]: value for key, value in fields.items() if key[0] == "arrays"}
+            atoms = ase.Atoms.__new__(ase.Atoms)
+            _fill_atoms(
+                atoms,
+                fields[("cell",)],
+                fields[("pbc",)],
+                arrays,
+                fields[("celldisp",)],
+                self._constraints,
+                self._info if isinstance(self._info, dict) else self._info[frame],
+            )
+            results = {
+                key[1]: value.item() if value.ndim == 0 else value
+                for key, value in fields.items()
+                if key[0] == "results"
+            }
+            if results:
+                atoms.calc = ase.calculators.singlepoint.SinglePointCalculator(atoms, **results)
+                atoms.calc.name = self._calculator
+            result.append(atoms)
+
+        return result
+
+    def _all_varying(self) -> dict[tuple, np.ndarray]:
+        if self._varying_state is None:
+            return self._varying
+        return _read_frames(self._varying_state, range(self._num_frames), self.file_store)
+
+
+class TrajectoryHelper(
+    mincepy.TypeHelper,
+    obj_type=Trajectory,
+    type_id=uuid.UUID("b83d80f3-5153-4b4c-804a-460afd771d50"),
+):
+    """Saves a `Trajectory` with its constant fields packed into a buffer in the record and its
+    varying fields packed into a file"""
+
+    FRAMES = "frames"
+    DIGEST = "digest"
+    CONSTANT = "constant"
+    VARYING = "varying"
+    FIELDS = "fields"
+    INFO = "info"
+    CONSTRAINTS = "constraints"
+    CALCULATOR = "calculator"
+
+    @override
+    def yield_hashables(self, trajectory: Trajectory, hasher, /):
+        # pylint: disable=protected-access
+        yield from hasher.yield_hashables(trajectory._num_frames)
+        yield from hasher.yield_hashables(trajectory._digest)
+        yield from hasher.yield_hashables(trajectory._info)
+        yield from hasher.yield_hashables(trajectory._constraints)
+        yield from hasher.yield_hashables(trajectory._calculator)
+
+    @override
+    def eq(self, one, other, /) -> bool:
+        if not (isinstance(one, Trajectory) and isinstance(other, Trajectory)):
+            return False
+
+        # pylint: disable=protected-access
+        return (
+            len(one) == len(other)
+            and one._digest == other._digest
+            and _values_eq(one._info, other._info)
+            and one._constraints == other._constraints
+            and one._calculator == other._calculator
+        )
+
+    @override
+    def save_instance_state(self, trajectory: Trajectory, saver: mincepy.Saver, /):
+        # pylint: disable=protected-access
+        index, packed = numpy_types.pack_arrays(list(trajectory._constant.values()))
+        constant = {self.FIELDS: _nest_fields(trajectory._constant, index)}
+        constant.update(
+            numpy_types.save_buffer(packed, saver, numpy_types.DEFAULT_FILE_THRESHOLD, copy=False)
+        )
+
+        # Write straight to the file store, rather than through a local copy, so that frames can
+        # be read from it without downloading the whole file
+        varying_arrays = trajectory._all_varying()
+        file_store = saver.get_archive().file_store
+        file_id = bson.ObjectId()
+        with file_store.open_upload_stream_with_id(file_id, "trajectory.bin") as stream:
+            index = numpy_types.write_packed(list(varying_arrays.values()), stream)
+        varying = {
+            self.FIELDS: _nest_fields(varying_arrays, index),
+            numpy_types.ArrayHelper.FILE: numpy_types.written_file(
+                file_store, file_id, "trajectory.bin"
+            ),
+        }
+
+        return {
+            self.FRAMES: trajectory._num_frames,
+            self.DIGEST: trajectory._digest,
+            self.CONSTANT: constant,
+            self.VARYING: varying,
+            self.INFO: trajectory._info,
+            self.CONSTRAINTS: trajectory._constraints,
+            self.CALCULATOR: trajectory._calculator,
+        }
+
+    @override
+    def load_instance_state(
+        self, trajectory: Trajectory, saved_state: dict, loader: mincepy.Loader, /
+    ):
+        # pylint: disable=protected-access
+        trajectory.__init__()  # pylint: disable=unnecessary-dunder-call
+        file_store = loader.get_archive().file_store
+        constant = saved_state[self.CONSTANT]
+        entries = list(_flatten_fields(constant[self.FIELDS]))
+        keys = [key for key, _entry in entries]
+        index = [entry for _key, entry in entries]
+        packed = np.empty(numpy_types.packed_size(index), np.uint8)
+        numpy_types.load_buffer(constant, packed, 0, file_store)
+
+        trajectory._num_frames = saved_state[self.FRAMES]
+        trajectory._digest = saved_state[self.DIGEST]
+        trajectory._constant = dict(zip(keys, numpy_types.unpack_arrays(index, packed)))
+        trajectory._info = saved_state[self.INFO]
+        trajectory._constraints = saved_state[self.CONSTRAINTS]
+        trajectory._calculator = saved_state[self.CALCULATOR]
+        trajectory._varying_state = saved_state[self.VARYING]
+        trajectory.file_store = file_store
+
+
+def save_atoms(historian: mincepy.Historian, atoms: ase.Atoms, meta: Optional[dict] = None):
+    """Save atoms unless ones with the same hash have been saved already, and get the object id of
+    the record either way.  With a `hash_tolerance` set on the `AtomsHelper`, this skips saving
+    near duplicates, e.g. from a relaxation that has converged."""
+    return utils.save_unique(historian, atoms, meta)
+
+
+def _get_results(atoms: ase.Atoms) -> dict:
+    """Get the results of the calculator, if they are for the atoms as they are now"""
+    if atoms.calc.check_state(atoms):
+        return {}
+
+    results = {}
+    for prop in ase_calculator.all_properties:
+        try:
+            value = atoms.calc.get_property(prop, atoms, False)
+        except ase_calculator.PropertyNotImplementedError:
+            continue
+        if isinstance(value, np.generic):
+            value = value.item()
+        if value is not None:
+            results[prop] = value
+    return results
+
+
+def _frame_fields(atoms: ase.Atoms) -> dict[tuple, np.ndarray]:
+    """Get the arrays that make up a frame of a trajectory, keyed by their path in the record"""
+    fields = {("cell",): atoms.cell.array, ("pbc",): atoms.pbc, ("celldisp",): atoms.get_celldisp()}
+    fields.update((("arrays", name), array) for name, array in atoms.arrays.items())
+    if atoms.calc is not None:
+        fields.update(
+            (("results", name), np.asarray(value)) for name, value in _get_results(atoms).items()
+        )
+    return fields
+
+
+def _nest_fields(fields: dict[tuple, np.ndarray], index: list[dict]) -> dict:
+    nested = {}
+    for key, entry in zip(fields, index):
+        if len(key) == 1:
+            nested[key[0]] = entry
+        else:
+            nested.setdefault(key[0], {})[key[1]] = entry
+    return nested
+
+
+def _flatten_fields(nested: dict) -> Iterator[tuple[tuple, dict]]:
+    for name, value in nested.items():
+        if _is_entry(value):
+            yield (name,), value
+        else:
+            yield from (((name, key), entry) for key, entry in value.items())
+
+
+def _read_frames(state: dict, frames: range, file_store) -> dict[tuple, np.ndarray]:
+    """Read the given frames of the varying fields of a trajectory from its file"""
+    varying = {}
+    for key, entry in _flatten_fields(state[TrajectoryHelper.FIELDS]):
+        dtype = np.dtype(entry["dtype"])
+        frame_shape = tuple(entry["shape"][1:])
+        frame_size = dtype.itemsize * math.prod(frame_shape)
+        out = np.empty((len(frames), *frame_shape), dtype)
+        if frames.step == 1 and frames:
+            # The frames are contiguous, so read them in one go
+            offset = entry["offset"] + frames.start * frame_size
+            numpy_types.load_buffer(state, out, offset, file_store)
+        else:
+            for i, frame in enumerate(frames):
+                offset = entry["offset"] + frame * frame_size
+                numpy_types.load_buffer(state, out[i : i + 1], offset, file_store)
+        varying[key] = out
+    return varying
+
+
+def _digest(*field_sets: dict[tuple, np.ndarray]) -> str:
+    digest = hashlib.blake2b(digest_size=32)
+    for fields in field_sets:
+        for key, array in fields.items():
+            array = np.asarray(array, order="C")
+            digest.update(repr((key, str(array.dtype), array.shape)).encode())
+            digest.update(memoryview(numpy_types.raw_bytes(array)))
+    return digest.hexdigest()
+
+
+def _fill_atoms(
+    atoms: ase.Atoms,
+    cell: np.ndarray,
+    pbc: np.ndarray,
+    arrays: dict[str, np.ndarray],
+    celldisp: Optional[np.ndarray],
+    constraints: list[dict],
+    info: dict,
+):
+    """Fill in the attributes that `Atoms.__init__` would, taking the arrays as they are.  This
+    needs updating if ase changes."""
+    # pylint: disable=protected-access
+    atoms._cellobj = ase.cell.Cell(cell)
+    atoms._pbc = pbc
+    atoms.arrays = arrays
+    atoms._celldisp = np.zeros((3, 1)) if celldisp is None else celldisp
+    atoms._constraints = [ase.constraints.dict2constraint(entry) for entry in constraints]
+    atoms.info = dict(info)
+    atoms._calc = None
+
+
+def _values_eq(one, other) -> bool:
+    """Compare values that may contain arrays, e.g. an info dict"""
+    if isinstance(one, np.ndarray) or isinstance(other, np.ndarray):
+        return (
+            isinstance(one, np.ndarray)
+            and isinstance(other, np.ndarray)
+            and numpy_types.array_eq(one, other)
+        )
+    if isinstance(one, dict):
+        return (
+            isinstance(other, dict)
+            and one.keys() == other.keys()
+            and all(_values_eq(value, other[key]) for key, value in one.items())
+        )
+    if isinstance(one, (list, tuple)):
+        return (
+            isinstance(other, type(one))
+            and len(one) == len(other)
+            and all(_values_eq(value, other_value) for value, other_value in zip(one, other))
+        )
+    return bool(one == other)
+
+
+def _is_entry(value) -> bool:
+    """Is the value the index entry of an array in the packed buffer"""
+    return isinstance(value, dict) and "offset" in value
+
+
+TYPES = CellHelper, AtomsHelper, TrajectoryHelper
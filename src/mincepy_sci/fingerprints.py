@@ -0,0 +1,185 @@
+"""Cheap, invariant fingerprints of atomic structures.  The ase and pymatgen helpers store these in
+their records so that the saved structures that could match a given one can be found with an
+(indexed) query, and only those are loaded and compared in full, see `find_matching()`.
+
+A fingerprint is invariant to translations, rotations and the order of the atoms, and holds the
+reduced (Hill) formula, the composition, the number of atoms, the volume per atom (`None` unless
+the structure is periodic in all three directions) and a histogram of the interatomic distances,
+per atom, up to `DISTANCE_CUTOFF`.  The histogram is `None` for structures too big to get it
+cheaply, in which case only the other fields are used to narrow down the candidates."""
+
+import math
+from typing import Callable, Mapping, Optional
+
+import mincepy
+import numpy as np
+
+__all__ = (
+    "FINGERPRINT",
+    "DISTANCE_CUTOFF",
+    "DISTANCE_BINS",
+    "make_fingerprint",
+    "pair_distances",
+    "find_matching",
+    "create_index",
+)
+
+#: The key of the fingerprint in the saved state of a structure
+FINGERPRINT = "fingerprint"
+#: The distances (in Å) covered by the histogram, and the number of bins
+DISTANCE_CUTOFF = 4.0
+DISTANCE_BINS = 16
+#: Beyond this many pairs of atoms and periodic images, the histogram is left out
+MAX_PAIRS = 250_000
+
+
+def make_fingerprint(
+    composition: Mapping[str, float],
+    volume: Optional[float],
+    cell,
+    positions,
+    pbc,
+) -> dict:
+    """Make the fingerprint of a structure given the amount of each element, its volume (if it is
+    periodic in all directions), and its cell, cartesian positions and periodic boundaries"""
+    natoms = len(positions)
+    distances = pair_distances(cell, positions, pbc, DISTANCE_CUTOFF)
+    histogram = None
+    if distances is not None:
+        bins = (distances * (DISTANCE_BINS / DISTANCE_CUTOFF)).astype(int)
+        counts = np.bincount(np.minimum(bins, DISTANCE_BINS - 1), minlength=DISTANCE_BINS)
+        histogram = (counts / max(natoms, 1)).tolist()
+
+    composition = {symbol: _number(amount) for symbol, amount in sorted(composition.items())}
+    return {
+        "formula": _reduced_formula(composition),
+        "composition": composition,
+        "natoms": natoms,
+        "volume_per_atom": float(volume) / natoms if volume and natoms else None,
+        "distances": histogram,
+    }
+
+
+def pair_distances(cell, positions, pbc, cutoff: float) -> Optional[np.ndarray]:
+    """Get the distances, shorter than the cutoff, from each atom to all the others and to the
+    periodic images of all the atoms (including itself).  Gives `None` if this would mean checking
+    more than `MAX_PAIRS` distances."""
+    positions = np.asarray(positions, dtype=float).reshape(-1, 3)
+    cell = np.asarray(cell, dtype=float).reshape(3, 3)
+    pbc = np.broadcast_to(np.asarray(pbc, dtype=bool), 3)
+    if pbc.any() and abs(np.linalg.det(cell)) < 1e-12:
+        # Can't be periodic without a full cell
+        pbc = np.zeros(3, dtype=bool)
+
+    repeats = np.zeros(3, dtype=int)
+    if pbc.any():
+        # Enough images to cover the cutoff, given the spacing between the lattice planes, once the
+        # vectors between atoms have been wrapped to within half a cell
+        inverse = np.linalg.inv(cell)
+        spacings = 1.0 / np.linalg.norm(inverse, axis=0)
+        repeats[pbc] = np.ceil(cutoff / spacings[pbc])
+    if len(positions) ** 2 * np.prod(2 * repeats + 1) > MAX_PAIRS:
+        return None
+
+    vectors = positions[None, :, :] - positions[:, None, :]
+    if pbc.any():
+        fractional = vectors @ inverse
+        fractional[..., pbc] -= np.round(fractional[..., pbc])
+        vectors = fractional @ cell
+
+    images = np.indices(2 * repeats + 1).reshape(3, -1).T - repeats
+    vectors = vectors.reshape(-1, 1, 3) + images @ cell
+    squared = np.einsum("ijk,ijk->ij", vectors, vectors)
+    return np.sqrt(squared[(squared > 0.0) & (squared < cutoff**2)])
+
+
+def find_matching(
+    historian: mincepy.Historian,
+    structure,
+    volume_tolerance: float = 1e-3,
+    distance_tolerance: float = 0.5,
+    match: Optional[Callable] = None,
+    limit: Optional[int] = None,
+) -> list:
+    """Get the object ids of the saved structures, of the same type as the given one, that match it.
+    The candidates are first found by querying for those with the same formula and number of
+    atoms, and a volume per atom within the (relative) `volume_tolerance`.  Of these, the ones
+    whose distance histograms differ by no more than `distance_tolerance` (summed over the bins)
+    are then loaded and compared using `match(structure, candidate)`, which defaults to
+    `historian.eq`.  Structures saved before fingerprints were added are not found."""
+    helper = historian.get_helper(type(structure))
+    try:
+        fingerprint = helper.fingerprint(structure)
+    except AttributeError:
+        raise TypeError(f"Can't fingerprint objects of type '{type(structure).__name__}'") from None
+    if match is None:
+        match = historian.eq
+
+    query = {
+        f"{FINGERPRINT}.formula": fingerprint["formula"],
+        f"{FINGERPRINT}.natoms": fingerprint["natoms"],
+    }
+    volume = fingerprint["volume_per_atom"]
+    if volume is None:
+        query[f"{FINGERPRINT}.volume_per_atom"] = None
+    else:
+        query[f"{FINGERPRINT}.volume_per_atom"] = {
+            "$gte": volume * (1.0 - volume_tolerance),
+            "$lte": volume * (1.0 + volume_tolerance),
+        }
+
+    matching = []
+    for record in historian.records.find(obj_type=type(structure), state=query):
+        histogram = record.state[FINGERPRINT]["distances"]
+        if (
+            histogram is not None
+            and fingerprint["distances"] is not None
+            and np.abs(np.subtract(histogram, fingerprint["distances"])).sum() > distance_tolerance
+        ):
+            continue
+        if match(structure, historian.load_snapshot_from_record(record)):
+            matching.append(record.obj_id)
+            if limit is not None and len(matching) >= limit:
+                break
+
+    return matching
+
+
+def create_index(historian: mincepy.Historian):
+    """Create an index on the fingerprints of the saved structures for `find_matching()` to use.
+    This only needs to be done once for each archive, and only makes sense for large ones."""
+    historian.archive.data_collection.create_index(
+        [
+            (f"state.{FINGERPRINT}.formula", 1),
+            (f"state.{FINGERPRINT}.natoms", 1),
+            (f"state.{FINGERPRINT}.volume_per_atom", 1),
+        ],
+        name=FINGERPRINT,
+        sparse=True,
+    )
+
+
+def _number(amount: float):
+    """Get the amount as an int if it is a whole number"""
+    return int(amount) if float(amount).is_integer() else float(amount)
+
+
+def _reduced_formula(composition: dict) -> str:
+    """Get the reduced formula in Hill order: carbon, hydrogen then the rest alphabetically, or all
+    alphabetically if there is no carbon"""
+    amounts = {}
+    if "C" in composition:
+        for symbol in ("C", "H"):
+            if symbol in composition:
+                amounts[symbol] = composition[symbol]
+    amounts.update(
+        (symbol, amount) for symbol, amount in composition.items() if symbol not in amounts
+    )
+
+    if all(isinstance(amount, int) for amount in amounts.values()) and amounts:
+        divisor = math.gcd(*amounts.values())
+        amounts = {symbol: amount // divisor for symbol, amount in amounts.items()}
+
+    return "".join(
+        symbol if amount == 1 else f"{symbol}{amount:g}" for symbol, amount in amounts.items()
+    )
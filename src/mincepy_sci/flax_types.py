@@ -1,43 +1,75 @@
+"""Module that provides interoperability between flax and mincepy"""
+
+import dataclasses
+import importlib
+from typing import Any, Optional
 import uuid
 
 from flax import linen
+from flax.core import frozen_dict
+import jax
+import jax.numpy as jnp
 import mincepy
+import numpy as np
 from typing_extensions import override
 
+from . import jax_types, utils
+
+__all__ = (
+    "LinenModuleHelper",
+    "LinenDenseHelper",
+    "LinenDenseGeneralHelper",
+    "LinenConvHelper",
+    "LinenLayerNormHelper",
+    "LinenEmbedHelper",
+    "LinenSequentialHelper",
+    "FrozenDictHelper",
+    "save_module",
+)
 
-class LinenDenseHelper(
-    mincepy.TypeHelper,
-    obj_type=linen.Dense,
-    type_id=uuid.UUID("fb7ba12b-974e-4b52-bc02-8e0d693dd39a"),
-    immutable=True,
-):
+
+class LinenModuleHelper(mincepy.TypeHelper, obj_type=None, type_id=None):
+    """A helper for linen modules.  These are frozen dataclasses defined entirely by their fields,
+    so only the fields that differ from their defaults are stored.  Submodules are stored by value,
+    dtypes by name and functions (e.g. activations in a `Sequential`) by their import path.  Other
+    callables, e.g. custom initializers, can only be saved if they are left at their default."""
 
     @override
-    def yield_hashables(self, dense: linen.Dense, hasher, /):
-        yield dense.features
-        yield dense.use_bias
-        yield dense.dtype
-        yield dense.param_dtype
-        yield dense.precision
-        yield dense.kernel_init
-        yield dense.bias_init
+    def yield_hashables(self, module: linen.Module, hasher, /):
+        yield from hasher.yield_hashables(self.save_instance_state(module, None))
 
     @override
-    def save_instance_state(self, sequential: linen.Sequential, saver: mincepy.Saver, /):
-        return saver.save_state(sequential.layers)
+    def save_instance_state(self, module: linen.Module, _saver, /) -> dict:
+        config = {}
+        for field in dataclasses.fields(module):
+            if field.name == "parent":
+                continue
+            value = getattr(module, field.name)
+            if not _is_default(value, field):
+                config[field.name] = _encode_value(value, f"{type(module).__name__}.{field.name}")
+        return config
 
     @override
-    def new(self, saved_state: list, /) -> linen.Sequential:
-        return linen.Sequential(saved_state)
+    def new(self, saved_state: dict, /) -> linen.Module:
+        return self.TYPE(**{name: _decode_value(value) for name, value in saved_state.items()})
 
     @override
-    def load_instance_state(self, sequential: linen.Sequential, saved_state: list, _referencer, /):
+    def load_instance_state(self, module: linen.Module, saved_state: dict, _referencer, /):
         # Nothing to do, all done in new()
         pass
 
 
+class LinenDenseHelper(
+    LinenModuleHelper,
+    obj_type=linen.Dense,
+    type_id=uuid.UUID("fb7ba12b-974e-4b52-bc02-8e0d693dd39a"),
+    immutable=True,
+):
+    pass
+
+
 class LinenDenseGeneralHelper(
-    mincepy.TypeHelper,
+    LinenModuleHelper,
     obj_type=linen.DenseGeneral,
     type_id=uuid.UUID("2f48a5ee-03d9-4705-89ff-5bcd8d815afe"),
     immutable=True,
@@ -45,26 +77,171 @@ class LinenDenseGeneralHelper(
     pass
 
 
+class LinenConvHelper(
+    LinenModuleHelper,
+    obj_type=linen.Conv,
+    type_id=uuid.UUID("54b1aa41-2a55-4292-b609-938f4c196781"),
+    immutable=True,
+):
+    pass
+
+
+class LinenLayerNormHelper(
+    LinenModuleHelper,
+    obj_type=linen.LayerNorm,
+    type_id=uuid.UUID("bc0eeeb4-6bf0-4106-bd82-479178129f12"),
+    immutable=True,
+):
+    pass
+
+
+class LinenEmbedHelper(
+    LinenModuleHelper,
+    obj_type=linen.Embed,
+    type_id=uuid.UUID("05781cd8-284d-43d5-bc8e-b679b7134bfe"),
+    immutable=True,
+):
+    pass
+
+
 class LinenSequentialHelper(
-    mincepy.TypeHelper,
+    LinenModuleHelper,
     obj_type=linen.Sequential,
     type_id=uuid.UUID("a2ebfb10-5719-4593-b77d-bb4c54092357"),
     immutable=True,
 ):
+    pass
+
+
+class FrozenDictHelper(
+    mincepy.TypeHelper,
+    obj_type=frozen_dict.FrozenDict,
+    type_id=uuid.UUID("313f8cb6-d81a-441c-8d57-2f91e4efc5ab"),
+    immutable=True,
+):
+    """Saves a frozen dict of parameters as a single packed record using `jax_types.save_tree()`"""
 
     @override
-    def yield_hashables(self, sequential: linen.Sequential, hasher, /):
-        yield from hasher.yield_hashables(sequential.layers)
+    def yield_hashables(self, frozen: frozen_dict.FrozenDict, hasher, /):
+        yield from jax_types.yield_tree_hashables(frozen.unfreeze(), hasher)
 
     @override
-    def save_instance_state(self, sequential: linen.Sequential, saver: mincepy.Saver, /):
-        return saver.save_state(sequential.layers)
+    def save_instance_state(self, frozen: frozen_dict.FrozenDict, saver: mincepy.Saver, /):
+        # Frozen dicts are created by `new()` which has no file store, so we can't write in the
+        # background
+        return jax_types.save_tree(frozen.unfreeze(), saver, background=False)
 
     @override
-    def new(self, saved_state: list, /) -> linen.Sequential:
-        return linen.Sequential(saved_state)
+    def new(self, saved_state: dict, /) -> frozen_dict.FrozenDict:
+        return frozen_dict.freeze(jax_types.load_tree(saved_state))
 
     @override
-    def load_instance_state(self, sequential: linen.Sequential, saved_state: list, _referencer, /):
+    def load_instance_state(
+        self, frozen: frozen_dict.FrozenDict, saved_state: dict, _referencer, /
+    ):
         # Nothing to do, all done in new()
         pass
+
+
+def save_module(historian: mincepy.Historian, module: linen.Module, meta: Optional[dict] = None):
+    """Save a module unless one with the same type and configuration has been saved already, and get
+    the object id of the record either way.  Experiments that share an architecture can then all
+    refer to a single record of it."""
+    return utils.save_unique(historian, module, meta)
+
+
+def _is_default(value, field: dataclasses.Field) -> bool:
+    if field.default is not dataclasses.MISSING:
+        default = field.default
+    elif field.default_factory is not dataclasses.MISSING:
+        default = field.default_factory()
+    else:
+        return False
+
+    if value is default:
+        return True
+    if _as_dtype(value) is not None:
+        return _as_dtype(value) == _as_dtype(default)
+    if callable(value) or callable(default):
+        return False
+    try:
+        return bool(value == default) and type(value) is type(default)
+    except (TypeError, ValueError):
+        return False
+
+
+def _as_dtype(value) -> Optional[np.dtype]:
+    """Get the dtype if the value is one, or a scalar type such as `jnp.float32`"""
+    if isinstance(value, np.dtype):
+        return value
+    if isinstance(value, type) and not issubclass(value, linen.Module):
+        try:
+            return jnp.dtype(value)
+        except TypeError:
+            pass
+    return None
+
+
+def _encode_value(value, path: str) -> Any:
+    if value is None or isinstance(value, (bool, int, float, str, linen.Module)):
+        return value
+    if isinstance(value, list):
+        return [_encode_value(entry, path) for entry in value]
+    if isinstance(value, tuple):
+        return {"tuple": [_encode_value(entry, path) for entry in value]}
+    if isinstance(value, jax.lax.Precision):
+        return {"precision": value.name}
+    dtype = _as_dtype(value)
+    if dtype is not None:
+        return {"dtype": dtype.name}
+    if callable(value):
+        import_path = _import_path(value)
+        if import_path is not None:
+            return {"function": import_path}
+
+    raise ValueError(f"Can't save '{path}', unsupported value: {value!r}")
+
+
+def _decode_value(value) -> Any:
+    if isinstance(value, list):
+        return [_decode_value(entry) for entry in value]
+    if not isinstance(value, dict):
+        return value
+    if "tuple" in value:
+        return tuple(_decode_value(entry) for entry in value["tuple"])
+    if "precision" in value:
+        return jax.lax.Precision[value["precision"]]
+    if "dtype" in value:
+        return jnp.dtype(value["dtype"])
+
+    module_name, _, qualname = value["function"].partition(":")
+    obj = importlib.import_module(module_name)
+    for name in qualname.split("."):
+        obj = getattr(obj, name)
+    return obj
+
+
+def _import_path(func) -> Optional[str]:
+    """Get the path a function can be imported from, if there is one"""
+    module_name = getattr(func, "__module__", None)
+    qualname = getattr(func, "__qualname__", None)
+    if module_name is None or qualname is None or "<" in qualname:
+        return None
+    import_path = f"{module_name}:{qualname}"
+    try:
+        if _decode_value({"function": import_path}) is not func:
+            return None
+    except (ImportError, AttributeError):
+        return None
+    return import_path
+
+
+TYPES = (
+    LinenDenseHelper,
+    LinenDenseGeneralHelper,
+    LinenConvHelper,
+    LinenLayerNormHelper,
+    LinenEmbedHelper,
+    LinenSequentialHelper,
+    FrozenDictHelper,
+)
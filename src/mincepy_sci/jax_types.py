@@ -1,34 +1,246 @@
+"""Module that provides interoperability between jax and mincepy"""
+
+import contextlib
+import contextvars
 from typing import Any
 import uuid
 
 import jax
 import jax.numpy as jnp
 import mincepy
+import numpy as np
 from typing_extensions import override
 
+from . import numpy_types
+
+__all__ = (
+    "JaxArrayHelper",
+    "PyTree",
+    "PyTreeHelper",
+    "batched_device_get",
+    "host_array",
+    "save_tree",
+    "load_tree",
+    "yield_tree_hashables",
+)
+
+PACKED_TREE = "tree"
+PACKED_LEAVES = "leaves"
+PACKED_ALIGNMENT = numpy_types.PACKED_ALIGNMENT
+
 
 class JaxArrayHelper(
     mincepy.TypeHelper,
     obj_type=(jax.Array, jax._src.array.ArrayImpl),  # pylint: disable=protected-access
     type_id=uuid.UUID("d7270e15-c6fb-4621-abd8-c47b3be8b839"),
+    immutable=True,
 ):
+    """Jax arrays are stored as their dtype name, shape and raw (C ordered) host buffer, the same
+    way as numpy arrays are by `numpy_types.ArrayHelper`.  Dtypes that numpy lacks, e.g. bfloat16,
+    round trip exactly.
+
+    Each array is copied to the host on its own, use `batched_device_get()` to fetch all the
+    arrays in a pytree in one go when saving many of them.  Pass `legacy_hashing=True` to
+    reproduce the list based hashes of older versions."""
+
+    DTYPE = "dtype"
+    SHAPE = "shape"
+
+    def __init__(
+        self, file_threshold: int = numpy_types.DEFAULT_FILE_THRESHOLD, legacy_hashing=False
+    ):
+        super().__init__()
+        self._file_threshold = file_threshold
+        self._legacy_hashing = legacy_hashing
+
     @override
     def yield_hashables(self, array: jax.Array, hasher, /):
-        yield from hasher.yield_hashables(array.tolist())
+        host = host_array(array)
+        if self._legacy_hashing:
+            yield from hasher.yield_hashables(host.tolist())
+            return
+
+        yield from hasher.yield_hashables(str(array.dtype))
+        yield from hasher.yield_hashables(list(host.shape))
+        yield memoryview(numpy_types.raw_bytes(host))
 
     @override
     def eq(self, one, other, /) -> bool:
-        return (one == other).all()
+        if not (isinstance(one, jax.Array) and isinstance(other, jax.Array)):
+            return False
+
+        return numpy_types.array_eq(host_array(one), host_array(other))
+
+    @override
+    def save_instance_state(self, array: jax.Array, saver: mincepy.Saver, /):
+        host = host_array(array)
+        state = {self.DTYPE: str(array.dtype), self.SHAPE: list(host.shape)}
+        # Jax arrays are created by `new()` which has no file store, so we can't write in the
+        # background
+        state.update(numpy_types.save_buffer(host, saver, self._file_threshold, background=False))
+        return state
 
     @override
-    def save_instance_state(self, array: jax.Array, _referencer, /):
-        return {"array": array.tolist(), "dtype": str(array.dtype)}
+    def new(self, saved_state: dict[str, Any], /):
+        if "array" in saved_state:
+            # Legacy encoding using lists
+            return jnp.asarray(saved_state["array"], dtype=saved_state[self.DTYPE])
 
-    def new(self, encoded_saved_state: dict[str, Any], /):
-        return jnp.asarray(encoded_saved_state["array"], dtype=encoded_saved_state["dtype"])
+        host = np.empty(saved_state[self.SHAPE], jnp.dtype(saved_state[self.DTYPE]))
+        numpy_types.load_buffer(saved_state, host)
+        return jax.device_put(host)
 
+    @override
     def load_instance_state(self, array: jax.Array, saved_state, _referencer, /):
         pass  # Nothing to do, did it all in new
 
 
-TYPES = (JaxArrayHelper,)
+class PyTree:
+    """A jax pytree, e.g. the parameters returned by `linen.Module.init`, that is saved as a single
+    packed record rather than as a record per leaf.  The wrapped tree is available as `tree`."""
+
+    def __init__(self, tree):
+        self.tree = tree
+
+    def __repr__(self):
+        return f"PyTree({self.tree!r})"
+
+
+class PyTreeHelper(
+    mincepy.TypeHelper,
+    obj_type=PyTree,
+    type_id=uuid.UUID("d1ea646a-60f5-4eaa-b217-d7e66640a030"),
+):
+    """Saves a `PyTree` using `save_tree()`"""
+
+    def __init__(self, file_threshold: int = numpy_types.DEFAULT_FILE_THRESHOLD):
+        super().__init__()
+        self._file_threshold = file_threshold
+
+    @override
+    def yield_hashables(self, pytree: PyTree, hasher, /):
+        yield from yield_tree_hashables(pytree.tree, hasher)
+
+    @override
+    def save_instance_state(self, pytree: PyTree, saver: mincepy.Saver, /):
+        return save_tree(pytree.tree, saver, self._file_threshold)
+
+    @override
+    def new(self, encoded_saved_state: dict, /) -> PyTree:
+        return PyTree(None)
+
+    @override
+    def load_instance_state(self, pytree: PyTree, saved_state: dict, loader: mincepy.Loader, /):
+        pytree.tree = load_tree(saved_state, loader.get_archive().file_store)
+
+
+def save_tree(
+    tree,
+    saver: mincepy.Saver,
+    file_threshold: int = numpy_types.DEFAULT_FILE_THRESHOLD,
+    background=True,
+) -> dict:
+    """Save a pytree of arrays as a packed record.  The leaves are fetched from their devices in a
+    single `jax.device_get()` and written, in turn, to a single buffer.  The record holds the
+    structure of the tree along with the dtype, shape and offset of each leaf in the buffer.  The
+    tree can be made up of dicts (with string keys), lists, tuples and `None`s, and the leaves can
+    be anything convertible to a numpy array.  See `numpy_types.save_buffer()` for the meaning
+    of `file_threshold` and `background`."""
+    leaves = []
+    structure = _encode_structure(tree, leaves)
+    index, packed = numpy_types.pack_arrays(jax.device_get(leaves))
+
+    state = {PACKED_TREE: structure, PACKED_LEAVES: index}
+    state.update(
+        numpy_types.save_buffer(packed, saver, file_threshold, background=background, copy=False)
+    )
+    return state
+
+
+def load_tree(saved_state: dict, file_store=None):
+    """Load a pytree saved by `save_tree()`.  The buffer is read in one go and all the leaves are
+    then put on the default device, as jax arrays, in a single `jax.device_put()`.  See
+    `numpy_types.load_buffer()` for the meaning of `file_store`."""
+    index = saved_state[PACKED_LEAVES]
+    packed = np.empty(numpy_types.packed_size(index, jnp.dtype), np.uint8)
+    numpy_types.load_buffer(saved_state, packed, 0, file_store)
+    hosts = numpy_types.unpack_arrays(index, packed, jnp.dtype)
+    return _decode_structure(saved_state[PACKED_TREE], jax.device_put(hosts))
+
+
+def yield_tree_hashables(tree, hasher):
+    """Yield the hashables of a pytree as saved by `save_tree()`"""
+    leaves = []
+    yield from hasher.yield_hashables(_encode_structure(tree, leaves))
+    for host in jax.device_get(leaves):
+        host = np.asarray(host, order="C")
+        yield from hasher.yield_hashables(str(host.dtype))
+        yield from hasher.yield_hashables(list(host.shape))
+        yield memoryview(numpy_types.raw_bytes(host))
+
+
+@contextlib.contextmanager
+def batched_device_get(*trees):
+    """Within this context, the jax arrays in the given pytrees are hashed and saved from host
+    copies that were all fetched from their devices using a single `jax.device_get()`.  This
+    avoids synchronising with the device for each array in turn, e.g.:
+
+        with batched_device_get(params):
+            historian.save(params)
+    """
+    arrays = [leaf for leaf in jax.tree_util.tree_leaves(trees) if isinstance(leaf, jax.Array)]
+    hosts = jax.device_get(arrays)
+    # Keep a reference to each array so that its id can't be reused while in the context
+    token = _host_arrays.set(
+        {id(array): (array, np.asarray(host)) for array, host in zip(arrays, hosts)}
+    )
+    try:
+        yield
+    finally:
+        _host_arrays.reset(token)
+
+
+def host_array(array: jax.Array) -> np.ndarray:
+    """Get a C contiguous host copy of the passed jax array"""
+    fetched = _host_arrays.get().get(id(array))
+    if fetched is not None and fetched[0] is array:
+        host = fetched[1]
+    else:
+        host = np.asarray(array)
+    return np.asarray(host, order="C")
+
+
+def _encode_structure(node, leaves: list):
+    """Get a record friendly version of the tree with each leaf replaced by its index in `leaves`"""
+    if node is None:
+        return None
+    if isinstance(node, dict):
+        if not all(isinstance(key, str) for key in node):
+            raise ValueError(f"Only dicts with string keys can be packed, got: {list(node)}")
+        return {"dict": {key: _encode_structure(value, leaves) for key, value in node.items()}}
+    if type(node) in (list, tuple):
+        return {type(node).__name__: [_encode_structure(value, leaves) for value in node]}
+    if jax.tree_util.all_leaves([node]):
+        leaves.append(node)
+        return len(leaves) - 1
+
+    raise ValueError(f"Unsupported pytree node: {type(node).__name__}")
+
+
+def _decode_structure(structure, leaves: list):
+    if structure is None:
+        return None
+    if isinstance(structure, int):
+        return leaves[structure]
+    if "dict" in structure:
+        return {key: _decode_structure(value, leaves) for key, value in structure["dict"].items()}
+    if "list" in structure:
+        return [_decode_structure(value, leaves) for value in structure["list"]]
+    return tuple(_decode_structure(value, leaves) for value in structure["tuple"])
+
+
+_host_arrays: contextvars.ContextVar[dict[int, tuple[jax.Array, np.ndarray]]] = (
+    contextvars.ContextVar("host_arrays", default={})
+)
+
+TYPES = JaxArrayHelper, PyTreeHelper
@@ -1,35 +1,879 @@
+"""Module that provides interoperability between numpy and mincepy"""
+
+import concurrent.futures
+import contextlib
+import contextvars
+import functools
+import hashlib
+import itertools
+import lzma
+import math
+import mmap
+from typing import BinaryIO, Callable, NamedTuple, Optional, Sequence, Union
 import uuid
+import zlib
 
+import bson
 import mincepy
 import numpy as np
 from typing_extensions import override
 
+__all__ = (
+    "ArrayHelper",
+    "MappedArray",
+    "ChunkedArray",
+    "Codec",
+    "CODECS",
+    "array_eq",
+    "save_buffer",
+    "load_buffer",
+    "written_file",
+    "reuse_file",
+    "file_entry_id",
+    "pack_arrays",
+    "packed_size",
+    "write_packed",
+    "unpack_arrays",
+    "parallel_io",
+    "submit_io",
+)
+
+# Arrays whose data exceeds this many bytes are written to the historian file store rather than
+# being stored inline in the record
+DEFAULT_FILE_THRESHOLD = 2**20
+# The number of elements compared at a time by `array_eq`
+EQ_BLOCK_SIZE = 2**16
+# The byte boundary that each array starts on in a buffer packed by `pack_arrays`
+PACKED_ALIGNMENT = 64
+# The field holding the id of an (encoded) `mincepy.File`
+FILE_ID = "_file_id"
+# The fields of a file from `reuse_file()`
+REUSED_FILE_ID = "file_id"
+REUSED_FILE_OWNER = "owner"
+
+
+class Codec(NamedTuple):
+    """A pair of functions used to (de)compress chunks of array data"""
+
+    compress: Callable[[memoryview], bytes]
+    decompress: Callable[[bytes], bytes]
+
+
+#: The available chunk codecs.  Add an entry here to make a new codec available to `ArrayHelper`.
+CODECS: dict[str, Codec] = {
+    "none": Codec(bytes, bytes),
+    "zlib": Codec(zlib.compress, zlib.decompress),
+    "lzma": Codec(lzma.compress, lzma.decompress),
+}
+
+try:
+    import blosc
+except ImportError:
+    pass
+else:
+    CODECS["blosc"] = Codec(blosc.compress, blosc.decompress)
+
+try:
+    import zstandard
+except ImportError:
+    pass
+else:
+    CODECS["zstd"] = Codec(zstandard.compress, zstandard.decompress)
+
+
+class LazyArray:
+    """Base for read-only arrays that only fetch their data from the archive once it is accessed.
+
+    Use `.array` (or `numpy.asarray()`) to get the data as a read-only `numpy.ndarray`."""
+
+    def __init__(self, dtype: np.dtype, shape: tuple):
+        self.dtype = dtype
+        self.shape = shape
+        self._array: Optional[np.ndarray] = None
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(shape={self.shape}, dtype={self.dtype})"
+
+    def __array__(self, dtype=None, copy=None):
+        array = self.array
+        if dtype is not None:
+            return array.astype(dtype)
+        return array.copy() if copy else array
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __getitem__(self, item):
+        return self.array[item]
+
+    @property
+    def ndim(self) -> int:
+        return len(self.shape)
+
+    @property
+    def size(self) -> int:
+        return int(np.prod(self.shape))
+
+    @property
+    def array(self) -> np.ndarray:
+        """Get the data as a read-only array, fetching it if this hasn't been done yet"""
+        if self._array is None:
+            self._array = self._fetch()
+            self._array.flags.writeable = False
+
+        return self._array
+
+    def _fetch(self) -> np.ndarray:
+        raise NotImplementedError
+
+
+class MappedArray(LazyArray):
+    """A read-only array whose data lives in a historian file.  The file is only memory-mapped
+    when the data is first accessed so loading is cheap regardless of the size of the array."""
+
+    def __init__(self, dtype: np.dtype, shape: tuple, strides: tuple):
+        super().__init__(dtype, shape)
+        self.file: Optional[mincepy.File] = None
+        self._strides = strides
+
+    @property
+    def is_mapped(self) -> bool:
+        """Returns `True` if the file has been mapped into memory"""
+        return self._array is not None
+
+    @override
+    def _fetch(self) -> np.ndarray:
+        with self.file.open("rb") as file:
+            # The map holds its own handle on the file so it stays valid once this is closed
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return np.ndarray(self.shape, self.dtype, buffer=mapped, strides=self._strides)
+
+
+class ChunkedArray(LazyArray):
+    """A read-only array that is stored as a grid of compressed chunks in the archive's file store.
+    Indexing with integers and slices only fetches the chunks that the selection touches."""
+
+    def __init__(
+        self,
+        dtype: np.dtype,
+        shape: tuple,
+        chunks: tuple,
+        codec: str,
+        files: Sequence,
+        index: Optional[Sequence] = None,
+    ):
+        super().__init__(dtype, shape)
+        self.chunks = chunks
+        self.file_store = None
+        self._codec = CODECS[codec]
+        self._files = files
+        self._index = index
+
+    @override
+    def __getitem__(self, item):
+        if self._array is not None:
+            return self._array[item]
+
+        selection = _expand_index(item, self.shape)
+        if selection is None:
+            # Fancy indexing, just fetch everything
+            return self.array[item]
+
+        ranges = [
+            range(index, index + 1) if isinstance(index, int) else range(*index.indices(extent))
+            for index, extent in zip(selection, self.shape)
+        ]
+        lower = tuple(min(entry, default=0) for entry in ranges)
+        upper = tuple(max(entry, default=-1) + 1 for entry in ranges)
+        region = np.empty(tuple(max(up - low, 0) for low, up in zip(lower, upper)), self.dtype)
+        if region.size:
+            for chunk_index in itertools.product(
+                *(
+                    range(low // size, (up - 1) // size + 1)
+                    for low, up, size in zip(lower, upper, self.chunks)
+                )
+            ):
+                chunk = self._fetch_chunk(chunk_index)
+                start = [idx * size for idx, size in zip(chunk_index, self.chunks)]
+                overlap = tuple(
+                    slice(max(low, begin), min(up, begin + extent))
+                    for low, up, begin, extent in zip(lower, upper, start, chunk.shape)
+                )
+                region[tuple(_shift(entry, -low) for entry, low in zip(overlap, lower))] = chunk[
+                    tuple(_shift(entry, -begin) for entry, begin in zip(overlap, start))
+                ]
+
+        # Now select from the region we fetched
+        local = []
+        for index, entry, low in zip(selection, ranges, lower):
+            if isinstance(index, int):
+                local.append(index - low)
+            else:
+                stop = entry.stop - low
+                local.append(slice(entry.start - low, stop if stop >= 0 else None, entry.step))
+        return region[tuple(local)]
+
+    def fetch_into(self, out: np.ndarray):
+        """Fetch all the chunks writing them into the passed array"""
+        for chunk_index in np.ndindex(*_chunk_grid(self.shape, self.chunks)):
+            out[_chunk_slices(chunk_index, self.chunks)] = self._fetch_chunk(chunk_index)
+
+    @override
+    def _fetch(self) -> np.ndarray:
+        array = np.empty(self.shape, self.dtype)
+        self.fetch_into(array)
+        return array
+
+    def _fetch_chunk(self, chunk_index: tuple) -> np.ndarray:
+        position = np.ravel_multi_index(chunk_index, _chunk_grid(self.shape, self.chunks))
+        if self._index is None:
+            # Written by an older version, which stored each chunk in a file of its own
+            file, offset, length = position, 0, -1
+        else:
+            file, offset, length = self._index[position]
+        with self.file_store.open_download_stream(file_entry_id(self._files[file])) as stream:
+            stream.seek(offset)
+            data = self._codec.decompress(stream.read(length))
+        shape = tuple(
+            min(size, extent - idx * size)
+            for idx, size, extent in zip(chunk_index, self.chunks, self.shape)
+        )
+        return np.frombuffer(data, self.dtype).reshape(shape)
+
 
 class ArrayHelper(
     mincepy.TypeHelper,
-    obj_type=np.ndarray,
+    obj_type=(np.ndarray, MappedArray, ChunkedArray),
     type_id=uuid.UUID("eff7de75-2d6c-48dd-9b46-0ce16fb8b688"),
 ):
+    """Saves numpy arrays as their raw (little-endian) bytes along with the dtype, shape and
+    strides needed to reconstruct them exactly.  Small arrays are stored inline while larger ones
+    are written to the historian's file store.
+
+    Records saved by older versions (which stored `array.tolist()`) can still be loaded.
+
+    Hashes are computed directly from the array's dtype, shape and raw buffer.  Pass
+    `legacy_hashing=True` to reproduce the (much slower) list based hashes of older versions, e.g.
+    to stay consistent with snapshot hashes already in an existing archive.
+
+    If `chunks` is given, large arrays are split into chunks of (at most) this shape, each of
+    which is compressed using `codec` so that it can be read back on its own.  Missing trailing
+    dimensions span the whole axis, so `chunks=(1000,)` stores blocks of 1000 rows.  Chunks are
+    content hashed so re-saving an array only writes the chunks that have changed, and refers to
+    the files of the earlier versions for the rest (see `reuse_file()`).  The chunks written before
+    are found from the array's current record, so this only works for arrays saved as objects in
+    their own right.  Arrays stored by value, e.g. in a plain list or dict, have no record of their
+    own and have all of their chunks written every time.
+
+    With `lazy=True` arrays in the file store are loaded as `MappedArray`s, which memory-map the
+    file when the data is first accessed, or `ChunkedArray`s, which only fetch the chunks needed
+    to satisfy a given selection."""
+
+    DTYPE = "dtype"
+    SHAPE = "shape"
+    STRIDES = "strides"
+    DATA = "data"
+    FILE = "file"
+    CHUNKS = "chunks"
+    CODEC = "codec"
+    CHUNK_HASHES = "chunk_hashes"
+    CHUNK_FILES = "chunk_files"
+    CHUNK_INDEX = "chunk_index"
+
+    def __init__(
+        self,
+        file_threshold: int = DEFAULT_FILE_THRESHOLD,
+        legacy_hashing=False,
+        lazy=False,
+        chunks: Optional[Sequence[int]] = None,
+        codec: str = "zlib",
+    ):
+        super().__init__()
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec '{codec}', available codecs are {list(CODECS)}")
+        self._file_threshold = file_threshold
+        self._legacy_hashing = legacy_hashing
+        self._lazy = lazy
+        self._chunks = None if chunks is None else tuple(chunks)
+        self._codec = codec
 
     @override
-    def yield_hashables(self, array: np.ndarray, hasher, /):
-        yield from hasher.yield_hashables(array.tolist())
+    def yield_hashables(self, array: Union[np.ndarray, LazyArray], hasher, /):
+        array = np.asarray(array)
+        if self._legacy_hashing or array.dtype.hasobject:
+            yield from hasher.yield_hashables(array.tolist())
+            return
+
+        # Always hash the C-ordered buffer so that the hash doesn't depend on the memory layout
+        buffer = np.asarray(_little_endian(array), order="C")
+        yield from hasher.yield_hashables(np.lib.format.dtype_to_descr(buffer.dtype))
+        yield from hasher.yield_hashables(list(buffer.shape))
+        yield memoryview(raw_bytes(buffer))
 
     @override
     def eq(self, one, other, /) -> bool:
-        return (one == other).all()
+        if not (isinstance(one, self.TYPE) and isinstance(other, self.TYPE)):
+            return False
+
+        return array_eq(np.asarray(one), np.asarray(other))
 
     @override
-    def save_instance_state(self, array: np.ndarray, _referencer, /):
-        return array.tolist()
+    def save_instance_state(self, array: Union[np.ndarray, LazyArray], saver: mincepy.Saver, /):
+        obj = array
+        array = np.asarray(array)
+        if array.dtype.hasobject:
+            # Python objects have no meaningful raw representation, so fall back to lists
+            return array.tolist()
+
+        if self._chunks is not None and array.nbytes > self._file_threshold:
+            previous = self._get_previous_record(obj, saver)
+            return self._save_chunked(_little_endian(array), saver, previous)
+
+        buffer = _contiguous(_little_endian(array))
+        state = {
+            self.DTYPE: np.lib.format.dtype_to_descr(buffer.dtype),
+            self.SHAPE: list(buffer.shape),
+            self.STRIDES: list(buffer.strides),
+        }
+        state.update(save_buffer(buffer, saver, self._file_threshold))
+        return state
 
     @override
-    def new(self, encoded_saved_state, /):
-        return np.asarray(encoded_saved_state)
+    def new(self, encoded_saved_state: Union[dict, list], /):
+        if not isinstance(encoded_saved_state, dict):
+            # Legacy encoding using lists
+            return np.asarray(encoded_saved_state)
+
+        dtype = np.lib.format.descr_to_dtype(encoded_saved_state[self.DTYPE])
+        shape = tuple(encoded_saved_state[self.SHAPE])
+        if self.CHUNKS in encoded_saved_state:
+            if self._lazy:
+                return ChunkedArray(
+                    dtype,
+                    shape,
+                    tuple(encoded_saved_state[self.CHUNKS]),
+                    encoded_saved_state[self.CODEC],
+                    encoded_saved_state[self.CHUNK_FILES],
+                    encoded_saved_state.get(self.CHUNK_INDEX),
+                )
+            return np.empty(shape, dtype)
+
+        strides = tuple(encoded_saved_state[self.STRIDES])
+        data = encoded_saved_state.get(self.DATA)
+        if data is None and self._lazy and isinstance(encoded_saved_state[self.FILE], dict):
+            # Only historian files (rather than the bare ids of older versions) can be mapped
+            return MappedArray(dtype, shape, strides)
+        if data is None:
+            # Allocate now, the data will be read straight into it from the file
+            data = dtype.itemsize * int(np.prod(shape))
+
+        return np.ndarray(shape, dtype, buffer=bytearray(data), strides=strides)
 
     @override
-    def load_instance_state(self, array: np.ndarray, saved_state, _referencer, /):
-        pass  # Nothing to do, did it all in new
+    def load_instance_state(
+        self, array: Union[np.ndarray, LazyArray], saved_state, loader: mincepy.Loader, /
+    ):
+        if isinstance(array, MappedArray):
+            array.file = saved_state[self.FILE]
+        elif isinstance(array, ChunkedArray):
+            array.file_store = loader.get_archive().file_store
+        elif isinstance(saved_state, dict) and self.CHUNKS in saved_state:
+            chunked = ChunkedArray(
+                array.dtype,
+                array.shape,
+                tuple(saved_state[self.CHUNKS]),
+                saved_state[self.CODEC],
+                saved_state[self.CHUNK_FILES],
+                saved_state.get(self.CHUNK_INDEX),
+            )
+            chunked.file_store = loader.get_archive().file_store
+            chunked.fetch_into(array)
+        elif isinstance(saved_state, dict) and self.FILE in saved_state:
+            submit_io(load_buffer, saved_state, array, 0, loader.get_archive().file_store)
+
+    def _save_chunked(
+        self, array: np.ndarray, saver: mincepy.Saver, previous: Optional[mincepy.DataRecord]
+    ) -> dict:
+        chunks = (
+            tuple(max(size, 1) for size in self._chunks[: array.ndim])
+            + array.shape[len(self._chunks) :]
+        )
+        descr = np.lib.format.dtype_to_descr(array.dtype)
+
+        # Find out which chunks were already written when this array was last saved
+        existing = {}
+        reused = []
+        if (
+            previous is not None
+            and isinstance(previous.state, dict)
+            and previous.state.get(self.DTYPE) == descr
+            and previous.state.get(self.CODEC) == self._codec
+            and self.CHUNK_INDEX in previous.state
+        ):
+            reused = [
+                reuse_file(entry, previous.snapshot_id)
+                for entry in previous.state[self.CHUNK_FILES]
+            ]
+            existing = dict(
+                zip(previous.state[self.CHUNK_HASHES], previous.state[self.CHUNK_INDEX])
+            )
+
+        # The new chunks all go into one file, written as they are compressed
+        codec = CODECS[self._codec]
+        file_store = saver.get_archive().file_store
+        files = []
+        positions = {}  # Where the previous files are in our list
+        hashes = []
+        index = []
+        with contextlib.ExitStack() as stack:
+            stream = None
+            offset = 0
+            for chunk_index in np.ndindex(*_chunk_grid(array.shape, chunks)):
+                chunk = np.ascontiguousarray(array[_chunk_slices(chunk_index, chunks)])
+                data = memoryview(raw_bytes(chunk))
+                digest = hashlib.blake2b(data, digest_size=32).hexdigest()
+                hashes.append(digest)
+
+                entry = existing.get(digest)
+                if entry is not None and reused[entry[0]] is not None:
+                    if entry[0] not in positions:
+                        positions[entry[0]] = len(files)
+                        files.append(reused[entry[0]])
+                    index.append([positions[entry[0]], entry[1], entry[2]])
+                    continue
+
+                if stream is None:
+                    file_id = bson.ObjectId()
+                    stream = stack.enter_context(
+                        file_store.open_upload_stream_with_id(file_id, "array.chunks")
+                    )
+                    new_file = len(files)
+                    files.append(written_file(file_store, file_id, "array.chunks"))
+                compressed = codec.compress(data)
+                stream.write(compressed)
+                index.append([new_file, offset, len(compressed)])
+                offset += len(compressed)
+
+        return {
+            self.DTYPE: descr,
+            self.SHAPE: list(array.shape),
+            self.CHUNKS: list(chunks),
+            self.CODEC: self._codec,
+            self.CHUNK_HASHES: hashes,
+            self.CHUNK_FILES: files,
+            self.CHUNK_INDEX: index,
+        }
+
+    @staticmethod
+    def _get_previous_record(array, saver: mincepy.Saver) -> Optional[mincepy.DataRecord]:
+        """Get the record that the array was last saved with, if any"""
+        try:
+            return saver.historian.get_current_record(array)
+        except mincepy.NotFound:
+            return None
+
+
+def array_eq(one: np.ndarray, other: np.ndarray) -> bool:
+    """Check if two arrays are equal.  Arrays are only equal if they have the same shape and dtype
+    (no broadcasting takes place) and all their elements compare equal, where NaNs in the same
+    position are considered to be equal.
+
+    The comparison is done in blocks of `EQ_BLOCK_SIZE` elements, returning as soon as a
+    difference is found and without allocating a temporary the size of the arrays."""
+    if one.shape != other.shape or one.dtype != other.dtype:
+        return False
+
+    if one is other or (
+        one.__array_interface__["data"][0] == other.__array_interface__["data"][0]
+        and one.strides == other.strides
+    ):
+        # Same memory
+        return True
+
+    if one.size == 0:
+        return True
+
+    if one.ndim == 0 or one.dtype.hasobject:
+        # Nothing to split up, or elements that may be anything, so compare them all in one go
+        return _block_eq(one, other)
+
+    if one.dtype.kind in "biuSU" and (
+        (one.flags.c_contiguous and other.flags.c_contiguous)
+        or (one.flags.f_contiguous and other.flags.f_contiguous)
+    ):
+        # Bitwise equality is the same as element equality for these, so compare the raw memory
+        one_bytes = memoryview(raw_bytes(one))
+        other_bytes = memoryview(raw_bytes(other))
+        step = EQ_BLOCK_SIZE * one.dtype.itemsize
+        return all(
+            one_bytes[start : start + step] == other_bytes[start : start + step]
+            for start in range(0, len(one_bytes), step)
+        )
+
+    # Compare in blocks along the first axis
+    rows = max(1, EQ_BLOCK_SIZE // math.prod(one.shape[1:]))
+    return all(
+        _block_eq(one[start : start + rows], other[start : start + rows])
+        for start in range(0, len(one), rows)
+    )
+
+
+def _block_eq(one: np.ndarray, other: np.ndarray) -> bool:
+    equal = one == other
+    if one.dtype.kind in "fc":
+        equal |= np.isnan(one) & np.isnan(other)
+    return bool(np.all(equal))
+
+
+def save_buffer(
+    array: np.ndarray,
+    saver: mincepy.Saver,
+    file_threshold: int,
+    codec: Optional[str] = None,
+    background=True,
+    copy=True,
+) -> dict:
+    """Save the memory of a C or Fortran contiguous array, optionally compressing it with the given
+    codec.  The bytes are stored inline if there are no more than `file_threshold` of them,
+    otherwise they are written to a historian file.  Use `load_buffer()` to read them back.
+
+    Within `parallel_io()`, buffers that exceed the threshold before compression are compressed
+    and written to the file store by the I/O pool instead, unless `background=False`.  The state
+    still refers to these as historian files, see `written_file()`.  The bytes are copied before
+    being handed to the pool, so that the array can be modified as soon as this returns without
+    tearing the saved record.  Pass `copy=False` to skip this for arrays that nothing else can
+    modify, e.g. a buffer from `pack_arrays()`."""
+    data = raw_bytes(array)
+    state = {}
+    if codec is not None:
+        state[ArrayHelper.CODEC] = codec
+
+    pool = _io_pool.get() if background else None
+    if pool is not None and len(data) > file_threshold:
+        # We need the file now, but the writing can be done in the background
+        file_store = saver.get_archive().file_store
+        file_id = bson.ObjectId()
+        pool.submit(_write_stream, file_store, file_id, data.copy() if copy else data, codec)
+        state[ArrayHelper.FILE] = written_file(file_store, file_id, "array.bin")
+        return state
+
+    if codec is not None:
+        data = CODECS[codec].compress(memoryview(data))
+
+    if len(data) > file_threshold:
+        buffer_file = saver.historian.create_file("array.bin")
+        with buffer_file.open("wb") as file:
+            file.write(data)
+        state[ArrayHelper.FILE] = buffer_file
+    else:
+        state[ArrayHelper.DATA] = bytes(data)
+
+    return state
+
+
+def load_buffer(saved_state: dict, out: np.ndarray, offset: int = 0, file_store=None):
+    """Load a buffer saved by `save_buffer()` into the passed array, which must be contiguous and
+    have the same memory layout as the saved one.  A non-zero `offset` loads only the part of the
+    buffer starting at that byte.  If the state comes straight from a record, i.e. the file has not
+    been loaded, it is read directly from the passed `file_store`."""
+    codec = saved_state.get(ArrayHelper.CODEC)
+    out_bytes = raw_bytes(out)
+    if ArrayHelper.FILE in saved_state:
+        with _open_file(saved_state[ArrayHelper.FILE], file_store) as file:
+            if codec is None:
+                # Only read the part that we need
+                file.seek(offset)
+                read_into(file, out_bytes)
+                return
+            data = file.read()
+    else:
+        data = saved_state[ArrayHelper.DATA]
+
+    if codec is not None:
+        data = CODECS[codec].decompress(data)
+    out_bytes[:] = np.frombuffer(data, np.uint8, len(out_bytes), offset)
+
+
+def written_file(file_store, file_id, filename: str) -> mincepy.File:
+    """Get a historian file for one written (or to be written) straight to the file store with the
+    given id.  Records should refer to such files using these, rather than their ids, because
+    `Historian.merge()` only copies the files that it finds in the records as `mincepy.File`s.
+    Saving the returned file records the id without uploading anything."""
+    return mincepy.File(_WrittenFileStore(file_store, file_id), filename)
+
+
+def reuse_file(entry, snapshot_id: mincepy.SnapshotId) -> Optional[dict]:
+    """Refer to a file from the state of an earlier snapshot, as found in its record, so that a new
+    state can use it without writing it again.  A `mincepy.File` can't simply be shared between
+    records because `Historian.merge()` copies the files of each record it merges, so instead this
+    refers to the file by id along with the snapshot that owns it, which brings that snapshot (and
+    so the file) along in a merge.  Gives `None` for the bare ids of older versions, as these were
+    never copied in a merge in the first place."""
+    if isinstance(entry, dict) and REUSED_FILE_ID in entry:
+        # Already reused from an even earlier snapshot, so keep referring to that one
+        owner = mincepy.SnapshotId.from_dict(entry[REUSED_FILE_OWNER])
+        return {REUSED_FILE_ID: entry[REUSED_FILE_ID], REUSED_FILE_OWNER: _snapshot_ref(owner)}
+    if isinstance(entry, dict) and FILE_ID in entry:
+        return {REUSED_FILE_ID: entry[FILE_ID], REUSED_FILE_OWNER: _snapshot_ref(snapshot_id)}
+
+    return None
+
+
+def file_entry_id(entry):
+    """Get the file store id of a file in a state, whether it is a `mincepy.File` (loaded, or still
+    encoded), a file from `reuse_file()` or the bare id of an older version"""
+    if isinstance(entry, mincepy.File):
+        return entry.file_id
+    if isinstance(entry, dict):
+        return entry[REUSED_FILE_ID] if REUSED_FILE_ID in entry else entry[FILE_ID]
+
+    return entry
+
+
+def pack_arrays(arrays: Sequence) -> tuple[list[dict], np.ndarray]:
+    """Copy the arrays, in turn, into a single byte buffer that can be saved using `save_buffer()`.
+    Gives the dtype, shape and offset of each array in the buffer, along with the buffer itself.
+    Each array starts on a multiple of `PACKED_ALIGNMENT` bytes."""
+    arrays = [np.asarray(array, order="C") for array in arrays]
+    index = _pack_index(arrays)
+    packed = np.zeros(packed_size(index), np.uint8)
+    for entry, array in zip(index, arrays):
+        packed[entry["offset"] : entry["offset"] + array.nbytes] = raw_bytes(array)
+    return index, packed
+
+
+def write_packed(arrays: Sequence, file: BinaryIO) -> list[dict]:
+    """Write the arrays to a file laid out as they would be in a buffer packed by `pack_arrays()`,
+    and give their index.  This avoids making a copy of large arrays."""
+    arrays = [np.asarray(array, order="C") for array in arrays]
+    index = _pack_index(arrays)
+    position = 0
+    for entry, array in zip(index, arrays):
+        file.write(bytes(entry["offset"] - position))
+        _write_view(file, memoryview(raw_bytes(array)))
+        position = entry["offset"] + array.nbytes
+    return index
+
+
+def packed_size(index: Sequence[dict], as_dtype: Callable = np.dtype) -> int:
+    """Get the number of bytes in a buffer packed by `pack_arrays()` given its index"""
+    return max(
+        (
+            entry["offset"] + as_dtype(entry["dtype"]).itemsize * math.prod(entry["shape"])
+            for entry in index
+        ),
+        default=0,
+    )
+
+
+def unpack_arrays(
+    index: Sequence[dict], packed: np.ndarray, as_dtype: Callable = np.dtype
+) -> list[np.ndarray]:
+    """Get the arrays in a buffer packed by `pack_arrays()`.  These are views onto the buffer.
+    Dtypes are created from their names using `as_dtype`, e.g. `jnp.dtype` for those that numpy
+    lacks."""
+    arrays = []
+    for entry in index:
+        dtype = as_dtype(entry["dtype"])
+        size = dtype.itemsize * math.prod(entry["shape"])
+        data = packed[entry["offset"] : entry["offset"] + size]
+        arrays.append(data.view(dtype).reshape(tuple(entry["shape"])))
+    return arrays
+
+
+@contextlib.contextmanager
+def parallel_io(max_workers: Optional[int] = None):
+    """Within this context, buffers written to files by `save_buffer()` are compressed and written
+    by a pool of `max_workers` threads, as is any work passed to `submit_io()` by the helpers when
+    loading.  Numpy and torch release the GIL while copying and (de)compressing, and so do the file
+    store's socket and file operations, so saving and loading many arrays or tensors can then make
+    use of more cores and I/O bandwidth.  Leaving the context waits for all the work to finish and
+    raises the first error, if there was one.  The bytes to be written are copied when saving, so
+    saved arrays (or tensors) can be modified straight away.
+
+    Objects loaded within the context may not have their data until it has been left.  Records
+    saved within the context refer to files that may not be complete until it has been left, so
+    save within a historian transaction enclosing the context if they must never refer to
+    incomplete files."""
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers, thread_name_prefix="mincepy-io"
+    ) as pool:
+        futures = []
+        token = _io_pool.set(_IoPool(pool, futures))
+        try:
+            yield
+        finally:
+            _io_pool.reset(token)
+            concurrent.futures.wait(futures)
+
+    for future in futures:
+        future.result()
+
+
+def submit_io(func: Callable, *args):
+    """Call the function on the I/O pool if within `parallel_io()`, otherwise call it now"""
+    pool = _io_pool.get()
+    if pool is None:
+        func(*args)
+    else:
+        pool.submit(func, *args)
+
+
+class _IoPool(NamedTuple):
+    executor: concurrent.futures.Executor
+    futures: list
+
+    def submit(self, func: Callable, *args):
+        self.futures.append(self.executor.submit(func, *args))
+
+
+_io_pool: contextvars.ContextVar[Optional[_IoPool]] = contextvars.ContextVar(
+    "io_pool", default=None
+)
+
+
+def _write_stream(file_store, file_id, data: np.ndarray, codec: Optional[str]):
+    with file_store.open_upload_stream_with_id(file_id, "array.bin") as stream:
+        if codec is not None:
+            stream.write(CODECS[codec].compress(memoryview(data)))
+            return
+        _write_view(stream, memoryview(data))
+
+
+def _write_view(file, view: memoryview):
+    chunk_size = getattr(file, "chunk_size", None)
+    if chunk_size is None:
+        file.write(view)
+        return
+
+    # GridFS only takes bytes, so write one of its chunks at a time to avoid copying it all
+    for start in range(0, len(view), chunk_size):
+        file.write(view[start : start + chunk_size].tobytes())
+
+
+def raw_bytes(array: np.ndarray) -> np.ndarray:
+    """Get a flat byte view onto the memory of a C or Fortran contiguous array"""
+    return array.reshape(-1, order="A").view(np.uint8)
+
+
+def read_into(file: BinaryIO, buffer: np.ndarray):
+    """Fill the given writable buffer with bytes read from the file"""
+    view = memoryview(buffer)
+    total = 0
+    while total < len(view):
+        if hasattr(file, "readinto"):
+            num_read = file.readinto(view[total:])
+        else:
+            # E.g. GridFS streams
+            data = file.read(len(view) - total)
+            num_read = len(data)
+            view[total : total + num_read] = data
+        if not num_read:
+            raise EOFError(f"Expected {len(view)} bytes but the file only contained {total}")
+        total += num_read
+
+
+class _WrittenFileStore:
+    """Stands in for the file store of a `written_file()`, giving out the id of the file that has
+    already been written instead of uploading it again"""
+
+    def __init__(self, file_store, file_id):
+        self._file_store = file_store
+        self._file_id = file_id
+
+    def upload_from_stream(self, _filename, _source):
+        return self._file_id
+
+    def download_to_stream(self, file_id, destination):
+        self._file_store.download_to_stream(file_id, destination)
+
+
+def _open_file(file, file_store) -> BinaryIO:
+    if isinstance(file, mincepy.File) and (file_store is None or file.file_id is None):
+        return file.open("rb")
+
+    # Stream it straight from the file store rather than downloading it to a local copy first
+    return file_store.open_download_stream(file_entry_id(file))
+
+
+def _snapshot_ref(snapshot_id: mincepy.SnapshotId) -> mincepy.ObjRef:
+    """Get a reference to the given snapshot without loading it"""
+    ref = mincepy.ObjRef()
+    ref.load_instance_state(snapshot_id.to_dict(), None)
+    return ref
+
+
+def _pack_index(arrays: Sequence[np.ndarray]) -> list[dict]:
+    index = []
+    offset = 0
+    for array in arrays:
+        index.append(
+            {"dtype": _dtype_name(array.dtype), "shape": list(array.shape), "offset": offset}
+        )
+        offset += array.nbytes + (-array.nbytes % PACKED_ALIGNMENT)
+    return index
+
+
+@functools.lru_cache
+def _dtype_name(dtype: np.dtype) -> str:
+    # Getting the name is surprisingly slow, which adds up when packing many small arrays
+    return str(dtype)
+
+
+def _little_endian(array: np.ndarray) -> np.ndarray:
+    dtype = array.dtype.newbyteorder("<")
+    return array if dtype == array.dtype else array.astype(dtype)
+
+
+def _contiguous(array: np.ndarray) -> np.ndarray:
+    """Get a contiguous version of the array, preserving Fortran order if that's what it uses"""
+    if array.flags.c_contiguous or array.flags.f_contiguous:
+        return array
+
+    return np.ascontiguousarray(array)
+
+
+def _chunk_grid(shape: tuple, chunks: tuple) -> tuple:
+    return tuple(-(-extent // size) for extent, size in zip(shape, chunks))
+
+
+def _chunk_slices(chunk_index: tuple, chunks: tuple) -> tuple:
+    return tuple(slice(idx * size, (idx + 1) * size) for idx, size in zip(chunk_index, chunks))
+
+
+def _shift(entry: slice, offset: int) -> slice:
+    return slice(entry.start + offset, entry.stop + offset)
+
+
+def _expand_index(item, shape: tuple) -> Optional[tuple]:
+    """Expand a basic index (integers, slices and ellipsis) to have one entry per dimension with
+    all integers made non-negative.  Returns `None` for any other kind of index."""
+    if not isinstance(item, tuple):
+        item = (item,)
+
+    ellipses = [pos for pos, entry in enumerate(item) if entry is Ellipsis]
+    if len(ellipses) > 1:
+        return None
+    if ellipses:
+        pos = ellipses[0]
+        item = item[:pos] + (slice(None),) * (len(shape) - len(item) + 1) + item[pos + 1 :]
+    item = item + (slice(None),) * (len(shape) - len(item))
+    if len(item) != len(shape):
+        return None
+
+    expanded = []
+    for entry, extent in zip(item, shape):
+        if isinstance(entry, slice):
+            expanded.append(entry)
+        elif isinstance(entry, (int, np.integer)) and not isinstance(entry, bool):
+            index = int(entry) + extent if entry < 0 else int(entry)
+            if not 0 <= index < extent:
+                raise IndexError(f"Index {entry} is out of bounds for axis with size {extent}")
+            expanded.append(index)
+        else:
+            return None
+
+    return tuple(expanded)
 
 
 TYPES = (ArrayHelper,)
@@ -1,15 +1,61 @@
+"""Module that provides interoperability between pandas and mincepy"""
+
+import hashlib
+from typing import Optional, Sequence, Union
 import uuid
+import weakref
 
 import mincepy
+import numpy as np
 import pandas as pd
 from typing_extensions import override
 
+from . import numpy_types
+
+__all__ = "DataFrameHelper", "load_frame"
+
 
 class DataFrameHelper(
     mincepy.TypeHelper,
     obj_type=pd.DataFrame,
     type_id=uuid.UUID("0fc8dc7b-7378-4e5a-ba1f-ad8dcb0dd3c8"),
 ):
+    """Saves data frames column by column.  Each column with a numpy (or datetime with timezone, or
+    categorical) dtype is stored as a single binary buffer along with its dtype, optionally
+    compressed using one of the `numpy_types.CODECS`.  Columns larger than `file_threshold` bytes
+    are written to the historian's file store.  Columns of other types (e.g. strings or objects)
+    are stored as lists.  The index and column labels, including `MultiIndex`es, are stored
+    separately using the same scheme.
+
+    Records saved by older versions (using `DataFrame.to_dict(orient="split")`) can still be
+    loaded.
+
+    Frames are hashed column by column without building the consolidated `DataFrame.values`.  If
+    `cache_hashes` is set, the digest of each numpy backed column is cached against its memory so
+    that re-hashing a frame where only some columns were replaced only reads those columns.  This
+    assumes that columns are never modified in place, so it is off by default."""
+
+    INDEX = "index"
+    COLUMNS = "columns"
+    VALUES = "values"
+
+    def __init__(
+        self,
+        file_threshold: int = numpy_types.DEFAULT_FILE_THRESHOLD,
+        compression: Optional[str] = None,
+        cache_hashes: bool = False,
+    ):
+        super().__init__()
+        if compression is not None and compression not in numpy_types.CODECS:
+            raise ValueError(
+                f"Unknown compression '{compression}', available codecs are "
+                f"{list(numpy_types.CODECS)}"
+            )
+        self._file_threshold = file_threshold
+        self._compression = compression
+        # Column digests keyed by the id of the array owning the memory, and then by the location
+        # and layout of the column within it
+        self._hash_cache: Optional[dict[int, dict]] = {} if cache_hashes else None
 
     @override
     def eq(self, one: pd.DataFrame, other: pd.DataFrame, /) -> bool:
@@ -19,17 +65,286 @@ class DataFrameHelper(
         return one.equals(other)
 
     @override
-    def yield_hashables(self, obj, hasher, /):
-        yield from hasher.yield_hashables(obj.values.tobytes())
+    def yield_hashables(self, obj: pd.DataFrame, hasher, /):
+        yield from self._yield_index_hashables(obj.index, hasher)
+        yield from self._yield_index_hashables(obj.columns, hasher)
+        for _, column in obj.items():
+            yield self._column_digest(column, hasher)
 
     @override
     def save_instance_state(self, obj: pd.DataFrame, saver, /):
-        return obj.to_dict(orient="split")
+        return {
+            self.INDEX: self._encode_index(obj.index, saver),
+            self.COLUMNS: self._encode_index(obj.columns, saver),
+            self.VALUES: [self._encode_array(column, saver) for _, column in obj.items()],
+        }
 
     @override
     def load_instance_state(self, obj, saved_state, loader: "mincepy.Loader", /):
         """Take the given blank object and load the instance state into it"""
-        obj.__init__(**saved_state)  # pylint: disable=unnecessary-dunder-call
+        if self.VALUES not in saved_state:
+            # Legacy encoding using to_dict(orient="split")
+            obj.__init__(**saved_state)  # pylint: disable=unnecessary-dunder-call
+            return
+
+        file_store = loader.get_archive().file_store
+        everything = slice(None)
+        columns = decode_index(saved_state[self.COLUMNS], everything, file_store)
+        obj.__init__(  # pylint: disable=unnecessary-dunder-call
+            {
+                i: decode_array(values, everything, file_store)
+                for i, values in enumerate(saved_state[self.VALUES])
+            },
+            index=decode_index(saved_state[self.INDEX], everything, file_store),
+            copy=False,
+        )
+        obj.columns = columns
+
+    def _yield_index_hashables(self, index: pd.Index, hasher):
+        if isinstance(index, pd.RangeIndex):
+            yield from hasher.yield_hashables(
+                ["range", index.start, index.stop, index.step, index.name]
+            )
+        elif isinstance(index, pd.MultiIndex):
+            yield from hasher.yield_hashables(["multi", list(index.names)])
+            for level, codes in zip(index.levels, index.codes):
+                yield from self._yield_index_hashables(level, hasher)
+                yield self._column_digest(codes, hasher)
+        else:
+            yield from hasher.yield_hashables(["index", index.name])
+            yield self._column_digest(index, hasher)
+
+    def _column_digest(self, values: Union[pd.Series, pd.Index, np.ndarray], hasher) -> bytes:
+        """Get a digest of the dtype and values of a column"""
+        dtype = values.dtype
+        if isinstance(dtype, np.dtype) and not dtype.hasobject:
+            array = np.asarray(values)
+            if self._hash_cache is None:
+                return _buffer_digest(array)
+
+            root = _buffer_root(array)
+            cache = self._hash_cache.get(id(root))
+            if cache is None:
+                cache = self._hash_cache[id(root)] = {}
+                weakref.finalize(root, self._hash_cache.pop, id(root), None)
+            key = array.__array_interface__["data"][0], array.shape, array.strides, dtype.str
+            if key not in cache:
+                cache[key] = _buffer_digest(array)
+            return cache[key]
+
+        digest = hashlib.blake2b(str(dtype).encode())
+        if isinstance(dtype, pd.CategoricalDtype):
+            digest.update(self._column_digest(values.array.codes, hasher))
+            for hashable in self._yield_index_hashables(dtype.categories, hasher):
+                digest.update(hashable)
+            digest.update(bytes([dtype.ordered is True]))
+        elif isinstance(dtype, pd.DatetimeTZDtype):
+            digest.update(self._column_digest(values.array.asi8, hasher))
+        else:
+            for hashable in hasher.yield_hashables(_to_list(values)):
+                digest.update(hashable)
+
+        return digest.digest()
+
+    def _encode_index(self, index: pd.Index, saver: mincepy.Saver) -> dict:
+        if isinstance(index, pd.RangeIndex):
+            return dict(
+                kind="range",
+                start=index.start,
+                stop=index.stop,
+                step=index.step,
+                name=index.name,
+            )
+        if isinstance(index, pd.MultiIndex):
+            return dict(
+                kind="multi",
+                levels=[self._encode_index(level, saver) for level in index.levels],
+                codes=[self._encode_numpy(np.asarray(codes), saver) for codes in index.codes],
+                names=list(index.names),
+            )
+
+        return dict(kind="index", values=self._encode_array(index, saver), name=index.name)
+
+    def _encode_array(self, values: Union[pd.Series, pd.Index], saver: mincepy.Saver) -> dict:
+        dtype = values.dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            return dict(
+                kind="categorical",
+                codes=self._encode_numpy(values.array.codes, saver),
+                categories=self._encode_index(dtype.categories, saver),
+                ordered=bool(dtype.ordered),
+            )
+        if isinstance(dtype, pd.DatetimeTZDtype):
+            return dict(
+                kind="datetimetz",
+                values=self._encode_numpy(values.array.asi8, saver),
+                unit=dtype.unit,
+                tz=str(dtype.tz),
+            )
+        if isinstance(dtype, pd.SparseDtype) and not dtype.subtype.hasobject:
+            # The dtype string doesn't round trip, so store the parts that make it up
+            return dict(
+                kind="sparse",
+                length=len(values),
+                indices=self._encode_numpy(values.array.sp_index.indices, saver),
+                values=self._encode_numpy(values.array.sp_values, saver),
+                fill_value=_to_python(dtype.fill_value),
+            )
+        if isinstance(dtype, np.dtype) and not dtype.hasobject:
+            return self._encode_numpy(values.to_numpy(), saver)
+
+        return dict(
+            kind="list",
+            dtype=str(dtype),
+            values=_to_list(values),
+        )
+
+    def _encode_numpy(self, array: np.ndarray, saver: mincepy.Saver) -> dict:
+        array = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder("<"))
+        state = dict(
+            kind="numpy",
+            dtype=np.lib.format.dtype_to_descr(array.dtype),
+            length=len(array),
+        )
+        state.update(numpy_types.save_buffer(array, saver, self._file_threshold, self._compression))
+        return state
+
+
+def load_frame(
+    historian: mincepy.Historian,
+    obj_id_or_snapshot_id,
+    columns: Optional[Sequence] = None,
+    rows: Optional[slice] = None,
+) -> pd.DataFrame:
+    """Load a subset of a saved data frame without loading the whole thing.  Only the buffers of
+    the requested `columns` are read from the archive and, where a column is stored uncompressed in
+    a file, only the bytes spanning the requested `rows` are downloaded.  The returned frame is a
+    new, unsaved, object."""
+    if isinstance(obj_id_or_snapshot_id, mincepy.SnapshotId):
+        record = historian.archive.load(obj_id_or_snapshot_id)
+    else:
+        record = historian.records.get(historian.to_obj_id(obj_id_or_snapshot_id))
+    if record.type_id != DataFrameHelper.TYPE_ID:
+        raise TypeError(f"Object '{record.obj_id}' is not a data frame (type id {record.type_id})")
+
+    state = record.state
+    rows = slice(None) if rows is None else rows
+    if DataFrameHelper.VALUES not in state:
+        # Legacy record, so there is nothing to be saved by being selective
+        frame = pd.DataFrame(**state)
+        return frame.iloc[rows] if columns is None else frame[list(columns)].iloc[rows]
+
+    file_store = historian.archive.file_store
+    labels = decode_index(state[DataFrameHelper.COLUMNS], file_store=file_store)
+    if columns is None:
+        positions = np.arange(len(labels))
+    else:
+        positions = labels.get_indexer(columns)
+        if (positions == -1).any():
+            missing = [label for label, pos in zip(columns, positions) if pos == -1]
+            raise KeyError(f"Columns not found: {missing}")
+
+    values = state[DataFrameHelper.VALUES]
+    frame = pd.DataFrame(
+        {
+            i: decode_array(values[position], rows, file_store)
+            for i, position in enumerate(positions)
+        },
+        index=decode_index(state[DataFrameHelper.INDEX], rows, file_store),
+        copy=False,
+    )
+    frame.columns = labels[positions]
+    return frame
+
+
+def decode_index(saved_state: dict, rows: slice = slice(None), file_store=None) -> pd.Index:
+    """Decode an index, optionally selecting only the given rows.  The `file_store` is only needed
+    when decoding states straight from a record where files have not yet been loaded."""
+    kind = saved_state["kind"]
+    if kind == "range":
+        return pd.RangeIndex(
+            saved_state["start"], saved_state["stop"], saved_state["step"], name=saved_state["name"]
+        )[rows]
+    if kind == "multi":
+        return pd.MultiIndex(
+            levels=[decode_index(level, file_store=file_store) for level in saved_state["levels"]],
+            codes=[decode_array(codes, rows, file_store) for codes in saved_state["codes"]],
+            names=saved_state["names"],
+        )
+
+    return pd.Index(
+        decode_array(saved_state["values"], rows, file_store), name=saved_state["name"], copy=False
+    )
+
+
+def decode_array(saved_state: dict, rows: slice = slice(None), file_store=None):
+    """Decode the values of a column or index, optionally selecting only the given rows"""
+    kind = saved_state["kind"]
+    if kind == "numpy":
+        return _decode_numpy(saved_state, rows, file_store)
+    if kind == "categorical":
+        return pd.Categorical.from_codes(
+            decode_array(saved_state["codes"], rows, file_store),
+            dtype=pd.CategoricalDtype(
+                decode_index(saved_state["categories"], file_store=file_store),
+                ordered=saved_state["ordered"],
+            ),
+        )
+    if kind == "datetimetz":
+        values = decode_array(saved_state["values"], rows, file_store)
+        values = values.view(f"M8[{saved_state['unit']}]")
+        return pd.DatetimeIndex(values).tz_localize("UTC").tz_convert(saved_state["tz"]).array
+    if kind == "sparse":
+        sparse_values = decode_array(saved_state["values"], file_store=file_store)
+        fill_value = saved_state["fill_value"]
+        dense = np.full(saved_state["length"], fill_value, dtype=sparse_values.dtype)
+        dense[decode_array(saved_state["indices"], file_store=file_store)] = sparse_values
+        return pd.arrays.SparseArray(dense[rows], fill_value=fill_value)
+
+    return pd.array(saved_state["values"][rows], dtype=saved_state["dtype"])
+
+
+def _decode_numpy(saved_state: dict, rows: slice, file_store) -> np.ndarray:
+    dtype = np.lib.format.descr_to_dtype(saved_state["dtype"])
+    selected = range(*rows.indices(saved_state["length"]))
+    if not selected:
+        return np.empty(0, dtype)
+
+    # Load the contiguous span of rows covering the selection, then pick out the ones we want
+    first, last = sorted((selected[0], selected[-1]))
+    span = np.empty(last - first + 1, dtype)
+    numpy_types.load_buffer(saved_state, span, first * dtype.itemsize, file_store)
+    if selected.step < 0:
+        span = span[::-1]
+    return span[:: abs(selected.step)]
+
+
+def _to_list(values: Union[pd.Series, pd.Index]) -> list:
+    return [_to_python(value) for value in values.tolist()]
+
+
+def _to_python(value):
+    """Get a value that can be encoded.  Extension arrays can give numpy scalars from `tolist()`
+    which, unlike python ones, are not understood by the encoder"""
+    if value is pd.NA or value is pd.NaT:
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _buffer_root(array: np.ndarray) -> np.ndarray:
+    """Get the array that owns the memory of the passed array"""
+    while isinstance(array.base, np.ndarray):
+        array = array.base
+    return array
+
+
+def _buffer_digest(array: np.ndarray) -> bytes:
+    buffer = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder("<"))
+    digest = hashlib.blake2b(np.lib.format.dtype_to_descr(buffer.dtype).encode())
+    digest.update(numpy_types.raw_bytes(buffer))
+    return digest.digest()
 
 
 TYPES = (DataFrameHelper,)
@@ -1,4 +1,126 @@
+"""The entry point through which mincepy finds the types provided by this package.
+
+Importing the plugin modules means importing the libraries they support, which can take seconds,
+so a plugin module is only imported once it is needed.  Plugins for libraries that have already
+been imported are loaded straight away, as objects of their types may be saved at any time.  The
+others are stood in for by helpers that only know the ids of the types that the plugin provides,
+and which import it when one of these is met when loading.  If the libraries of a plugin are
+imported later on, the plugin is loaded then and its helpers registered, in place of the
+stand-ins, with every historian that has them, so that objects of its types are saved properly."""
+
+import gc
 import importlib
+import importlib.abc
+import importlib.util
+import logging
+import sys
+import time
+from typing import NamedTuple
+import uuid
+
+import mincepy
+from typing_extensions import override
+
+__all__ = "Plugin", "PLUGINS", "get_types", "load_plugin", "import_times"
+
+logger = logging.getLogger(__name__)
+
+
+class Plugin(NamedTuple):
+    """A plugin module along with the modules it needs and the ids of the types it provides"""
+
+    requires: tuple[str, ...]
+    type_ids: tuple[str, ...]
+
+
+#: The plugin modules, keep the type ids in step with the `TYPES` of each module
+PLUGINS: dict[str, Plugin] = {
+    "ase_types": Plugin(
+        ("ase",),
+        (
+            "4eea34e2-df87-420e-b51e-7d015bb1d3cb",
+            "ad4ca7ae-6ebc-4594-947d-ac42f5d96c1f",
+            "b83d80f3-5153-4b4c-804a-460afd771d50",
+        ),
+    ),
+    "e3nn_types": Plugin(
+        ("e3nn", "torch"),
+        (
+            "7a525788-8f67-4575-a1e4-9a68195516e2",
+            "bfc8a923-a316-4b5d-9b05-98efe6e7d7fb",
+            "a76e6544-39aa-4291-89ab-aa7c48c97484",
+            "1a9a6154-ba68-476b-bb09-2ace5fda5f45",
+            "aa68e071-92ee-48ad-8909-80f9069f629c",
+            "b87bf7b1-eb3d-4d5d-b65a-3a6780d725a3",
+            "5c808ac0-0e37-4079-976d-862d111f897b",
+            "ad05bad7-aa30-4e81-8f61-308640db1878",
+            "c1de96e4-0963-4528-8d8e-87711049cc7b",
+            "5b2e108e-744a-4537-909b-31826ca6788a",
+            "ee7b6794-d76f-4ac3-bd44-406bc8a9aa1b",
+            "fd535825-95ee-42e2-9ce6-0e7a6f43a0ba",
+        ),
+    ),
+    "flax_types": Plugin(
+        ("flax", "jax"),
+        (
+            "fb7ba12b-974e-4b52-bc02-8e0d693dd39a",
+            "2f48a5ee-03d9-4705-89ff-5bcd8d815afe",
+            "54b1aa41-2a55-4292-b609-938f4c196781",
+            "bc0eeeb4-6bf0-4106-bd82-479178129f12",
+            "05781cd8-284d-43d5-bc8e-b679b7134bfe",
+            "a2ebfb10-5719-4593-b77d-bb4c54092357",
+            "313f8cb6-d81a-441c-8d57-2f91e4efc5ab",
+        ),
+    ),
+    "jax_types": Plugin(
+        ("jax",),
+        ("d7270e15-c6fb-4621-abd8-c47b3be8b839", "d1ea646a-60f5-4eaa-b217-d7e66640a030"),
+    ),
+    "numpy_types": Plugin(("numpy",), ("eff7de75-2d6c-48dd-9b46-0ce16fb8b688",)),
+    "pandas_types": Plugin(("pandas",), ("0fc8dc7b-7378-4e5a-ba1f-ad8dcb0dd3c8",)),
+    "plams_types": Plugin(
+        ("scm",),
+        (
+            "12d88b29-858c-4a12-a5d2-42cb4d4f8ae8",
+            "70cafb92-1c0d-4d5f-bf48-5d1c5e70a0ec",
+            "fbe78755-a8d7-415d-b8b5-44ac18ef5f3a",
+            "ad6262eb-8ca1-43a4-bf61-34474cf69137",
+            "4027cba2-f402-484b-9f15-abe6f6979bc3",
+        ),
+    ),
+    "pyilt2_types": Plugin(("pyilt2",), ("5d032ec2-31e3-41ae-bd59-baede55af1cd",)),
+    "pymatgen_types": Plugin(
+        ("pymatgen",),
+        (
+            "b00aa5f5-f152-43c9-aeab-9710b0f045b1",
+            "d96f94c2-bc63-4abc-9e75-9d297b0ca9ad",
+            "690b9a99-3f1f-45e5-88eb-0448ceaff7dd",
+            "cf98144c-59e0-4235-8faa-3dd883651c6a",
+            "24ddfbb3-c3e6-432f-abd8-4542810ac002",
+        ),
+    ),
+    "pytorch_types": Plugin(
+        ("torch",),
+        (
+            "4b69b98b-3a0e-4d14-8f64-b9bd7caf4cc5",
+            "bbdb255b-e59b-4968-960d-404f16041379",
+            "eaf92947-98c2-4277-a38a-bc1e30429056",
+            "2c8c1e39-aa20-4095-81ef-b8e780403e53",
+            "76fd8263-76c0-4bc4-858e-78e99ad7e332",
+            "82037c10-7937-4e6f-a6c5-2e022e869186",
+            "834d370b-288c-4d77-9249-e645ad6bc0a5",
+            "f0d9cdfc-b2e0-4d68-b288-b11c19ab464f",
+        ),
+    ),
+    "rdkit_types": Plugin(("rdkit",), ("4810acf6-624c-419f-998c-f1a6dcf9def0",)),
+}
+
+# The time taken to import each plugin module that has been loaded
+_import_times: dict[str, float] = {}
+# The types provided by each plugin module that has been loaded, empty if it failed to import
+_loaded: dict[str, list] = {}
+# The plugins that have been stood in for, and not loaded since
+_standing_in: set[str] = set()
 
 
 def get_types():
@@ -6,24 +128,196 @@ def get_types():
     # pylint: disable=use-list-literal
     types = list()
 
-    _extend(types, "ase_types")
-    _extend(types, "e3nn_types")
-    _extend(types, "jax_types")
-    _extend(types, "numpy_types")
-    _extend(types, "pandas_types")
-    _extend(types, "plams_types")
-    _extend(types, "pyilt2_types")
-    _extend(types, "pymatgen_types")
-    _extend(types, "pytorch_types")
-    _extend(types, "rdkit_types")
+    for name, plugin in PLUGINS.items():
+        if all(module in sys.modules for module in plugin.requires):
+            types.extend(load_plugin(name))
+        elif all(importlib.util.find_spec(module) is not None for module in plugin.requires):
+            types.extend(LazyHelper(name, uuid.UUID(type_id)) for type_id in plugin.type_ids)
+            _standing_in.add(name)
+            _ImportWatcher.install()
 
     return types
 
 
-def _extend(types: list, module_name: str):
+def load_plugin(name: str) -> list:
+    """Import a plugin module, if it hasn't been already, and get the types it provides.  Gives
+    an empty list if the module can't be imported."""
     try:
-        mod = importlib.import_module(f"mincepy_sci.{module_name}")
-    except ImportError:
+        return _loaded[name]
+    except KeyError:
         pass
+
+    start = time.perf_counter()
+    try:
+        mod = importlib.import_module(f"mincepy_sci.{name}")
+    except ImportError:
+        logger.debug("Failed to import plugin '%s'", name, exc_info=True)
+        _loaded[name] = []
     else:
-        types.extend(mod.TYPES)
+        _loaded[name] = list(mod.TYPES)
+        _import_times[name] = time.perf_counter() - start
+        logger.debug("Imported plugin '%s' in %.3fs", name, _import_times[name])
+
+    return _loaded[name]
+
+
+def import_times() -> dict[str, float]:
+    """Get the time, in seconds, that it took to import each of the plugin modules loaded so far.
+    This includes importing the libraries that they support, unless these were imported before."""
+    return dict(_import_times)
+
+
+class LazyHelper(mincepy.TypeHelper, obj_type=None, type_id=None):
+    """Stands in for the helper of a type provided by a plugin module that has not been imported.
+    The module is imported, and the calls passed on to the actual helper, once the type id is met
+    when loading.  The actual helpers for any stand-ins of the plugin are then registered with the
+    loading historian in their place."""
+
+    def __init__(self, plugin: str, type_id: uuid.UUID):
+        # The registry needs a distinct type for each helper
+        self.TYPE = type(f"Unloaded[{plugin}:{type_id}]", (), {})  # pylint: disable=invalid-name
+        self.TYPE_ID = type_id  # pylint: disable=invalid-name
+        super().__init__()
+        self._plugin = plugin
+        self._helper = None
+
+    @property
+    def helper(self) -> mincepy.TypeHelper:
+        """Get the actual helper, importing the plugin module if needed"""
+        if self._helper is None:
+            for entry in load_plugin(self._plugin):
+                if entry.TYPE_ID == self.TYPE_ID:
+                    self._helper = _as_helper(entry)
+                    break
+            else:
+                raise RuntimeError(
+                    f"Failed to load the helper for type id '{self.TYPE_ID}' from the "
+                    f"'{self._plugin}' plugin"
+                )
+
+        return self._helper
+
+    @override
+    def new(self, encoded_saved_state, /):
+        return self.helper.new(encoded_saved_state)
+
+    @override
+    def ensure_up_to_date(self, saved_state, version, loader: mincepy.Loader):
+        self._replace_stand_ins(loader.get_historian())
+        return self.helper.ensure_up_to_date(saved_state, version, loader)
+
+    @override
+    def load_instance_state(self, obj, saved_state, loader: mincepy.Loader, /):
+        self.helper.load_instance_state(obj, saved_state, loader)
+
+    @override
+    def yield_hashables(self, obj, hasher, /):
+        yield from self.helper.yield_hashables(obj, hasher)
+
+    @override
+    def eq(self, one, other, /) -> bool:
+        return self.helper.eq(one, other)
+
+    @override
+    def save_instance_state(self, obj, saver: mincepy.Saver, /):
+        return self.helper.save_instance_state(obj, saver)
+
+    @override
+    def get_version(self):
+        return self.helper.get_version()
+
+    def _replace_stand_ins(self, historian: mincepy.Historian):
+        _replace_stand_ins(historian, self._plugin)
+
+
+class _ImportWatcher(importlib.abc.MetaPathFinder):
+    """Watches for the libraries of the plugins that are stood in for being imported, and then loads
+    the plugins once all the libraries that they need have been"""
+
+    _installed = None
+
+    @classmethod
+    def install(cls):
+        if cls._installed is None:
+            cls._installed = cls()
+            sys.meta_path.insert(0, cls._installed)
+
+    @override
+    def find_spec(self, fullname, path, target=None):
+        if "." in fullname or not any(fullname in PLUGINS[name].requires for name in _standing_in):
+            return None
+
+        # Find the module as it would have been, and have its loader tell us once it is imported
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+
+        loader = spec.loader
+        if loader is None or isinstance(loader, type) or not hasattr(loader, "exec_module"):
+            return spec  # Can't watch this one, e.g. a builtin module
+
+        exec_module = loader.exec_module
+
+        def exec_and_load_plugins(module):
+            exec_module(module)
+            _load_stood_in_plugins(fullname)
+
+        loader.exec_module = exec_and_load_plugins
+        return spec
+
+
+def _load_stood_in_plugins(imported: str):
+    """Load the plugins that are stood in for whose libraries have now all been imported, and
+    register their helpers with every historian that has the stand-ins.  The module just imported
+    is still marked as initialising at this point."""
+    ready = [
+        name
+        for name in _standing_in
+        if all(module == imported or _is_imported(module) for module in PLUGINS[name].requires)
+    ]
+    if not ready:
+        return
+
+    _standing_in.difference_update(ready)
+    # There is no registry of historians, so look for them
+    historians = [obj for obj in gc.get_objects() if isinstance(obj, mincepy.Historian)]
+    for name in ready:
+        if not load_plugin(name):
+            continue
+        for historian in historians:
+            _replace_stand_ins(historian, name)
+
+
+def _is_imported(module: str) -> bool:
+    """Has the module been imported, and finished executing"""
+    spec = getattr(sys.modules.get(module), "__spec__", None)
+    return spec is not None and not getattr(spec, "_initializing", False)
+
+
+def _replace_stand_ins(historian: mincepy.Historian, plugin: str):
+    """Register the actual helpers in place of any stand-ins for a plugin"""
+    for entry in load_plugin(plugin):
+        try:
+            current = historian.get_helper(entry.TYPE_ID)
+        except ValueError:
+            continue
+        if isinstance(current, LazyHelper):
+            historian.register_type(current.helper)
+
+
+def _as_helper(entry) -> mincepy.TypeHelper:
+    if isinstance(entry, mincepy.TypeHelper):
+        return entry
+    if issubclass(entry, mincepy.TypeHelper):
+        return entry()
+    return mincepy.WrapperHelper(entry)
+
+
+# The immutability of the type decides how mincepy decodes the state passed to `new()`, so ask the
+# actual helper
+LazyHelper.IMMUTABLE = property(lambda self: self.helper.IMMUTABLE)
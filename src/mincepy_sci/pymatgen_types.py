@@ -1,7 +1,10 @@
 """Module that provides interoperability between pymatgen and mincepy"""
 
 # pylint: disable=ungrouped-imports
+import collections
 import collections.abc
+import itertools
+from typing import Optional
 import uuid
 
 import mincepy
@@ -12,6 +15,8 @@ from pymatgen.electronic_structure.core import Spin
 import pymatgen.electronic_structure.dos as pymatgen_dos
 from typing_extensions import override
 
+from . import fingerprints, numpy_types
+
 
 def _clean_recursive(obj):
     if isinstance(obj, collections.abc.Mapping):
@@ -30,27 +35,165 @@ class StructureHelper(
     obj_type=pymatgen.core.Structure,
     type_id=uuid.UUID("b00aa5f5-f152-43c9-aeab-9710b0f045b1"),
 ):
+    """Saves structures as a single record in which the lattice matrix, the fractional coordinates
+    of the sites, the index of the species of each site (in a table of the distinct species) and
+    any numerical site properties (one column each) are packed into one buffer using
+    `numpy_types.pack_arrays()`.  When loading, the sites are created straight from these arrays
+    without going through the checks of `Structure.__init__`.
+
+    Records saved by older versions (using `as_dict()`) can still be loaded.
+
+    The record also holds a fingerprint of the structure, so that saved structures matching a
+    given one can be found quickly using `fingerprints.find_matching()`.
+
+    Hashes are computed directly from the buffers, pass `legacy_hashing=True` to reproduce the
+    `as_dict()` based hashes of older versions."""
+
     INJECT_CREATION_TRACKING = True
 
+    LATTICE = "lattice"
+    PBC = "pbc"
+    SPECIES = "species"
+    SPECIES_INDEX = "species_index"
+    FRAC_COORDS = "frac_coords"
+    SITE_PROPERTIES = "site_properties"
+    LABELS = "labels"
+    CHARGE = "charge"
+    PROPERTIES = "properties"
+    FINGERPRINT = fingerprints.FINGERPRINT
+
+    def __init__(
+        self, file_threshold: int = numpy_types.DEFAULT_FILE_THRESHOLD, legacy_hashing=False
+    ):
+        super().__init__()
+        self._file_threshold = file_threshold
+        self._legacy_hashing = legacy_hashing
+
     @override
     def yield_hashables(self, structure: pymatgen.core.Structure, hasher, /):
-        yield from hasher.yield_hashables(structure.as_dict())
+        if self._legacy_hashing:
+            yield from hasher.yield_hashables(structure.as_dict())
+            return
+
+        state, arrays = _encode_structure(structure)
+        buffers = []
+        for key, array in arrays.items():
+            arrays[key] = (str(array.dtype), array.shape)
+            buffers.append(numpy_types.raw_bytes(array))
+
+        # Describe all but the arbitrary values in one go, going through the hasher for each part is
+        # comparatively slow
+        values = {
+            key: state.pop(key)
+            for key in (self.SITE_PROPERTIES, self.CHARGE, self.PROPERTIES)
+            if key in state
+        }
+        state[self.SPECIES] = [_encode_species(species) for species in state[self.SPECIES]]
+        yield repr((arrays, state)).encode()
+        yield from map(memoryview, buffers)
+        if values:
+            yield from hasher.yield_hashables(values)
 
     @override
     def eq(self, one, other, /) -> bool:
         return one == other  # pymatgen.core.IStructure defines __eq__, which Structure inherits
 
     @override
-    def save_instance_state(self, structure: pymatgen.core.Structure, _referencer, /):
-        return structure.as_dict()
+    def save_instance_state(self, structure: pymatgen.core.Structure, saver: mincepy.Saver, /):
+        state, arrays = _encode_structure(structure)
+        index, packed = numpy_types.pack_arrays(list(arrays.values()))
+        for (key, *column), entry in zip(arrays, index):
+            if column:
+                state[key][column[0]]["entry"] = entry
+            else:
+                state[key] = entry
+
+        state[self.FINGERPRINT] = self._fingerprint(
+            structure.lattice,
+            state[self.SPECIES],
+            arrays[(self.SPECIES_INDEX,)],
+            arrays[(self.FRAC_COORDS,)],
+        )
+        state[self.SPECIES] = [_encode_species(species) for species in state[self.SPECIES]]
+        state.update(numpy_types.save_buffer(packed, saver, self._file_threshold, copy=False))
+        return state
 
     @override
     def new(self, encoded_saved_state, /):
-        return pymatgen.core.Structure.from_dict(encoded_saved_state)
+        if "sites" in encoded_saved_state:
+            # Legacy encoding using `as_dict()`
+            return pymatgen.core.Structure.from_dict(encoded_saved_state)
+
+        return super().new(encoded_saved_state)
 
     @override
-    def load_instance_state(self, structure: pymatgen.core.Structure, saved_state, _referencer, /):
-        pass  # Nothing to do, did it all in new
+    def load_instance_state(
+        self, structure: pymatgen.core.Structure, saved_state, loader: mincepy.Loader, /
+    ):
+        if "sites" in saved_state:
+            return  # Legacy encoding, did it all in new
+
+        columns = saved_state.get(self.SITE_PROPERTIES, {})
+        index = [
+            saved_state[self.LATTICE],
+            saved_state[self.SPECIES_INDEX],
+            saved_state[self.FRAC_COORDS],
+        ]
+        index.extend(column["entry"] for column in columns.values() if isinstance(column, dict))
+
+        packed = numpy.empty(numpy_types.packed_size(index), numpy.uint8)
+        numpy_types.load_buffer(saved_state, packed, 0, loader.get_archive().file_store)
+        arrays = iter(numpy_types.unpack_arrays(index, packed))
+
+        lattice = pymatgen.core.Lattice(next(arrays), pbc=tuple(saved_state[self.PBC]))
+        table = [_decode_species(entry) for entry in saved_state[self.SPECIES]]
+        species = [table[entry] for entry in next(arrays).tolist()]
+        frac_coords = next(arrays)
+        site_properties = {}
+        for name, column in columns.items():
+            if isinstance(column, list):
+                site_properties[name] = column
+            elif column["tolist"]:
+                site_properties[name] = next(arrays).tolist()
+            else:
+                site_properties[name] = list(next(arrays))
+
+        _fill_structure(
+            structure,
+            lattice,
+            species,
+            frac_coords,
+            site_properties,
+            saved_state.get(self.LABELS),
+            saved_state.get(self.CHARGE),
+            saved_state.get(self.PROPERTIES, {}),
+        )
+
+    def fingerprint(self, structure: pymatgen.core.Structure) -> dict:
+        """Get the fingerprint stored in the record of the structure, see `fingerprints`"""
+        table, species_index = _site_species(structure)
+        return self._fingerprint(structure.lattice, table, species_index, _frac_coords(structure))
+
+    @staticmethod
+    def _fingerprint(
+        lattice: pymatgen.core.Lattice,
+        table: list[pymatgen.core.Composition],
+        species_index: numpy.ndarray,
+        frac_coords: numpy.ndarray,
+    ) -> dict:
+        composition = collections.defaultdict(float)
+        counts = numpy.bincount(species_index, minlength=len(table)).tolist()
+        for species, count in zip(table, counts):
+            for specie, amount in species.items():
+                composition[str(getattr(specie, "element", specie))] += amount * count
+
+        return fingerprints.make_fingerprint(
+            composition,
+            lattice.volume if all(lattice.pbc) else None,
+            lattice.matrix,
+            frac_coords @ lattice.matrix,
+            lattice.pbc,
+        )
 
 
 class MoleculeHelper(
@@ -257,6 +400,172 @@ class PeriodicSite(
         pass  # Nothing to do, did it all in new
 
 
+def _encode_structure(
+    structure: pymatgen.core.Structure,
+) -> tuple[dict, dict[tuple, numpy.ndarray]]:
+    """Get the state of a structure, along with the arrays to pack.  These are keyed by their path
+    in the state, where the entry of each is to go.  The species are left as compositions."""
+    sites = structure.sites
+    table, species_index = _site_species(structure)
+    state = {
+        StructureHelper.PBC: [bool(entry) for entry in structure.lattice.pbc],
+        StructureHelper.SPECIES: table,
+    }
+    arrays = {
+        (StructureHelper.LATTICE,): structure.lattice.matrix,
+        (StructureHelper.SPECIES_INDEX,): species_index,
+        (StructureHelper.FRAC_COORDS,): _frac_coords(structure),
+    }
+
+    names = {name: None for site in sites for name in site.properties}
+    if names:
+        columns = {}
+        for name in names:
+            values = [site.properties.get(name) for site in sites]
+            array = _as_column(values)
+            if array is None:
+                columns[name] = values
+            else:
+                columns[name] = {"tolist": not isinstance(values[0], numpy.ndarray)}
+                arrays[(StructureHelper.SITE_PROPERTIES, name)] = array
+        state[StructureHelper.SITE_PROPERTIES] = columns
+
+    # pylint: disable=protected-access
+    labels = [site._label for site in sites]
+    if any(label is not None for label in labels):
+        state[StructureHelper.LABELS] = labels
+    if structure._charge is not None:
+        state[StructureHelper.CHARGE] = structure._charge
+    if structure.properties:
+        state[StructureHelper.PROPERTIES] = structure.properties
+
+    return state, arrays
+
+
+def _site_species(
+    structure: pymatgen.core.Structure,
+) -> tuple[list[pymatgen.core.Composition], numpy.ndarray]:
+    """Get the table of the distinct species of the sites, and the index in it of each site's"""
+    table = []
+    by_id, by_items = {}, {}
+    species_index = numpy.empty(len(structure), numpy.int32)
+    for idx, site in enumerate(structure.sites):
+        species = site.species
+        entry = by_id.get(id(species))
+        if entry is None:
+            # Compositions compare within a tolerance, so use their exact contents
+            entry = by_items.setdefault(tuple(species.items()), len(table))
+            if entry == len(table):
+                table.append(species)
+            by_id[id(species)] = entry
+        species_index[idx] = entry
+    return table, species_index
+
+
+def _frac_coords(structure: pymatgen.core.Structure) -> numpy.ndarray:
+    return numpy.array([site.frac_coords for site in structure.sites], dtype=float).reshape(-1, 3)
+
+
+def _as_column(values: list) -> Optional[numpy.ndarray]:
+    """Get the site property values as an array if they are all numbers, all lists of numbers or
+    all arrays of the same type, such that they can be recovered exactly"""
+    first = values[0]
+    kind = type(first)
+    if kind in (bool, int, float):
+        if not all(
+            type(value) is kind for value in values
+        ):  # pylint: disable=unidiomatic-typecheck
+            return None
+    elif kind is list and first and type(first[0]) in (bool, int, float):
+        kind = type(first[0])
+        if not all(
+            type(value) is list  # pylint: disable=unidiomatic-typecheck
+            and len(value) == len(first)
+            and all(type(entry) is kind for entry in value)  # pylint: disable=unidiomatic-typecheck
+            for value in values
+        ):
+            return None
+    elif kind is numpy.ndarray and first.dtype.kind in "biuf":
+        if not all(
+            isinstance(value, numpy.ndarray)
+            and value.dtype == first.dtype
+            and value.shape == first.shape
+            for value in values
+        ):
+            return None
+    else:
+        return None
+
+    try:
+        return numpy.array(values)
+    except OverflowError:
+        return None  # Python ints that don't fit in 64 bits
+
+
+def _encode_species(species: pymatgen.core.Composition) -> list[dict]:
+    """Encode the species of a site in the same way as `PeriodicSite.as_dict()`"""
+    encoded = []
+    for specie, occupancy in species.items():
+        entry = specie.as_dict()
+        del entry["@module"]
+        del entry["@class"]
+        entry["occu"] = occupancy
+        encoded.append(entry)
+    return encoded
+
+
+def _decode_species(encoded: list[dict]) -> pymatgen.core.Composition:
+    """Decode the species of a site in the same way as `PeriodicSite.from_dict()`"""
+    species = {}
+    for entry in encoded:
+        if "oxidation_state" in entry and pymatgen.core.Element.is_valid_symbol(entry["element"]):
+            specie = pymatgen.core.Species.from_dict(entry)
+        elif "oxidation_state" in entry:
+            specie = pymatgen.core.DummySpecies.from_dict(entry)
+        else:
+            specie = pymatgen.core.Element(entry["element"])
+        species[specie] = entry["occu"]
+    return pymatgen.core.Composition(species)
+
+
+def _fill_structure(
+    structure: pymatgen.core.Structure,
+    lattice: pymatgen.core.Lattice,
+    species: list[pymatgen.core.Composition],
+    frac_coords: numpy.ndarray,
+    site_properties: dict[str, list],
+    labels: Optional[list],
+    charge: Optional[float],
+    properties: dict,
+):
+    """Fill in the attributes that `Structure.__init__` would, creating the sites directly rather
+    than through `PeriodicSite.__init__` (and its `__setattr__`), which takes the bulk of the time
+    for large structures.  This needs updating if pymatgen changes."""
+    names = list(site_properties)
+    rows = zip(*site_properties.values()) if names else itertools.repeat(())
+    if labels is None:
+        labels = itertools.repeat(None)
+
+    sites = []
+    for specie, coords, row, label in zip(species, frac_coords, rows, labels):
+        site = object.__new__(pymatgen.core.PeriodicSite)
+        site.__dict__.update(
+            _lattice=lattice,
+            _frac_coords=coords,
+            _species=specie,
+            _coords=None,
+            properties=dict(zip(names, row)),
+            _label=label,
+        )
+        sites.append(site)
+
+    # pylint: disable=protected-access
+    structure._lattice = lattice
+    structure._sites = sites
+    structure._charge = charge
+    structure._properties = dict(properties)
+
+
 TYPES = (
     StructureHelper,
     MoleculeHelper,
@@ -1,79 +1,648 @@
 """Module that provides interoperability between pymatgen and mincepy"""
 
-import io
+import concurrent.futures
+import copy
+import hashlib
+import itertools
+import threading
+from typing import Callable, Optional, Sequence, Union
 import uuid
+import weakref
 
 import bidict
+import bson
 import mincepy
+import numpy as np
 import torch
 from typing_extensions import override
 
+from . import numpy_types
+
 # pylint: disable=no-member
 torch_dtypes = bidict.bidict(
     {
-        "bool": torch.bool,
-        "uint8": torch.uint8,
-        "int8": torch.int8,
-        "int16": torch.int16,
-        "int32": torch.int32,
-        "int64": torch.int64,
-        "float16": torch.float16,
-        "float32": torch.float32,
-        "float64": torch.float64,
-        "complex64": torch.complex64,
-        "complex128": torch.complex128,
+        name: getattr(torch, name)
+        for name in (
+            "bool",
+            "uint8",
+            "int8",
+            "int16",
+            "int32",
+            "int64",
+            "float16",
+            "float32",
+            "float64",
+            "complex64",
+            "complex128",
+            "bfloat16",
+            "complex32",
+            "uint16",
+            "uint32",
+            "uint64",
+            "float8_e4m3fn",
+            "float8_e4m3fnuz",
+            "float8_e5m2",
+            "float8_e5m2fnuz",
+            "float8_e8m0fnu",
+            "float4_e2m1fn_x2",
+        )
+        # Some of these are only available in more recent versions of torch
+        if hasattr(torch, name)
     }
 )
 
+DeviceMap = Union[
+    str, torch.device, dict[str, Union[str, torch.device]], Callable[[torch.device], torch.device]
+]
+
 
 class TensorHelper(
     mincepy.BaseHelper,
     obj_type=torch.Tensor,
     type_id=uuid.UUID("4b69b98b-3a0e-4d14-8f64-b9bd7caf4cc5"),
 ):
+    """Saves tensors as their raw bytes in memory order along with the dtype, size and strides
+    needed to interpret them.  Tensors whose data is larger than `file_threshold` bytes are written
+    to a historian file, and are read straight back into the memory of the new tensor when loading.
+    Views are saved without the rest of the memory that they are a view onto and broadcast (zero
+    stride) dimensions are only saved once.  Sparse tensors are saved as their index and value
+    tensors.  If `cache_hashes` is set, tensors are hashed using `tensor_digest()` with caching
+    enabled.
+
+    Tensors are loaded onto the CPU unless `map_location` is given, which, like for `torch.load`,
+    can be a device, a dictionary mapping the device the tensor was saved from to the one to load
+    it on, or a callable that takes the saved device and returns the one to use.  Similarly,
+    `map_dtype` can be used to convert tensors of given dtypes to others when loading.  Either
+    way, the loaded tensor is allocated once, directly on its target device and with its target
+    dtype.
+
+    Records saved by older versions (using `torch.save`) can still be loaded."""
 
     DTYPE = "dtype"
     SIZE = "size"
+    STRIDES = "strides"
     FILE = "file"
+    DEVICE = "device"
+    LAYOUT = "layout"
+    INDICES = "indices"
+    VALUES = "values"
+    COALESCED = "coalesced"
+
+    def __init__(
+        self,
+        file_threshold: int = numpy_types.DEFAULT_FILE_THRESHOLD,
+        cache_hashes: bool = False,
+        map_location: Optional[DeviceMap] = None,
+        map_dtype: Optional[dict[torch.dtype, torch.dtype]] = None,
+    ):
+        super().__init__()
+        self._file_threshold = file_threshold
+        self._cache_hashes = cache_hashes
+        self._map_location = map_location
+        self._map_dtype = map_dtype or {}
 
     @override
     def yield_hashables(self, tensor: torch.Tensor, hasher, /):
-        with io.BytesIO() as buffer:
-            torch.save(tensor, buffer)
-            yield buffer.read()
+        if tensor.layout != torch.strided:
+            yield from hasher.yield_hashables(str(tensor.layout))
+            yield from hasher.yield_hashables(list(tensor.size()))
+            for component in _sparse_components(tensor.detach().cpu()).values():
+                yield from self.yield_hashables(component, hasher)
+            return
+
+        if self._cache_hashes:
+            yield from hasher.yield_hashables(tensor_digest(tensor, cache=True))
+            return
+
+        # Always hash the C-ordered buffer so that the hash doesn't depend on the memory layout
+        tensor = _resolved(tensor.detach().cpu()).contiguous()
+        yield from hasher.yield_hashables(torch_dtypes.inverse[tensor.dtype])
+        yield from hasher.yield_hashables(list(tensor.size()))
+        yield memoryview(raw_bytes(tensor))
+
+    @override
+    def eq(self, one, other, /) -> bool:
+        if not (isinstance(one, torch.Tensor) and isinstance(other, torch.Tensor)):
+            return False
+        if (one.layout, one.dtype, one.size()) != (other.layout, other.dtype, other.size()):
+            return False
+
+        one, other = one.detach().cpu(), other.detach().cpu()
+        if one.layout != torch.strided:
+            return all(
+                self.eq(one_component, other_component)
+                for one_component, other_component in zip(
+                    _sparse_components(one).values(), _sparse_components(other).values()
+                )
+            )
+
+        if one.is_floating_point() or one.is_complex():
+            # NaNs in the same position are considered to be equal, as for numpy arrays
+            return torch.allclose(one, other, rtol=0.0, atol=0.0, equal_nan=True)
+        return torch.equal(one, other)
 
     @override
     def save_instance_state(self, tensor: torch.Tensor, saver: mincepy.Saver, /):
-        tensor_file = saver.historian.create_file("tensor.pt")
-        with tensor_file.open("wb") as file:
-            torch.save(tensor, file)
-        return {
-            self.DTYPE: torch_dtypes.inverse[tensor.dtype],
-            self.SIZE: tensor.size(),
-            self.FILE: tensor_file,
-        }
+        device = str(tensor.device)
+        tensor = tensor.detach().cpu()
+        if tensor.layout != torch.strided:
+            state = {
+                self.LAYOUT: str(tensor.layout),
+                self.DTYPE: torch_dtypes.inverse[tensor.dtype],
+                self.SIZE: tensor.size(),
+                self.DEVICE: device,
+            }
+            if tensor.layout == torch.sparse_coo:
+                state[self.COALESCED] = tensor.is_coalesced()
+            for name, component in _sparse_components(tensor).items():
+                state[name] = self._save_strided(component, saver)
+            return state
+
+        state = self._save_strided(tensor, saver)
+        state[self.DEVICE] = device
+        return state
 
     @override
     def new(self, saved_state: dict, /) -> torch.Tensor:
-        return torch.empty(saved_state[self.SIZE], dtype=torch_dtypes[saved_state[self.DTYPE]])
+        device = self._get_device(saved_state)
+        if self.LAYOUT in saved_state:
+            components = {
+                name: self._new_strided(saved_state[name], device)
+                for name in _SPARSE_COMPONENTS[saved_state[self.LAYOUT]]
+            }
+            layout = getattr(torch, saved_state[self.LAYOUT].split(".")[-1])
+            if layout == torch.sparse_coo:
+                return torch.sparse_coo_tensor(
+                    components[self.INDICES],
+                    components[self.VALUES],
+                    saved_state[self.SIZE],
+                    is_coalesced=saved_state[self.COALESCED],
+                )
+
+            return torch.sparse_compressed_tensor(
+                *components.values(), saved_state[self.SIZE], layout=layout
+            )
+
+        if self.STRIDES not in saved_state:
+            # Legacy torch.save format
+            return torch.empty(saved_state[self.SIZE], dtype=torch_dtypes[saved_state[self.DTYPE]])
+
+        return self._new_strided(saved_state, device)
 
     @override
-    def load_instance_state(self, tensor: torch.Tensor, saved_state: dict, _referencer, /):
-        with saved_state[self.FILE].open("rb") as file:
-            tensor[:] = torch.load(file)[:]  # nosec
+    def load_instance_state(self, tensor: torch.Tensor, saved_state: dict, loader, /):
+        if self.LAYOUT not in saved_state and self.STRIDES not in saved_state:
+            # Legacy torch.save format
+            with saved_state[self.FILE].open("rb") as file:
+                tensor[:] = torch.load(file)[:]  # nosec
+            return
+
+        file_store = loader.get_archive().file_store
+        if self.LAYOUT in saved_state:
+            for name, component in _sparse_components(tensor).items():
+                numpy_types.submit_io(_load_strided, component, saved_state[name], file_store)
+        else:
+            numpy_types.submit_io(_load_strided, tensor, saved_state, file_store)
+
+    def _save_strided(self, tensor: torch.Tensor, saver: mincepy.Saver) -> dict:
+        tensor = _compact(tensor)
+        state = {
+            self.DTYPE: torch_dtypes.inverse[tensor.dtype],
+            self.SIZE: tensor.size(),
+            self.STRIDES: list(tensor.stride()),
+        }
+        state.update(numpy_types.save_buffer(raw_bytes(tensor), saver, self._file_threshold))
+        return state
+
+    def _new_strided(self, saved_state: dict, device: torch.device) -> torch.Tensor:
+        dtype = torch_dtypes[saved_state[self.DTYPE]]
+        return torch.empty_strided(
+            saved_state[self.SIZE],
+            saved_state[self.STRIDES],
+            dtype=self._map_dtype.get(dtype, dtype),
+            device=device,
+        )
+
+    def _get_device(self, saved_state: dict) -> torch.device:
+        saved = torch.device(saved_state.get(self.DEVICE, "cpu"))
+        if self._map_location is None:
+            return torch.device("cpu")
+        if callable(self._map_location):
+            return torch.device(self._map_location(saved))
+        if isinstance(self._map_location, dict):
+            return torch.device(self._map_location.get(str(saved), saved))
+        return torch.device(self._map_location)
+
+
+# The components that make up each of the sparse layouts, in the order the constructor takes them
+_SPARSE_COMPONENTS = {
+    "torch.sparse_coo": ("indices", "values"),
+    "torch.sparse_csr": ("crow_indices", "col_indices", "values"),
+    "torch.sparse_csc": ("ccol_indices", "row_indices", "values"),
+    "torch.sparse_bsr": ("crow_indices", "col_indices", "values"),
+    "torch.sparse_bsc": ("ccol_indices", "row_indices", "values"),
+}
+
+
+def _sparse_components(tensor: torch.Tensor) -> dict[str, torch.Tensor]:
+    """Get the tensors that make up a sparse tensor.  These share memory with the sparse tensor."""
+    names = _SPARSE_COMPONENTS[str(tensor.layout)]
+    if tensor.layout == torch.sparse_coo:
+        # Use the private versions, the public ones require the tensor to be coalesced
+        return dict(zip(names, (tensor._indices(), tensor._values())))  # pylint: disable=W0212
+
+    return {name: getattr(tensor, name)() for name in names}
+
+
+def _load_strided(tensor: torch.Tensor, saved_state: dict, file_store):
+    """Load the buffer saved for a strided tensor into the passed one.  This is read directly into
+    the tensor's memory if it is on the CPU and has the saved dtype, otherwise it goes via an
+    intermediate CPU tensor."""
+    dtype = torch_dtypes[saved_state[TensorHelper.DTYPE]]
+    if tensor.device.type == "cpu" and tensor.dtype == dtype:
+        numpy_types.load_buffer(saved_state, raw_bytes(tensor), 0, file_store)
+        return
+
+    staging = torch.empty_strided(
+        saved_state[TensorHelper.SIZE],
+        saved_state[TensorHelper.STRIDES],
+        dtype=dtype,
+        pin_memory=tensor.device.type == "cuda",
+    )
+    numpy_types.load_buffer(saved_state, raw_bytes(staging), 0, file_store)
+    tensor.copy_(staging, non_blocking=tensor.device.type == "cuda")
+
+
+PACKED_TREE = "tree"
+PACKED_TENSORS = "tensors"
+PACKED_FILES = "files"
+PACKED_ALIGNMENT = 64
+
+# Tensor digests keyed by tensor id, along with the version counter, memory location and layout
+# they were computed for
+_digests: dict[int, tuple] = {}
+
+
+def save_packed(module: torch.nn.Module, saver: mincepy.Saver, cache_hashes: bool = False) -> dict:
+    """Save a module tree as a packed checkpoint.  All the parameters and buffers of the tree are
+    written, in turn, to a single file while the structure of the tree (the type and remaining
+    attributes of each submodule) is kept in the record along with an index of where each tensor
+    can be found in the file.  Parameters or buffers shared between submodules are only written
+    once.  The submodule types must be registered with the historian.
+
+    If the module was saved before, tensors whose contents haven't changed since then are not
+    written again but refer to the previous file (see `numpy_types.reuse_file()`), so only the
+    changed tensors are written to a new one.  See `tensor_digest()` for the meaning of
+    `cache_hashes`."""
+    tensors = []
+    tensor_ids = {}
+
+    def add_tensor(tensor: Optional[torch.Tensor]) -> Optional[int]:
+        if tensor is None:
+            return None
+        if id(tensor) not in tensor_ids:
+            tensor_ids[id(tensor)] = len(tensors)
+            tensors.append(tensor)
+        return tensor_ids[id(tensor)]
+
+    def pack(submodule: torch.nn.Module, type_id) -> dict:
+        attributes = dict(submodule.__dict__)
+        parameters = attributes.pop("_parameters")
+        buffers = attributes.pop("_buffers")
+        modules = attributes.pop("_modules")
+        return {
+            "type_id": type_id,
+            "attributes": attributes,
+            "parameters": {name: add_tensor(value) for name, value in parameters.items()},
+            "buffers": {name: add_tensor(value) for name, value in buffers.items()},
+            "modules": {
+                name: (
+                    None
+                    if child is None
+                    else pack(child, saver.historian.get_obj_type_id(type(child)))
+                )
+                for name, child in modules.items()
+            },
+        }
+
+    tree = pack(module, None)
+
+    # Find out where the tensors were written when the module was last saved
+    existing = {}
+    reused = []
+    try:
+        previous = saver.historian.get_current_record(module)
+    except mincepy.NotFound:
+        pass
+    else:
+        if isinstance(previous.state, dict) and PACKED_FILES in previous.state:
+            reused = [
+                numpy_types.reuse_file(entry, previous.snapshot_id)
+                for entry in previous.state[PACKED_FILES]
+            ]
+            for entry in previous.state[PACKED_TENSORS]:
+                if reused[entry["file"]] is not None:
+                    existing[entry["digest"]] = entry["file"], entry["offset"]
+
+    files = []
+    positions = {}  # Where the previous files are in our list
+    index = []
+    new_tensors = []
+    offset = 0
+    for tensor in tensors:
+        data = _compact(tensor.detach().cpu())
+        digest = tensor_digest(tensor, cache_hashes)
+        previous_file, tensor_offset = existing.get(digest, (None, offset))
+        if previous_file is None:
+            new_tensors.append(raw_bytes(data))
+            nbytes = len(new_tensors[-1])
+            offset += nbytes + (-nbytes % PACKED_ALIGNMENT)
+        elif previous_file not in positions:
+            positions[previous_file] = len(files)
+            files.append(reused[previous_file])
+
+        index.append(
+            {
+                "dtype": torch_dtypes.inverse[data.dtype],
+                "size": list(data.size()),
+                "strides": list(data.stride()),
+                "file": None if previous_file is None else positions[previous_file],
+                "offset": tensor_offset,
+                "digest": digest,
+                "parameter": isinstance(tensor, torch.nn.Parameter),
+                "requires_grad": tensor.requires_grad,
+            }
+        )
+
+    if new_tensors:
+        file_store = saver.get_archive().file_store
+        file_id = bson.ObjectId()
+        with file_store.open_upload_stream_with_id(file_id, "module.bin") as stream:
+            for data in new_tensors:
+                nbytes = len(data)
+                # GridFS only takes bytes, so write one of its chunks at a time to avoid copying
+                # the whole tensor
+                view = memoryview(data)
+                for start in range(0, nbytes, stream.chunk_size):
+                    stream.write(view[start : start + stream.chunk_size].tobytes())
+                stream.write(bytes(-nbytes % PACKED_ALIGNMENT))
+        for entry in index:
+            if entry["file"] is None:
+                entry["file"] = len(files)
+        files.append(numpy_types.written_file(file_store, file_id, "module.bin"))
+
+    return {PACKED_TREE: tree, PACKED_TENSORS: index, PACKED_FILES: files}
+
+
+def load_packed(module: torch.nn.Module, saved_state: dict, loader: mincepy.Loader):
+    """Load a checkpoint saved by `save_packed()` into the passed blank module.  Each file is read
+    in one go into a single buffer that backs all the loaded parameters and buffers within it.
+    Distinct tensors that refer to the same bytes, because they had the same contents when reused
+    from an earlier save, are given copies so that they don't alias each other."""
+    file_store = loader.get_archive().file_store
+    storages = []
+    for file in saved_state[PACKED_FILES]:
+        with file_store.open_download_stream(numpy_types.file_entry_id(file)) as stream:
+            storages.append(torch.empty(stream.length, dtype=torch.uint8))
+            numpy_types.read_into(stream, storages[-1].numpy())
+
+    tensors = []
+    locations = set()
+    for entry in saved_state[PACKED_TENSORS]:
+        dtype = torch_dtypes[entry["dtype"]]
+        nbytes = _span(entry["size"], entry["strides"]) * dtype.itemsize
+        tensor = storages[entry["file"]][entry["offset"] : entry["offset"] + nbytes].view(dtype)
+        tensor = tensor.as_strided(entry["size"], entry["strides"])
+        if (entry["file"], entry["offset"]) in locations:
+            tensor = tensor.clone()
+        locations.add((entry["file"], entry["offset"]))
+        if entry["parameter"]:
+            tensor = torch.nn.Parameter(tensor, requires_grad=entry["requires_grad"])
+        tensors.append(tensor)
+
+    def unpack(target: torch.nn.Module, tree: dict):
+        target.__dict__.update(tree["attributes"])
+        target.__dict__["_parameters"] = {
+            name: None if idx is None else tensors[idx] for name, idx in tree["parameters"].items()
+        }
+        target.__dict__["_buffers"] = {
+            name: None if idx is None else tensors[idx] for name, idx in tree["buffers"].items()
+        }
+        modules = {}
+        for name, child_tree in tree["modules"].items():
+            if child_tree is not None:
+                child_type = loader.historian.get_obj_type(child_tree["type_id"])
+                modules[name] = child_type.__new__(child_type)
+                unpack(modules[name], child_tree)
+            else:
+                modules[name] = None
+        target.__dict__["_modules"] = modules
+
+    unpack(module, saved_state[PACKED_TREE])
+
+
+class CheckpointWriter:
+    """Saves modules to a historian on a background thread so that, e.g., training can carry on
+    while a checkpoint is being written.  `save()` takes a snapshot of the module, which is cheap
+    compared to serialising and writing it, and returns a future that gives the snapshot id of the
+    saved checkpoint (or raises the error that saving it did).  At most `max_pending` snapshots are
+    held in memory at a time, with `save()` blocking until a slot becomes free.
+
+    The checkpoints of a module are saved as versions of one object, so a packed module helper
+    (see `save_packed()`) only writes the tensors that changed since the last checkpoint.  To do
+    this the last snapshot of each module is kept, as the live object of the checkpoint record.
+
+    Saves are written one at a time in the order they were requested.  The historian should not be
+    used by other threads while saves are in flight, use `wait()` to make sure that there are
+    none."""
+
+    def __init__(self, historian: mincepy.Historian, max_pending: int = 1):
+        self._historian = historian
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="checkpoint-writer"
+        )
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending: set[concurrent.futures.Future] = set()
+        # The last checkpoint of each module, only used from the background thread
+        self._checkpoints = weakref.WeakKeyDictionary()
+
+    def __enter__(self) -> "CheckpointWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def save(self, module: torch.nn.Module, meta: dict = None) -> concurrent.futures.Future:
+        """Take a snapshot of the module and save it in the background"""
+        self._slots.acquire()  # pylint: disable=consider-using-with
+        try:
+            module_snapshot = snapshot(module)
+            future = self._executor.submit(self._save, module, module_snapshot, meta)
+        except BaseException:
+            self._slots.release()
+            raise
+
+        self._pending.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def wait(self):
+        """Wait for all the pending saves to finish"""
+        concurrent.futures.wait(list(self._pending))
+
+    def close(self):
+        """Wait for the pending saves and shut down the background thread"""
+        self._executor.shutdown(wait=True)
+
+    def _save(
+        self, module: torch.nn.Module, module_snapshot: torch.nn.Module, meta: Optional[dict]
+    ):
+        """Save the snapshot as the next version of the module's last checkpoint, if there is one"""
+        historian = self._historian
+        previous = self._checkpoints.get(module)
+        if previous is not None and historian.is_saved(previous):
+            historian.replace(previous, module_snapshot)
+            try:
+                historian.save_one(module_snapshot, meta)
+            except BaseException:
+                historian.replace(module_snapshot, previous)
+                raise
+        else:
+            historian.save_one(module_snapshot, meta)
+
+        self._checkpoints[module] = module_snapshot
+        return historian.get_snapshot_id(module_snapshot)
+
+    def _done(self, future: concurrent.futures.Future):
+        self._pending.discard(future)
+        self._slots.release()
+
+
+def snapshot(module: torch.nn.Module) -> torch.nn.Module:
+    """Create a copy of the module with all of its parameters and buffers copied to the CPU.
+    Tensors on CUDA devices are copied asynchronously to pinned memory, waiting only once for all
+    the copies to finish."""
+    memo = {}
+    synchronise = False
+    for tensor in itertools.chain(module.parameters(), module.buffers()):
+        if id(tensor) in memo:
+            continue
+
+        data = tensor.detach()
+        if data.device.type == "cpu":
+            copied = data.clone()
+        else:
+            pinned = data.device.type == "cuda"
+            copied = torch.empty_like(data, device="cpu", pin_memory=pinned)
+            copied.copy_(data, non_blocking=pinned)
+            synchronise |= pinned
+        if isinstance(tensor, torch.nn.Parameter):
+            copied = torch.nn.Parameter(copied, requires_grad=tensor.requires_grad)
+        memo[id(tensor)] = copied
+
+    if synchronise:
+        torch.cuda.synchronize()
+
+    # Copy everything else, picking up the tensor copies from the memo
+    return copy.deepcopy(module, memo)
+
+
+def tensor_digest(tensor: torch.Tensor, cache: bool = False) -> str:
+    """Get a digest of the dtype, layout and contents of a tensor.  If `cache` is set, the digest
+    is stored and reused for as long as the tensor's version counter, memory and layout stay the
+    same.  Torch bumps the version counter on every in-place operation, but not on writes that
+    bypass it, e.g. through `Tensor.data` or a numpy view, so only use the cache if there are
+    none of these."""
+    token = (tensor._version, tensor.data_ptr(), tensor.dtype, tensor.size(), tensor.stride())
+    if cache:
+        cached = _digests.get(id(tensor))
+        if cached is not None and cached[0] == token:
+            return cached[1]
+
+    data = _compact(tensor.detach().cpu())
+    hasher = hashlib.blake2b(digest_size=32)
+    hasher.update(repr((data.dtype, list(data.size()), data.stride())).encode())
+    hasher.update(raw_bytes(data))
+    digest = hasher.hexdigest()
+    if cache:
+        if id(tensor) not in _digests:
+            weakref.finalize(tensor, _digests.pop, id(tensor), None)
+        _digests[id(tensor)] = token, digest
+    return digest
+
+
+def raw_bytes(tensor: torch.Tensor) -> np.ndarray:
+    """Get a flat byte view onto the memory of a compact CPU tensor (see `_compact()`), in memory
+    order.  Broadcast dimensions are only included once."""
+    return _memory_ordered(_unbroadcast(_resolved(tensor))).reshape(-1).view(torch.uint8).numpy()
+
+
+def _compact(tensor: torch.Tensor) -> torch.Tensor:
+    """Get the tensor if its memory is dense apart from broadcast (zero stride) dimensions,
+    otherwise a copy that is, keeping the broadcast dimensions.  Conjugate and negative views are
+    always copied, as their memory doesn't hold their values."""
+    tensor = _resolved(tensor)
+    unbroadcast = _unbroadcast(tensor)
+    if _memory_ordered(unbroadcast) is not None:
+        return tensor
+    return unbroadcast.contiguous().expand(tensor.size())
+
+
+def _resolved(tensor: torch.Tensor) -> torch.Tensor:
+    """Get the tensor, or a copy with the values in memory if it is a lazy conjugate or negative
+    view (e.g. from `Tensor.conj()`) which can't be viewed as bytes"""
+    return tensor.resolve_conj().resolve_neg()
+
+
+def _unbroadcast(tensor: torch.Tensor) -> torch.Tensor:
+    """Narrow the broadcast (zero stride) dimensions of the tensor down to size one"""
+    for dim, (size, stride) in enumerate(zip(tensor.size(), tensor.stride())):
+        if stride == 0 and size > 1:
+            tensor = tensor.narrow(dim, 0, 1)
+    return tensor
+
+
+def _span(size: Sequence[int], strides: Sequence[int]) -> int:
+    """Get the number of elements spanned in memory by a tensor with the given size and strides"""
+    if 0 in size:
+        return 0
+    return 1 + sum((length - 1) * stride for length, stride in zip(size, strides))
+
+
+def _memory_ordered(tensor: torch.Tensor) -> Optional[torch.Tensor]:
+    """Permute the dimensions of the tensor to be in memory order.  Returns `None` if the tensor is
+    not dense and so has no contiguous permutation."""
+    order = sorted(range(tensor.dim()), key=tensor.stride, reverse=True)
+    permuted = tensor.permute(order)
+    return permuted if permuted.is_contiguous() else None
 
 
 class ModuleHelperStub(mincepy.BaseHelper, obj_type=None, type_id=None):
+    """Saves a module using its `__dict__`, so submodules, parameters and tensors are each saved
+    as separate objects.  If `packed` is set, the whole module tree is instead saved as a single
+    packed checkpoint, see `save_packed()`."""
+
+    def __init__(self, packed: bool = False, cache_hashes: bool = False):
+        super().__init__()
+        self._packed = packed
+        self._cache_hashes = cache_hashes
+
     @override
     def yield_hashables(self, module: torch.nn.Module, hasher, /):
         yield from hasher.yield_hashables(module.__dict__)
 
     @override
-    def save_instance_state(self, model: torch.nn.Module, _saver, /):
+    def save_instance_state(self, model: torch.nn.Module, saver, /):
+        if self._packed:
+            return save_packed(model, saver, self._cache_hashes)
         return model.__dict__
 
     @override
-    def load_instance_state(self, module: torch.nn.Module, saved_state: dict, _referencer, /):
+    def load_instance_state(self, module: torch.nn.Module, saved_state: dict, loader, /):
+        if PACKED_TENSORS in saved_state:
+            load_packed(module, saved_state, loader)
+            return
+
         for key, value in saved_state.items():
             setattr(module, key, value)
 
@@ -103,18 +672,28 @@ class LinearHelper(
 
 
 class SavableModuleMixin(mincepy.SavableObject):
-    """Mixin for a pytorch module that provides the boilerplate needed to make it savable"""
+    """Mixin for a pytorch module that provides the boilerplate needed to make it savable.  Set
+    `PACKED = True` on the class to save the whole module tree as a packed checkpoint."""
+
+    PACKED = False
+    CACHE_HASHES = False
 
     @override
     def yield_hashables(self: torch.nn.Module, hasher, /):
         yield from hasher.yield_hashables(self.__dict__)
 
     @override
-    def save_instance_state(self: torch.nn.Module, _saver, /) -> dict:
+    def save_instance_state(self: torch.nn.Module, saver, /) -> dict:
+        if self.PACKED:
+            return save_packed(self, saver, self.CACHE_HASHES)
         return self.__dict__
 
     @override
-    def load_instance_state(self: torch.nn.Module, saved_state: dict, _referencer, /):
+    def load_instance_state(self: torch.nn.Module, saved_state: dict, loader, /):
+        if PACKED_TENSORS in saved_state:
+            load_packed(self, saved_state, loader)
+            return
+
         for key, value in saved_state.items():
             setattr(self, key, value)
 
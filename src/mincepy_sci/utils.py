@@ -0,0 +1,26 @@
+"""Utilities shared by the type helper modules"""
+
+from typing import Optional
+
+import mincepy
+
+__all__ = ("save_unique",)
+
+
+def save_unique(historian: mincepy.Historian, obj, meta: Optional[dict] = None):
+    """Save an object unless one of the same type, with the same hash, has been saved already, and
+    get the object id of the record either way"""
+    obj_id = historian.get_obj_id(obj)
+    if obj_id is not None:
+        return obj_id
+
+    existing = historian.archive.find(
+        type_id=historian.get_obj_type_id(type(obj)),
+        # A bare string would be taken as an iterable of hashes to match
+        snapshot_hash=[historian.hash(obj)],
+        limit=1,
+    )
+    for record in existing:
+        return record.obj_id
+
+    return historian.save_one(obj, meta)
@@ -1,2 +1,12 @@
 # pylint: disable=unused-import, redefined-outer-name
+import mincepy
 from mincepy.testing import archive_uri, historian, mongodb_archive
+import pytest
+
+
+@pytest.fixture
+def other_historian(archive_uri):
+    """A second, empty, historian with all the plugin types, e.g. to merge into"""
+    with mincepy.testing.temporary_historian(archive_uri + "-other") as other:
+        other.register_types(mincepy.plugins.get_types())
+        yield other
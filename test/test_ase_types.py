@@ -2,8 +2,15 @@
 import pytest
 
 ase = pytest.importorskip("ase")
+from ase.calculators.singlepoint import SinglePointCalculator
 import ase.build
+import ase.constraints
+import ase.db.row
+import ase.io
 import mincepy
+import numpy
+
+from mincepy_sci import ase_types, fingerprints
 
 
 def test_saving_atoms(historian: mincepy.Historian):
@@ -30,3 +37,311 @@ def test_saving_atoms_no_pbc(historian: mincepy.Historian):
     del atoms
 
     assert historian.load(atoms_id).get_chemical_formula() == "H2"
+
+
+def test_saving_empty_atoms(historian: mincepy.Historian):
+    assert historian.eq(ase.Atoms(), ase.Atoms())
+    assert not historian.eq(ase.Atoms(), ase.Atoms("H"))
+    atoms_id = historian.save(ase.Atoms())
+
+    assert historian.eq(historian.load(atoms_id), ase.Atoms())
+
+
+def test_saving_atoms_all_fields(historian: mincepy.Historian):
+    atoms = ase.build.bulk("NaCl", "rocksalt", a=5.64, cubic=True)
+    atoms.rattle(0.05, seed=1)
+    atoms.set_tags(range(len(atoms)))
+    atoms.set_initial_magnetic_moments([0.5] * len(atoms))
+    atoms.set_momenta(numpy.random.default_rng(0).random((len(atoms), 3)))
+    atoms.new_array("charges", numpy.linspace(-1.0, 1.0, len(atoms)))
+    atoms.set_constraint(ase.constraints.FixAtoms(indices=[0, 2]))
+    atoms.set_celldisp([0.1, 0.2, 0.3])
+    atoms.info["label"] = "salt"
+    forces = numpy.random.default_rng(1).random((len(atoms), 3))
+    atoms.calc = SinglePointCalculator(atoms, energy=-3.2, forces=forces)
+    expected = atoms.copy()
+
+    atoms_id = historian.save(atoms)
+    del atoms
+    loaded = historian.load(atoms_id)  # type: ase.Atoms
+
+    assert set(loaded.arrays) == set(expected.arrays)
+    for name, array in expected.arrays.items():
+        assert loaded.arrays[name].dtype == array.dtype
+        assert numpy.array_equal(loaded.arrays[name], array)
+    assert numpy.array_equal(loaded.cell.array, expected.cell.array)
+    assert numpy.array_equal(loaded.pbc, expected.pbc)
+    assert numpy.array_equal(loaded.get_celldisp(), expected.get_celldisp())
+    assert loaded.info == {"label": "salt"}
+    assert loaded.constraints[0].todict() == expected.constraints[0].todict()
+    assert loaded.get_potential_energy() == -3.2
+    assert numpy.array_equal(loaded.get_forces(apply_constraint=False), forces)
+
+    # The loaded atoms should behave like any other
+    loaded.positions[0] += 1.0
+    loaded.append("H")
+    historian.save(loaded)
+    assert len(historian.load(atoms_id)) == len(expected) + 1
+
+
+def test_saving_atoms_to_file(historian: mincepy.Historian):
+    historian.register_type(ase_types.AtomsHelper(file_threshold=0))
+    atoms = ase.build.bulk("Cu", cubic=True) * (2, 2, 2)
+    expected = atoms.copy()
+    atoms_id = historian.save(atoms)
+    assert "file" in historian.get_current_record(atoms).state
+    del atoms
+
+    assert historian.eq(historian.load(atoms_id), expected)
+
+
+def test_loading_legacy_atoms_state(historian: mincepy.Historian):
+    atoms = ase.build.molecule("CH4")
+    atoms.calc = SinglePointCalculator(atoms, energy=1.5)
+    helper = ase_types.AtomsHelper()
+    loaded = helper.new(None)
+    helper.load_instance_state(loaded, ase.db.row.atoms2dict(atoms), None)
+
+    assert "unique_id" in loaded.info
+    del loaded.info["unique_id"]
+    assert historian.eq(loaded, atoms)
+    assert loaded.get_potential_energy() == 1.5
+
+
+def make_frames(num_frames: int) -> list:
+    frames = []
+    rng = numpy.random.default_rng(0)
+    for step in range(num_frames):
+        atoms = ase.build.bulk("Cu", cubic=True) * (2, 2, 2)
+        atoms.rattle(0.05, seed=step)
+        atoms.info["step"] = step
+        atoms.calc = SinglePointCalculator(
+            atoms, energy=-float(step), forces=rng.random((len(atoms), 3))
+        )
+        frames.append(atoms)
+    return frames
+
+
+def test_saving_trajectory(historian: mincepy.Historian):
+    frames = make_frames(20)
+    trajectory = ase_types.Trajectory(frames)
+    assert len(trajectory) == 20
+    assert historian.eq(trajectory[3], frames[3])
+
+    trajectory_id = historian.save(trajectory)
+    state = historian.get_current_record(trajectory).state
+    # The numbers, cell and pbc are the same in every frame, so are only stored once
+    assert set(state["constant"]["fields"]["arrays"]) == {"numbers"}
+    assert set(state["varying"]["fields"]["arrays"]) == {"positions"}
+    assert set(state["varying"]["fields"]["results"]) == {"energy", "forces"}
+    del trajectory
+
+    loaded = historian.load(trajectory_id)  # type: ase_types.Trajectory
+    assert len(loaded) == 20
+    for atoms, expected in zip(loaded, frames):
+        assert historian.eq(atoms, expected)
+        assert atoms.info == expected.info
+        assert atoms.get_potential_energy() == expected.get_potential_energy()
+        assert numpy.array_equal(atoms.get_forces(), expected.get_forces())
+
+    assert [atoms.info["step"] for atoms in loaded[15:2:-4]] == [15, 11, 7, 3]
+    assert loaded[-1].info["step"] == 19
+    assert historian.eq(loaded, ase_types.Trajectory(frames))
+
+    # Saving again should be a no-op as nothing has changed
+    historian.save(loaded)
+    assert historian.get_current_record(loaded).version == 0
+
+
+def test_saving_trajectory_array_info(historian: mincepy.Historian):
+    frames = make_frames(4)
+    for atoms in frames:
+        atoms.info = {"origin": numpy.zeros(3)}
+    trajectory = ase_types.Trajectory(frames)
+    frames[-1].info = {"origin": numpy.ones(3)}
+    varying = ase_types.Trajectory(frames)
+    assert not historian.eq(trajectory, varying)
+
+    trajectory_id, varying_id = historian.save(trajectory, varying)
+    del trajectory, varying
+
+    loaded = historian.load(trajectory_id)
+    assert all(numpy.array_equal(atoms.info["origin"], numpy.zeros(3)) for atoms in loaded)
+    loaded = historian.load(varying_id)
+    for atoms, expected in zip(loaded, frames):
+        assert numpy.array_equal(atoms.info["origin"], expected.info["origin"])
+    assert historian.eq(loaded, ase_types.Trajectory(frames))
+
+
+def test_loading_trajectory_frames(historian: mincepy.Historian):
+    frames = make_frames(50)
+    trajectory_id = historian.save(ase_types.Trajectory(frames))
+    loaded = historian.load(trajectory_id)  # type: ase_types.Trajectory
+
+    read = []
+    file_store = loaded.file_store
+
+    class CountingStore:
+        def open_download_stream(self, file_id):
+            stream = file_store.open_download_stream(file_id)
+            read_bytes = stream.read
+
+            def read_counting(size=-1):
+                data = read_bytes(size)
+                read.append(len(data))
+                return data
+
+            stream.read = read_counting
+            return stream
+
+    loaded.file_store = CountingStore()
+    selected = loaded[10:14]
+    assert [atoms.info["step"] for atoms in selected] == [10, 11, 12, 13]
+    assert historian.eq(selected[2], frames[12])
+    # Only the 4 frames of positions, forces and energy should have been read
+    assert sum(read) == 4 * (2 * 32 * 3 * 8 + 8)
+
+
+def test_merging_trajectory(historian: mincepy.Historian, other_historian: mincepy.Historian):
+    frames = make_frames(5)
+    trajectory_id = historian.save(ase_types.Trajectory(frames))
+
+    # The file holding the frames should be copied along with the record
+    other_historian.merge(historian.objects.find())
+    loaded = other_historian.load(trajectory_id)
+    assert len(loaded) == 5
+    for atoms, expected in zip(loaded, frames):
+        assert historian.eq(atoms, expected)
+        assert numpy.array_equal(atoms.get_forces(), expected.get_forces())
+
+
+def test_trajectory_from_ase_trajectory(historian: mincepy.Historian, tmp_path):
+    frames = make_frames(5)
+    with ase.io.Trajectory(tmp_path / "md.traj", "w") as writer:
+        for atoms in frames:
+            writer.write(atoms)
+
+    with ase.io.Trajectory(tmp_path / "md.traj") as reader:
+        trajectory = ase_types.Trajectory(reader)
+    trajectory_id = historian.save(trajectory)
+    del trajectory
+
+    loaded = historian.load(trajectory_id)
+    assert len(loaded) == 5
+    assert historian.eq(loaded[4], frames[4])
+    assert numpy.array_equal(loaded[4].get_forces(), frames[4].get_forces())
+
+
+def test_trajectory_frames_must_match():
+    with pytest.raises(ValueError, match="atoms"):
+        ase_types.Trajectory([ase.build.molecule("H2"), ase.build.molecule("H2O")])
+
+    tagged = ase.build.molecule("H2")
+    tagged.set_tags([1, 2])
+    with pytest.raises(ValueError, match="fields"):
+        ase_types.Trajectory([ase.build.molecule("H2"), tagged])
+
+
+def test_hashing_atoms(historian: mincepy.Historian):
+    atoms = ase.build.bulk("Cu", cubic=True) * (2, 2, 2)
+    atoms.rattle(0.01, seed=0)
+    assert historian.hash(atoms) == historian.hash(atoms.copy())
+
+    # All the saved fields should be covered
+    tagged = atoms.copy()
+    tagged.set_tags(range(len(atoms)))
+    constrained = atoms.copy()
+    constrained.set_constraint(ase.constraints.FixAtoms([0]))
+    labelled = atoms.copy()
+    labelled.info["label"] = "Cu"
+    calculated = atoms.copy()
+    calculated.calc = SinglePointCalculator(calculated, energy=-1.0)
+    moved = atoms.copy()
+    moved.positions[5, 1] += 1e-9
+    hashes = {historian.hash(entry) for entry in (atoms, tagged, constrained, labelled, moved)}
+    hashes.add(historian.hash(calculated))
+    assert len(hashes) == 6
+
+    for entry in (tagged, constrained, labelled, calculated, moved):
+        assert not historian.eq(atoms, entry)
+        copy = entry.copy()
+        copy.calc = entry.calc
+        assert historian.eq(entry, copy)
+
+
+def test_hashing_atoms_tolerance(historian: mincepy.Historian):
+    historian.register_type(ase_types.AtomsHelper(hash_tolerance=1e-3))
+    atoms = ase.build.bulk("Cu", cubic=True) * (2, 2, 2)
+    atoms.positions = numpy.round(atoms.positions, 1)
+    relaxed = atoms.copy()
+    relaxed.positions += 1e-5
+    moved = atoms.copy()
+    moved.positions[0] += 0.01
+
+    assert historian.hash(relaxed) == historian.hash(atoms)
+    assert historian.hash(moved) != historian.hash(atoms)
+
+    atoms_id = ase_types.save_atoms(historian, atoms)
+    assert ase_types.save_atoms(historian, relaxed) == atoms_id
+    assert ase_types.save_atoms(historian, moved) != atoms_id
+
+
+def test_hashing_atoms_legacy(historian: mincepy.Historian):
+    historian.register_type(ase_types.AtomsHelper(legacy_hashing=True))
+    atoms = ase.build.bulk("Cu", cubic=True)
+    tagged = atoms.copy()
+    tagged.set_tags(range(len(atoms)))
+    assert historian.hash(atoms) == historian.hash(tagged)
+
+
+def test_hashing_atoms_legacy_baseline(historian: mincepy.Historian):
+    # Only the atoms use legacy hashing, the arrays within them should still hash as lists
+    historian.register_type(ase_types.AtomsHelper(legacy_hashing=True))
+    atoms = ase.Atoms(
+        "H2O",
+        positions=[[0.0, 0.0, 0.0], [0.0, 0.75, 0.5], [0.0, -0.75, 0.5]],
+        cell=[5.0, 6.0, 7.0],
+        pbc=[True, False, True],
+    )
+    # As computed by versions that only hashed the cell, pbc, positions and numbers
+    assert (
+        historian.hash(atoms) == "f11062481472fd66305069e31f24f052629ecdd4e01808397360700ca8a2a384"
+    )
+
+
+def test_atoms_fingerprint():
+    helper = ase_types.AtomsHelper()
+    atoms = ase.build.bulk("NaCl", "rocksalt", 5.64) * (2, 1, 1)
+    fingerprint = helper.fingerprint(atoms)
+    assert fingerprint["formula"] == "ClNa"
+    assert fingerprint["composition"] == {"Cl": 2, "Na": 2}
+    assert fingerprint["natoms"] == 4
+    assert fingerprint["volume_per_atom"] == pytest.approx(5.64**3 / 8)
+
+    # Invariant to rotating, translating and reordering the atoms
+    moved = atoms[[3, 1, 0, 2]]
+    moved.rotate(30, "z", rotate_cell=True)
+    moved.translate([0.3, 0.2, 0.1])
+    moved_fingerprint = helper.fingerprint(moved)
+    assert moved_fingerprint["distances"] == pytest.approx(fingerprint["distances"])
+    assert moved_fingerprint["volume_per_atom"] == pytest.approx(fingerprint["volume_per_atom"])
+
+    assert helper.fingerprint(ase.build.molecule("CH3CH2OH"))["formula"] == "C2H6O"
+    assert helper.fingerprint(ase.build.molecule("CH3CH2OH"))["volume_per_atom"] is None
+
+
+def test_finding_matching_atoms(historian: mincepy.Historian):
+    nacl = ase.build.bulk("NaCl", "rocksalt", 5.64)
+    nacl_id = historian.save_one(nacl)
+    historian.save_one(ase.build.bulk("NaCl", "rocksalt", 5.7))
+    historian.save_one(ase.build.bulk("Cu", cubic=True))
+    fingerprints.create_index(historian)
+
+    assert fingerprints.find_matching(historian, nacl.copy()) == [nacl_id]
+    assert fingerprints.find_matching(historian, ase.build.bulk("NaCl", "rocksalt", 5.5)) == []
+
+    # A match that ignores the positions, e.g. for similar structures
+    shifted = nacl.copy()
+    shifted.positions[1] += 0.01
+    assert fingerprints.find_matching(historian, shifted) == []
+    assert fingerprints.find_matching(historian, shifted, match=lambda *_: True) == [nacl_id]
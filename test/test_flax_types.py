@@ -0,0 +1,65 @@
+# pylint: disable=wrong-import-position
+import mincepy
+import pytest
+
+jax = pytest.importorskip("jax")
+linen = pytest.importorskip("flax.linen")
+import jax.numpy as jnp
+
+from mincepy_sci import flax_types
+
+
+@pytest.mark.parametrize(
+    "module",
+    [
+        linen.Dense(8),
+        linen.Dense(4, use_bias=False, dtype=jnp.bfloat16, precision=jax.lax.Precision.HIGHEST),
+        linen.DenseGeneral((2, 3), axis=(-2, -1), name="general"),
+        linen.Conv(16, (3, 3), strides=2, padding=((1, 1), (0, 0))),
+        linen.LayerNorm(epsilon=1e-5, use_scale=False),
+        linen.Embed(100, 32, param_dtype=jnp.float16),
+        linen.Sequential([linen.Dense(8), linen.relu, linen.LayerNorm(), linen.Dense(2)]),
+    ],
+)
+def test_saving_linen_modules(historian: mincepy.Historian, module):
+    module_id = historian.save(module)
+    expected_hash = historian.hash(module)
+    del module
+
+    loaded = historian.load(module_id)
+    assert historian.hash(loaded) == expected_hash
+
+
+def test_linen_module_records_are_compact(historian: mincepy.Historian):
+    dense = linen.Dense(8)
+    historian.save(dense)
+    assert historian.get_current_record(dense).state == {"features": 8}
+
+    model = linen.Sequential([linen.Dense(8), linen.relu, linen.Dense(2)])
+    model_id = historian.save(model)
+    del model
+
+    model = historian.load(model_id)
+    assert model.layers[1] is linen.relu
+    x = jnp.ones((1, 4))
+    params = model.init(jax.random.PRNGKey(0), x)
+    assert model.apply(params, x).shape == (1, 2)
+
+
+def test_saving_custom_initializer(historian: mincepy.Historian):
+    def kernel_init(key, shape, dtype):
+        return jax.random.normal(key, shape, dtype)
+
+    with pytest.raises(ValueError):
+        historian.save(linen.Dense(8, kernel_init=kernel_init))
+
+
+def test_save_module_deduplicates(historian: mincepy.Historian):
+    def architecture():
+        return linen.Sequential([linen.Dense(16), linen.relu, linen.Dense(1)])
+
+    model_id = flax_types.save_module(historian, architecture())
+    assert flax_types.save_module(historian, architecture()) == model_id
+    assert flax_types.save_module(historian, historian.load(model_id)) == model_id
+    assert flax_types.save_module(historian, linen.Dense(16)) != model_id
+    assert len(list(historian.records.find())) == 2
@@ -1,9 +1,13 @@
 # pylint: disable=wrong-import-position, invalid-name
-import jax.numpy as jnp
 import mincepy
 import pytest
 
 numpy = pytest.importorskip("numpy")
+jax = pytest.importorskip("jax")
+
+import jax.numpy as jnp
+
+from mincepy_sci import jax_types, numpy_types
 
 
 def test_saving_jax_arrays(historian: mincepy.Historian):
@@ -28,3 +32,148 @@ def test_saving_jax_arrays_integers(historian: mincepy.Historian):
 
     loaded_array = loaded_array.at[0].set(5.0)
     historian.save(loaded_array)
+
+
+def test_jax_arrays_eq(historian: mincepy.Historian):
+    assert historian.eq(jnp.ones(3), jnp.ones(3))
+    assert not historian.eq(jnp.ones(1), jnp.ones(3))
+    assert not historian.eq(jnp.ones(3), jnp.ones(3, dtype=jnp.int32))
+    assert historian.eq(jnp.zeros((0, 2)), jnp.zeros((0, 2)))
+
+
+@pytest.mark.parametrize("dtype", ["float32", "bfloat16", "int8", "uint16", "bool", "complex64"])
+def test_saving_jax_arrays_preserves_dtype(historian: mincepy.Historian, dtype):
+    array = jnp.arange(12).reshape(3, 4).astype(dtype)
+
+    array_id = historian.save(array)
+    assert "data" in historian.get_current_record(array).state
+    del array
+    loaded = historian.load(array_id)
+    assert loaded.dtype == jnp.dtype(dtype)
+    assert loaded.shape == (3, 4)
+    assert jnp.array_equal(loaded, jnp.arange(12).reshape(3, 4).astype(dtype))
+
+
+def test_saving_jax_arrays_to_file(historian: mincepy.Historian):
+    historian.register_type(jax_types.JaxArrayHelper(file_threshold=0))
+    array = jax.random.normal(jax.random.PRNGKey(0), (100, 10))
+    array_id = historian.save(array)
+    assert "file" in historian.get_current_record(array).state
+
+    with numpy_types.parallel_io():
+        other_id = historian.save(array * 2)
+
+    assert jnp.array_equal(historian.load(array_id), array)
+    assert jnp.array_equal(historian.load(other_id), array * 2)
+
+
+def test_loading_legacy_jax_arrays(historian: mincepy.Historian):
+    helper = historian.get_helper(type(jnp.ones(1)))
+    loaded = helper.new({"array": [[1.0, 2.0], [3.0, 4.0]], "dtype": "float32"})
+    assert loaded.dtype == jnp.float32
+    assert jnp.array_equal(loaded, jnp.array([[1.0, 2.0], [3.0, 4.0]]))
+
+
+def test_hashing_jax_arrays(historian: mincepy.Historian):
+    array = jnp.arange(20.0).reshape(4, 5)
+
+    assert historian.hash(array) == historian.hash(jnp.arange(20.0).reshape(4, 5))
+    assert historian.hash(array) != historian.hash(array.T)
+    assert historian.hash(array) != historian.hash(array.astype(jnp.bfloat16))
+    assert historian.hash(array) != historian.hash(array.at[1, 1].set(0.0))
+
+    historian.register_type(jax_types.JaxArrayHelper(legacy_hashing=True))
+    assert historian.hash(array) == historian.hash(array.tolist())
+
+
+def test_batched_device_get(historian: mincepy.Historian, monkeypatch):
+    params = {"dense": {"kernel": jnp.ones((3, 4)), "bias": jnp.zeros(4)}, "scale": jnp.ones(1)}
+    expected = historian.hash(params)
+    transfers = []
+    original = jax.device_get
+
+    def device_get(tree):
+        transfers.append(tree)
+        return original(tree)
+
+    monkeypatch.setattr(jax, "device_get", device_get)
+    with jax_types.batched_device_get(params):
+        fetched = jax_types.host_array(params["dense"]["kernel"])
+        assert jax_types.host_array(params["dense"]["kernel"]) is fetched
+        assert historian.hash(params) == expected
+        leaves = jax.tree_util.tree_leaves(params)
+        leaf_ids = historian.save(*leaves)
+    assert len(transfers) == 1
+    assert len(transfers[0]) == 3
+
+    for leaf, loaded in zip(leaves, historian.load(*leaf_ids)):
+        assert jnp.array_equal(loaded, leaf)
+
+
+def test_saving_pytree(historian: mincepy.Historian):
+    historian.register_type(jax_types.PyTreeHelper(file_threshold=0))
+    params = {
+        "dense": {"kernel": jnp.arange(12.0).reshape(3, 4), "bias": jnp.zeros(4, jnp.bfloat16)},
+        "layers": [jnp.ones(3, jnp.int8), (jnp.array(True), None)],
+        "scale": numpy.float32(2.0),
+    }
+    tree = jax_types.PyTree(params)
+    tree_id = historian.save(tree)
+    state = historian.get_current_record(tree).state
+    assert "file" in state
+    assert [entry["offset"] % jax_types.PACKED_ALIGNMENT for entry in state["leaves"]] == [0] * 5
+    del tree
+
+    loaded = historian.load(tree_id).tree
+    assert jax.tree_util.tree_structure(loaded) == jax.tree_util.tree_structure(params)
+    for leaf, expected in zip(jax.tree_util.tree_leaves(loaded), jax.tree_util.tree_leaves(params)):
+        assert isinstance(leaf, jax.Array)
+        assert leaf.dtype == expected.dtype
+        assert jnp.array_equal(leaf, expected)
+
+
+def test_saving_pytree_inline(historian: mincepy.Historian):
+    tree = jax_types.PyTree({"a": jnp.ones(3), "b": []})
+    tree_id = historian.save(tree)
+    assert "data" in historian.get_current_record(tree).state
+    loaded = historian.load(tree_id)
+    assert jnp.array_equal(loaded.tree["a"], jnp.ones(3))
+    assert loaded.tree["b"] == []
+
+    assert historian.hash(loaded) == historian.hash(jax_types.PyTree({"a": jnp.ones(3), "b": []}))
+    assert historian.hash(loaded) != historian.hash(jax_types.PyTree({"a": jnp.ones(3), "b": ()}))
+    assert historian.hash(loaded) != historian.hash(jax_types.PyTree({"a": jnp.zeros(3), "b": []}))
+
+    with pytest.raises(ValueError):
+        jax_types.save_tree({1: jnp.ones(3)}, None)
+
+
+def test_saving_frozen_dict_params(historian: mincepy.Historian):
+    linen = pytest.importorskip("flax.linen")
+    from flax.core import frozen_dict
+
+    from mincepy_sci import flax_types
+
+    historian.register_type(flax_types.FrozenDictHelper())
+    model = linen.Sequential([linen.Dense(8), linen.Dense(2)])
+    params = frozen_dict.freeze(model.init(jax.random.PRNGKey(0), jnp.ones((1, 4))))
+
+    # Frozen dicts can't be weakly referenced so they are saved by value within other objects
+    experiment = mincepy.Dict({"params": params})
+    experiment_id = historian.save(experiment)
+    assert len(historian.get_current_record(experiment).state["params"]["leaves"]) == 4
+    del experiment, params
+
+    loaded = historian.load(experiment_id)["params"]
+    assert isinstance(loaded, frozen_dict.FrozenDict)
+    expected = model.init(jax.random.PRNGKey(0), jnp.ones((1, 4)))
+    assert jax.tree_util.tree_all(
+        jax.tree_util.tree_map(jnp.array_equal, loaded.unfreeze(), expected)
+    )
+
+
+def test_saving_jax_scalars(historian: mincepy.Historian):
+    array_id = historian.save(jnp.array(2.5))
+    loaded = historian.load(array_id)
+    assert loaded.shape == ()
+    assert loaded == 2.5
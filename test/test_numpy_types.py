@@ -1,9 +1,13 @@
 # pylint: disable=wrong-import-position, invalid-name
+import threading
+
 import mincepy
 import pytest
 
 numpy = pytest.importorskip("numpy")
 
+from mincepy_sci import numpy_types
+
 
 def test_saving_numpy_arrays(historian: mincepy.Historian):
     array = numpy.ones(10)
@@ -27,3 +31,304 @@ def test_saving_numpy_arrays_integers(historian: mincepy.Historian):
 
     loaded_array[0] = 5.0
     historian.save(loaded_array)
+
+
+@pytest.mark.parametrize("dtype", ["float32", "int16", "uint8", "complex64", "bool", ">f8"])
+def test_saving_numpy_arrays_preserves_dtype(historian: mincepy.Historian, dtype):
+    array = numpy.arange(12).reshape(3, 4).astype(dtype)
+
+    array_id = historian.save(array)
+    del array
+    loaded_array = historian.load(array_id)
+    assert loaded_array.dtype == numpy.dtype(dtype).newbyteorder("<")
+    assert numpy.array_equal(loaded_array, numpy.arange(12).reshape(3, 4).astype(dtype))
+
+
+def test_saving_numpy_arrays_layout(historian: mincepy.Historian):
+    fortran = numpy.asfortranarray(numpy.random.rand(4, 5))
+    strided = numpy.random.rand(6, 8)[::2, 1::3]
+
+    fortran_id, strided_id = historian.save(fortran, strided)
+    loaded_fortran = historian.load(fortran_id)
+    assert loaded_fortran.flags.f_contiguous
+    assert numpy.array_equal(loaded_fortran, fortran)
+    assert numpy.array_equal(historian.load(strided_id), strided)
+
+
+def test_saving_numpy_arrays_to_file(historian: mincepy.Historian):
+    historian.register_type(numpy_types.ArrayHelper(file_threshold=0))
+    array = numpy.random.rand(100, 3).astype(numpy.float32)
+    expected = array.copy()
+    array_id = historian.save(array)
+    assert "file" in historian.get_current_record(array).state
+    del array
+
+    loaded_array = historian.load(array_id)
+    assert loaded_array.dtype == numpy.float32
+    assert numpy.array_equal(loaded_array, expected)
+
+
+def test_loading_legacy_list_state():
+    helper = numpy_types.ArrayHelper()
+    loaded = helper.new([[1, 2], [3, 4]])
+    helper.load_instance_state(loaded, [[1, 2], [3, 4]], None)
+    assert numpy.array_equal(loaded, numpy.array([[1, 2], [3, 4]]))
+
+
+def test_hashing_numpy_arrays(historian: mincepy.Historian):
+    array = numpy.random.rand(10, 4)
+
+    assert historian.hash(array) == historian.hash(numpy.asfortranarray(array))
+    assert historian.hash(array) != historian.hash(array.astype(numpy.float32))
+    assert historian.hash(array) != historian.hash(array.reshape(4, 10))
+    changed = array.copy()
+    changed[3, 2] += 1.0
+    assert historian.hash(array) != historian.hash(changed)
+    # A scalar array isn't the same as one with a single element
+    assert historian.hash(numpy.array(1.0)) != historian.hash(numpy.array([1.0]))
+    assert historian.hash(numpy.array(1.0)) == historian.hash(numpy.array(1.0))
+
+
+def test_hashing_numpy_arrays_legacy(historian: mincepy.Historian):
+    array = numpy.random.rand(10, 4)
+    buffer_hash = historian.hash(array)
+    historian.register_type(numpy_types.ArrayHelper(legacy_hashing=True))
+    assert historian.hash(array) == historian.hash(array.tolist())
+    assert historian.hash(array) != buffer_hash
+
+
+def test_loading_memory_mapped(historian: mincepy.Historian):
+    historian.register_type(numpy_types.ArrayHelper(file_threshold=0, lazy=True))
+    array = numpy.random.rand(50, 4)
+    expected = array.copy()
+    array_id = historian.save(array)
+    del array
+
+    loaded = historian.load(array_id)
+    assert isinstance(loaded, numpy_types.MappedArray)
+    assert not loaded.is_mapped
+    assert loaded.shape == (50, 4)
+    assert loaded.dtype == numpy.float64
+
+    assert numpy.array_equal(loaded[10:20], expected[10:20])
+    assert loaded.is_mapped
+    assert not loaded.array.flags.writeable
+    assert historian.hash(loaded) == historian.hash(expected)
+
+    # Saving again should be a no-op as nothing has changed
+    historian.save(loaded)
+    assert historian.get_current_record(loaded).version == 0
+
+
+@pytest.mark.parametrize("codec", sorted(numpy_types.CODECS))
+def test_saving_chunked(historian: mincepy.Historian, codec):
+    historian.register_type(numpy_types.ArrayHelper(file_threshold=0, chunks=(4, 3), codec=codec))
+    array = numpy.arange(10 * 7, dtype=numpy.int32).reshape(10, 7)
+    expected = array.copy()
+    array_id = historian.save(array)
+    assert len(historian.get_current_record(array).state["chunk_index"]) == 3 * 3
+    del array
+
+    loaded = historian.load(array_id)
+    assert loaded.dtype == numpy.int32
+    assert numpy.array_equal(loaded, expected)
+
+
+def test_loading_chunked_slices(historian: mincepy.Historian):
+    historian.register_type(numpy_types.ArrayHelper(file_threshold=0, chunks=(10,), lazy=True))
+    array = numpy.random.rand(100, 3)
+    expected = array.copy()
+    array_id = historian.save(array)
+    del array
+
+    loaded = historian.load(array_id)
+    assert isinstance(loaded, numpy_types.ChunkedArray)
+
+    opened = []
+    file_store = loaded.file_store
+
+    class CountingStore:
+        def open_download_stream(self, file_id):
+            opened.append(file_id)
+            return file_store.open_download_stream(file_id)
+
+    loaded.file_store = CountingStore()
+    assert numpy.array_equal(loaded[25:38], expected[25:38])
+    assert len(opened) == 2
+    assert loaded[-1, 2] == expected[-1, 2]
+    assert numpy.array_equal(loaded[..., 1], expected[..., 1])
+    assert numpy.array_equal(loaded[90:5:-7, ::2], expected[90:5:-7, ::2])
+    assert loaded[40:40].shape == (0, 3)
+    assert numpy.array_equal(loaded[[1, 5]], expected[[1, 5]])
+    assert numpy.array_equal(loaded, expected)
+
+
+def test_resaving_chunked_writes_changed_chunks(historian: mincepy.Historian):
+    historian.register_type(numpy_types.ArrayHelper(file_threshold=0, chunks=(10,)))
+    file_store = historian.archive.file_store
+    array = numpy.random.rand(100, 3)
+    historian.save(array)
+    first = historian.get_current_record(array).state
+    assert len(first["chunk_files"]) == 1
+    assert len(list(file_store.find({}))) == 1
+
+    array[42] = 0.0
+    historian.save(array)
+    second = historian.get_current_record(array).state
+    assert len(list(file_store.find({}))) == 2
+    # The unchanged chunks are read from the file written the first time around
+    assert second["chunk_files"][0]["file_id"] == first["chunk_files"][0]["_file_id"]
+    assert [entry[0] for entry in second["chunk_index"]] == [0] * 4 + [1] + [0] * 5
+    assert [old == new for old, new in zip(first["chunk_index"], second["chunk_index"])].count(
+        False
+    ) == 1
+    assert numpy.array_equal(historian.load(historian.get_obj_id(array)), array)
+
+
+def test_resaving_chunked_by_value_writes_all_chunks(historian: mincepy.Historian):
+    historian.register_type(numpy_types.ArrayHelper(file_threshold=0, chunks=(10,)))
+    file_store = historian.archive.file_store
+    array = numpy.random.rand(100, 3)
+    container = mincepy.List([array])
+    historian.save(container)
+    assert len(list(file_store.find({}))) == 1
+
+    # The array has no record of its own, so there is nothing to find the old chunks from
+    array[42] = 0.0
+    historian.save(container)
+    assert len(list(file_store.find({}))) == 2
+    state = historian.get_current_record(container).state[0]
+    assert len(state["chunk_files"]) == 1
+    assert [entry[0] for entry in state["chunk_index"]] == [0] * 10
+
+
+def test_merging_chunked(
+    historian: mincepy.Historian, other_historian: mincepy.Historian, archive_uri
+):
+    historian.register_type(numpy_types.ArrayHelper(file_threshold=0, chunks=(10,)))
+    other_historian.register_type(numpy_types.ArrayHelper(chunks=(10,)))
+    array = numpy.random.rand(100, 3)
+    array_id = historian.save(array)
+    other_historian.merge(historian.objects.find())
+    assert numpy.array_equal(other_historian.load(array_id), array)
+
+    # Now the chunks are spread over the files of all three versions, with the first one already
+    # merged
+    array[42] = 0.0
+    historian.save(array)
+    array[71] = 1.0
+    historian.save(array)
+    assert historian.get_current_record(array).version == 2
+    other_historian.merge(historian.objects.find())
+    loaded = other_historian.load(array_id)
+    assert numpy.array_equal(loaded, array)
+
+    # And into an archive that has none of them
+    with mincepy.testing.temporary_historian(archive_uri + "-third") as third:
+        third.register_types(mincepy.plugins.get_types())
+        third.merge(historian.objects.find())
+        assert numpy.array_equal(third.load(array_id), array)
+
+
+def test_array_eq():
+    array = numpy.random.rand(1000, 7)
+
+    assert numpy_types.array_eq(array, array)
+    assert numpy_types.array_eq(array, array.copy())
+    assert numpy_types.array_eq(array, numpy.asfortranarray(array))
+    assert not numpy_types.array_eq(array, array.astype(numpy.float32))
+    assert not numpy_types.array_eq(array, array[:-1])
+    assert not numpy_types.array_eq(numpy.ones(1), numpy.ones(5))
+
+    changed = array.copy()
+    changed[-1, -1] = -1.0
+    assert not numpy_types.array_eq(array, changed)
+
+    with_nan = array.copy()
+    with_nan[3] = numpy.nan
+    assert numpy_types.array_eq(with_nan, with_nan.copy())
+    assert not numpy_types.array_eq(with_nan, array)
+
+    ints = numpy.arange(200_000)
+    other_ints = ints.copy()
+    other_ints[150_000] = 0
+    assert numpy_types.array_eq(ints, ints.copy())
+    assert not numpy_types.array_eq(ints, other_ints)
+    assert numpy_types.array_eq(numpy.array(3), numpy.array(3))
+
+
+def test_array_eq_edge_cases():
+    # Empty along the first axis, or any other
+    assert numpy_types.array_eq(numpy.empty((0, 3)), numpy.empty((0, 3)))
+    assert numpy_types.array_eq(numpy.empty((3, 0)), numpy.empty((3, 0)))
+    assert not numpy_types.array_eq(numpy.empty((0, 3)), numpy.empty((0, 2)))
+
+    # Scalars
+    assert numpy_types.array_eq(numpy.array(numpy.nan), numpy.array(numpy.nan))
+    assert not numpy_types.array_eq(numpy.array(1.0), numpy.array(2.0))
+
+    # Python objects
+    objects = numpy.array([1, "two", None], dtype=object)
+    assert numpy_types.array_eq(objects, objects.copy())
+    assert not numpy_types.array_eq(objects, numpy.array([1, "two", 3], dtype=object))
+    assert numpy_types.array_eq(objects.reshape(3, 1), objects.copy().reshape(3, 1))
+
+
+def test_array_helper_eq(historian: mincepy.Historian):
+    assert historian.eq(numpy.zeros(3), numpy.zeros(3))
+    assert not historian.eq(numpy.zeros(1), numpy.zeros(3))
+    assert not historian.eq(numpy.zeros((2, 3)), numpy.zeros((3, 2)))
+
+
+def test_parallel_io(historian: mincepy.Historian):
+    historian.register_type(numpy_types.ArrayHelper(file_threshold=1024))
+    arrays = [numpy.random.rand(200, 3) * i for i in range(50)]
+    expected = [array.copy() for array in arrays]
+
+    with historian.transaction():
+        with numpy_types.parallel_io(max_workers=4):
+            ids = historian.save(*arrays)
+    del arrays
+
+    with numpy_types.parallel_io(max_workers=4):
+        loaded = historian.load(*ids)
+
+    for array, original in zip(loaded, expected):
+        assert numpy.array_equal(array, original)
+
+
+def test_parallel_io_merge(historian: mincepy.Historian, other_historian: mincepy.Historian):
+    historian.register_type(numpy_types.ArrayHelper(file_threshold=0))
+    array = numpy.random.rand(100, 3)
+    with numpy_types.parallel_io():
+        array_id = historian.save(array)
+
+    # The files written by the pool should be copied along with the record
+    other_historian.merge(historian.objects.find())
+    assert numpy.array_equal(other_historian.load(array_id), array)
+
+
+def test_parallel_io_modified_after_save(historian: mincepy.Historian):
+    historian.register_type(numpy_types.ArrayHelper(file_threshold=0))
+    array = numpy.zeros(1000)
+    started = threading.Event()
+
+    with historian.transaction():
+        with numpy_types.parallel_io(max_workers=1):
+            # Hold up the writes until the array has been modified
+            numpy_types.submit_io(started.wait)
+            array_id = historian.save(array)
+            array[1] = 7.0
+            started.set()
+
+    del array
+    assert numpy.array_equal(historian.load(array_id), numpy.zeros(1000))
+
+
+def test_parallel_io_error():
+    def fail():
+        raise RuntimeError("Failed")
+
+    with pytest.raises(RuntimeError):
+        with numpy_types.parallel_io():
+            numpy_types.submit_io(fail)
@@ -12,3 +12,164 @@ def test_basic(historian):
 
     frame = historian.load(frame_id)
     assert frame.to_dict("list") == frame_dict
+
+
+def test_column_dtypes(historian):
+    frame = pandas.DataFrame(
+        {
+            "ints": pandas.array([1, 2, 3], dtype="int16"),
+            "floats": [1.5, float("nan"), -2.0],
+            "bools": [True, False, True],
+            "strings": ["a", "b", None],
+            "nullable": pandas.array([1, None, 3], dtype="Int64"),
+            "category": pandas.Categorical(["x", "y", "x"], ordered=True),
+            "times": pandas.date_range("2024-01-01", periods=3, freq="h"),
+            "tz_times": pandas.date_range("2024-01-01", periods=3, tz="Europe/London"),
+            "sparse": pandas.arrays.SparseArray([0.0, 1.5, 0.0], fill_value=0.0),
+            "sparse_ints": pandas.arrays.SparseArray([3, 0, 0], fill_value=0),
+            "sparse_bools": pandas.arrays.SparseArray([True, False, False]),
+        },
+        index=pandas.Index([10, 20, 30], name="idx"),
+    )
+
+    frame_id = historian.save(frame)
+    expected = frame.copy()
+    del frame
+    pandas.testing.assert_frame_equal(historian.load(frame_id), expected)
+
+
+def test_multi_index(historian):
+    index = pandas.MultiIndex.from_product([["a", "b"], [1, 2]], names=["letter", "number"])
+    columns = pandas.MultiIndex.from_tuples([("x", 0), ("y", 1)])
+    frame = pandas.DataFrame([[1, 2], [3, 4], [5, 6], [7, 8]], index=index, columns=columns)
+
+    frame_id = historian.save(frame)
+    del frame
+    pandas.testing.assert_frame_equal(
+        historian.load(frame_id),
+        pandas.DataFrame([[1, 2], [3, 4], [5, 6], [7, 8]], index=index, columns=columns),
+    )
+
+
+@pytest.mark.parametrize("compression", [None, "zlib"])
+def test_large_frame(historian, compression):
+    np = pytest.importorskip("numpy")
+    from mincepy_sci import pandas_types
+
+    historian.register_type(
+        pandas_types.DataFrameHelper(file_threshold=1024, compression=compression)
+    )
+    frame = pandas.DataFrame({"a": np.arange(10_000), "b": np.linspace(0.0, 1.0, 10_000)})
+
+    frame_id = historian.save(frame)
+    state = historian.get_current_record(frame).state
+    assert all("file" in column for column in state["values"])
+    del frame
+
+    loaded = historian.load(frame_id)
+    assert loaded["a"].tolist() == list(range(10_000))
+    assert loaded["b"].iloc[-1] == 1.0
+
+
+@pytest.mark.parametrize("compression", [None, "zlib"])
+def test_parallel_io(historian, compression):
+    np = pytest.importorskip("numpy")
+    from mincepy_sci import numpy_types, pandas_types
+
+    historian.register_type(
+        pandas_types.DataFrameHelper(file_threshold=1024, compression=compression)
+    )
+    frames = [
+        pandas.DataFrame({"a": np.arange(1000) * i, "b": np.random.rand(1000)}) for i in range(10)
+    ]
+    expected = [frame.copy() for frame in frames]
+
+    with historian.transaction():
+        with numpy_types.parallel_io(max_workers=4):
+            ids = historian.save(*frames)
+    del frames
+
+    for frame_id, frame in zip(ids, expected):
+        pandas.testing.assert_frame_equal(historian.load(frame_id), frame)
+
+
+def test_legacy_state(historian):
+    frame = pandas.DataFrame({"col1": [1, 2], "col2": [3, 4]})
+    helper = historian.get_helper(pandas.DataFrame)
+
+    legacy = pandas.DataFrame.__new__(pandas.DataFrame)
+    helper.load_instance_state(legacy, frame.to_dict(orient="split"), None)
+    pandas.testing.assert_frame_equal(legacy, frame)
+
+
+def test_hashing(historian):
+    frame = pandas.DataFrame(
+        {"a": [1, 2, 3], "b": [1.0, 2.0, 3.0], "c": ["x", "y", None], "d": list("abc")}
+    )
+    frame["d"] = frame["d"].astype("category")
+    assert historian.hash(frame) == historian.hash(frame.copy())
+    assert historian.hash(frame) != historian.hash(frame.rename(columns={"a": "z"}))
+    assert historian.hash(frame) != historian.hash(frame.set_axis([3, 4, 5]))
+    assert historian.hash(frame) != historian.hash(frame.astype({"a": "int32"}))
+
+    changed = frame.copy()
+    changed.loc[1, "c"] = "w"
+    assert historian.hash(frame) != historian.hash(changed)
+
+
+def test_hashing_cached(historian):
+    np = pytest.importorskip("numpy")
+    from mincepy_sci import pandas_types
+
+    frame = pandas.DataFrame({"a": np.arange(1000), "b": np.linspace(0.0, 1.0, 1000)})
+    uncached = historian.hash(frame)
+    historian.register_type(pandas_types.DataFrameHelper(cache_hashes=True))
+    assert historian.hash(frame) == uncached
+    assert historian.hash(frame) == uncached
+
+    frame["a"] = np.arange(1000) * 2
+    cached = historian.hash(frame)
+    assert cached != uncached
+    historian.register_type(pandas_types.DataFrameHelper())
+    assert historian.hash(frame) == cached
+
+
+@pytest.mark.parametrize("compression", [None, "zlib"])
+def test_load_frame(historian, monkeypatch, compression):
+    np = pytest.importorskip("numpy")
+    from mincepy_sci import pandas_types
+
+    historian.register_type(pandas_types.DataFrameHelper(file_threshold=0, compression=compression))
+    frame = pandas.DataFrame(
+        {f"col{i}": np.arange(100) * i for i in range(20)},
+        index=pandas.Index(np.arange(100) + 1000, name="idx"),
+    )
+    frame["cat"] = pandas.Categorical(["a", "b"] * 50)
+    frame["text"] = [str(i) for i in range(100)]
+    frame_id = historian.save(frame)
+
+    file_store = historian.archive.file_store
+    opened = []
+    open_download_stream = file_store.open_download_stream
+
+    def counting_open(file_id):
+        opened.append(file_id)
+        return open_download_stream(file_id)
+
+    monkeypatch.setattr(file_store, "open_download_stream", counting_open)
+
+    columns = ["col3", "cat", "text", "col17"]
+    subset = pandas_types.load_frame(historian, frame_id, columns=columns)
+    pandas.testing.assert_frame_equal(subset, frame[columns])
+    # Index, two numeric columns and the categorical codes
+    assert len(opened) == 4
+
+    for rows in (slice(10, 20), slice(None, None, 3), slice(90, 5, -7), slice(50, 50)):
+        pandas.testing.assert_frame_equal(
+            pandas_types.load_frame(historian, frame_id, columns=columns, rows=rows),
+            frame[columns].iloc[rows],
+        )
+
+    pandas.testing.assert_frame_equal(pandas_types.load_frame(historian, frame_id), frame)
+    with pytest.raises(KeyError):
+        pandas_types.load_frame(historian, frame_id, columns=["missing"])
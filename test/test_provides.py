@@ -0,0 +1,95 @@
+import json
+import pathlib
+import subprocess
+import sys
+import uuid
+
+import mincepy
+import pytest
+
+from mincepy_sci import provides
+
+
+@pytest.mark.parametrize("name", sorted(provides.PLUGINS))
+def test_plugin_type_ids(name):
+    types = provides.load_plugin(name)
+    if not types:
+        pytest.skip(f"The '{name}' plugin can't be imported")
+
+    expected = {str(entry.TYPE_ID) for entry in types}
+    assert set(provides.PLUGINS[name].type_ids) == expected
+    assert name in provides.import_times()
+
+
+def test_get_types_is_lazy():
+    script = (
+        "import sys\n"
+        "from mincepy_sci import provides\n"
+        "provides.get_types()\n"
+        "print(sorted({'torch', 'jax', 'pandas', 'pymatgen', 'ase'} & set(sys.modules)))\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == "[]"
+
+
+def test_loading_imports_plugin(historian: mincepy.Historian):
+    numpy = pytest.importorskip("numpy")
+    array = numpy.arange(10.0)
+    array_id = historian.save(array)
+    del array
+
+    # Stand in for the numpy helper as if the plugin hadn't been loaded yet
+    type_id = uuid.UUID(provides.PLUGINS["numpy_types"].type_ids[0])
+    historian.register_type(provides.LazyHelper("numpy_types", type_id))
+    assert isinstance(historian.get_helper(type_id), provides.LazyHelper)
+
+    assert numpy.array_equal(historian.load(array_id), numpy.arange(10.0))
+    assert not isinstance(historian.get_helper(type_id), provides.LazyHelper)
+
+
+def test_loading_immutable_imports_plugin(historian: mincepy.Historian):
+    jnp = pytest.importorskip("jax.numpy")
+    array_id = historian.save(jnp.arange(4.0))
+
+    type_id = uuid.UUID(provides.PLUGINS["jax_types"].type_ids[0])
+    historian.register_type(provides.LazyHelper("jax_types", type_id))
+    assert jnp.array_equal(historian.load(array_id), jnp.arange(4.0))
+    assert not isinstance(historian.get_helper(type_id), provides.LazyHelper)
+
+
+def test_startup_benchmark(tmp_path):
+    pytest.importorskip("numpy")
+    script = pathlib.Path(__file__).parent.parent / "benchmarks" / "startup.py"
+    output = tmp_path / "startup.json"
+    subprocess.run(
+        [sys.executable, str(script), "--output", str(output), "--repeats", "1", "numpy_types"],
+        capture_output=True,
+        check=True,
+    )
+
+    results = json.loads(output.read_text(encoding="utf-8"))
+    assert results["get_types"]["num_types"] > 0
+    timings = results["plugins"]["numpy_types"]
+    assert {"import", "hash", "save", "load", "eq"} <= set(timings)
+    assert timings["round_trip"] and timings["same_hash"]
+
+
+def test_importing_library_after_set_historian():
+    pytest.importorskip("pandas")
+    script = (
+        "import mincepy\n"
+        "historian = mincepy.create_historian('mongomock://localhost#mincepy-late-import')\n"
+        "mincepy.set_historian(historian)\n"
+        "import numpy, pandas\n"
+        "frame_id = historian.save(pandas.DataFrame({'a': [1, 2], 'b': [0.5, 1.5]}))\n"
+        "list_id = historian.save(mincepy.List([numpy.arange(3.0)]))\n"
+        "loaded = historian.load(frame_id)\n"
+        "print(loaded.equals(pandas.DataFrame({'a': [1, 2], 'b': [0.5, 1.5]})))\n"
+        "print(historian.load(list_id)[0].tolist())\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.split() == ["True", "[0.0,", "1.0,", "2.0]"]
@@ -12,6 +12,8 @@ pymatgen_dos = pytest.importorskip("pymatgen.electronic_structure.dos")
 import mincepy
 import numpy
 
+from mincepy_sci import fingerprints, pymatgen_types
+
 
 def test_saving_structure(historian: mincepy.Historian):
     a_lat = 4.03893
@@ -29,6 +31,52 @@ def test_saving_structure(historian: mincepy.Historian):
     assert numpy.all(loaded_structure.lattice.a == a_lat)
 
 
+def test_saving_structure_all_fields(historian: mincepy.Historian):
+    structure = pymatgen_core.Structure(
+        pymatgen_core.Lattice.hexagonal(3.0, 5.0),
+        [{"Fe2+": 0.5, "Mn3+": 0.5}, "O", "O", pymatgen_core.DummySpecies("X", 1)],
+        [[0.0, 0.0, 0.0], [0.3, 0.2, 0.1], [0.6, 0.1, 0.7], [0.1, 0.1, 0.1]],
+        site_properties={
+            "magmom": [1.0, 0.0, 0.0, 2.5],
+            "selective_dynamics": [[True, False, True]] * 4,
+            "forces": [numpy.arange(3.0) for _ in range(4)],
+            "misc": ["a", None, 3, {"x": 1}],
+        },
+        labels=["A", None, "B", None],
+        properties={"energy": -3.2},
+    )
+    expected = structure.copy()
+    structure_hash = historian.hash(structure)
+    structure_id = historian.save(structure)
+    del structure
+
+    loaded = historian.load(structure_id)
+    assert loaded == expected
+    assert historian.hash(loaded) == structure_hash
+    assert [site.species for site in loaded] == [site.species for site in expected]
+    assert [site.label for site in loaded] == ["A", "O", "B", "X+"]
+    assert loaded.properties == {"energy": -3.2}
+    assert loaded[0].properties["selective_dynamics"] == [True, False, True]
+    assert isinstance(loaded[0].properties["forces"], numpy.ndarray)
+    assert loaded[3].properties["misc"] == {"x": 1}
+
+
+def test_loading_legacy_structure_state(historian: mincepy.Historian):
+    structure = pymatgen_core.Structure(
+        pymatgen_core.Lattice.cubic(5.64), ["Na", "Cl"], [[0, 0, 0], [0.5, 0.5, 0.5]]
+    )
+    helper = pymatgen_types.StructureHelper()
+    loaded = helper.new(structure.as_dict())
+    helper.load_instance_state(loaded, structure.as_dict(), None)
+    assert historian.eq(loaded, structure)
+
+    # The old hashes can still be reproduced
+    structure_hash = historian.hash(structure)
+    historian.register_type(pymatgen_types.StructureHelper(legacy_hashing=True))
+    assert historian.hash(structure) != structure_hash
+    assert historian.hash(structure) == historian.hash(structure.as_dict())
+
+
 def test_saving_molecule(historian: mincepy.Historian):
     coords = [
         [0.000000, 0.000000, 0.000000],
@@ -111,3 +159,30 @@ def test_periodic_site(historian: mincepy.Historian):
     assert loaded_site.b == 0.56
     assert loaded_site.c == 0.235
     assert loaded_site.lattice == lattice
+
+
+def test_finding_matching_structure(historian: mincepy.Historian):
+    def rocksalt(a_lat):
+        return pymatgen_core.Structure(
+            pymatgen_core.Lattice.cubic(a_lat),
+            ["Na", "Na", "Na", "Na", "Cl", "Cl", "Cl", "Cl"],
+            [
+                [0, 0, 0],
+                [0, 0.5, 0.5],
+                [0.5, 0, 0.5],
+                [0.5, 0.5, 0],
+                [0.5, 0, 0],
+                [0, 0.5, 0],
+                [0, 0, 0.5],
+                [0.5, 0.5, 0.5],
+            ],
+        )
+
+    structure_id = historian.save(rocksalt(5.64))
+    historian.save(rocksalt(5.7))
+
+    structure = rocksalt(5.64)
+    assert historian.get_helper(type(structure)).fingerprint(structure)["formula"] == "ClNa"
+    # Reordering the sites doesn't change the fingerprint
+    assert fingerprints.find_matching(historian, structure.get_sorted_structure()) == [structure_id]
+    assert fingerprints.find_matching(historian, rocksalt(5.5)) == []
@@ -9,7 +9,7 @@ torch = pytest.importorskip("torch")
 import mincepy
 from torch import nn  # pylint: disable=import-error
 
-from mincepy_sci import pytorch_types
+from mincepy_sci import numpy_types, pytorch_types
 
 
 def test_saving_tensor(historian: mincepy.Historian):
@@ -22,6 +22,118 @@ def test_saving_tensor(historian: mincepy.Historian):
     assert torch.all(torch.tensor(data) == loaded)
 
 
+@pytest.mark.parametrize(
+    "tensor",
+    [
+        torch.rand([4, 3, 5, 2]).to(memory_format=torch.channels_last),
+        torch.rand([10, 5])[::2, 1:],
+        torch.rand([3, 4]).T,
+        torch.tensor(1.5, dtype=torch.float64),
+        torch.tensor([[True, False]]),
+        torch.randint(-100, 100, (10,), dtype=torch.int16),
+        torch.rand(5, dtype=torch.complex64),
+        torch.rand(3, dtype=torch.complex64).conj(),
+        torch.rand(3, dtype=torch.complex64).conj().imag,
+        torch.empty(0, 3),
+    ],
+)
+def test_saving_tensor_layout(historian: mincepy.Historian, tensor):
+    expected = tensor.clone()
+    tensor_id = historian.save(tensor)
+    dense = tensor.is_contiguous() or tensor.is_contiguous(memory_format=torch.channels_last)
+    del tensor
+
+    loaded = historian.load(tensor_id)
+    assert loaded.dtype == expected.dtype
+    assert torch.equal(loaded, expected)
+    if dense:
+        assert loaded.stride() == expected.stride()
+
+
+def test_saving_tensor_to_file(historian: mincepy.Historian):
+    historian.register_type(pytorch_types.TensorHelper(file_threshold=0))
+    tensor = torch.rand([100, 10])
+    expected = tensor.clone()
+    tensor_id = historian.save(tensor)
+    assert "file" in historian.get_current_record(tensor).state
+    del tensor
+
+    assert torch.equal(historian.load(tensor_id), expected)
+
+
+def test_parallel_io(historian: mincepy.Historian):
+    historian.register_type(pytorch_types.TensorHelper(file_threshold=0))
+    tensors = [torch.rand([100, 10]) * i for i in range(20)]
+    expected = [tensor.clone() for tensor in tensors]
+
+    with historian.transaction():
+        with numpy_types.parallel_io(max_workers=4):
+            ids = historian.save(*tensors)
+    del tensors
+
+    with numpy_types.parallel_io(max_workers=4):
+        loaded = historian.load(*ids)
+
+    for tensor, original in zip(loaded, expected):
+        assert torch.equal(tensor, original)
+
+
+def test_loading_legacy_tensor(historian: mincepy.Historian):
+    tensor = torch.rand([4, 3])
+    tensor_file = historian.create_file("tensor.pt")
+    with tensor_file.open("wb") as file:
+        torch.save(tensor, file)
+    state = {"dtype": "float32", "size": [4, 3], "file": tensor_file}
+
+    helper = historian.get_helper(torch.Tensor)
+    loaded = helper.new(state)
+    helper.load_instance_state(loaded, state, None)
+    assert torch.equal(loaded, tensor)
+
+
+def test_hashing_tensors(historian: mincepy.Historian):
+    tensor = torch.rand([10, 4])
+
+    assert historian.hash(tensor) == historian.hash(tensor.clone())
+    assert historian.hash(tensor) == historian.hash(tensor.T.contiguous().T)
+    assert historian.hash(tensor) != historian.hash(torch.rand([10, 4]))
+    assert historian.hash(tensor) != historian.hash(tensor.double())
+    assert historian.hash(tensor) != historian.hash(tensor.reshape(4, 10))
+    changed = tensor.clone()
+    changed[3, 2] += 1.0
+    assert historian.hash(tensor) != historian.hash(changed)
+
+
+@pytest.mark.parametrize("cache_hashes", [False, True])
+def test_hashing_conj_tensors(historian: mincepy.Historian, cache_hashes):
+    historian.register_type(pytorch_types.TensorHelper(cache_hashes=cache_hashes))
+    tensor = torch.rand(3, dtype=torch.complex64)
+
+    conj = tensor.conj()
+    assert conj.is_conj()
+    assert historian.hash(conj) == historian.hash(conj.resolve_conj())
+    assert historian.hash(conj) != historian.hash(tensor)
+    assert historian.hash(conj.imag) == historian.hash(-tensor.imag)
+
+
+def test_tensor_helper_eq(historian: mincepy.Historian):
+    tensor = torch.rand([10, 4])
+    assert historian.eq(tensor, tensor.clone())
+    assert historian.eq(tensor, tensor.T.contiguous().T)
+    assert not historian.eq(tensor, tensor.double())
+    assert not historian.eq(tensor, tensor.reshape(4, 10))
+    assert not historian.eq(tensor, torch.rand([10, 4]))
+
+    with_nan = tensor.clone()
+    with_nan[3] = float("nan")
+    assert historian.eq(with_nan, with_nan.clone())
+    assert not historian.eq(with_nan, tensor)
+
+    assert historian.eq(torch.arange(5), torch.arange(5))
+    assert historian.eq(torch.eye(3).to_sparse(), torch.eye(3).to_sparse())
+    assert not historian.eq(torch.eye(3).to_sparse(), torch.eye(3))
+
+
 def test_saving_module_inheritance(historian: mincepy.Historian):
     """Test saving and loading module using inheritance.
 
@@ -94,3 +206,239 @@ class TheSavableModelClass(
     type_id=uuid.UUID("1df0f5aa-42a2-4fb5-8efc-f03339dfe306"),
 ):
     pass
+
+
+def test_saving_module_packed(historian: mincepy.Historian):
+    historian.register_type(TheModelClassHelper(packed=True))
+    model = TheModelClass()
+    model.fc3.weight = model.fc2.weight  # Shared parameters should stay shared
+    model.register_buffer("steps", torch.tensor(7))
+    model.fc1.bias.requires_grad_(False)
+    state_dict = copy.deepcopy(model.state_dict())  # pylint: disable=missing-kwoa
+
+    model_id = historian.save(model)
+    state = historian.get_current_record(model).state
+    assert len(state["tensors"]) == 10
+    del model
+
+    loaded = historian.load(model_id)
+    _compare_dicts(state_dict, loaded.state_dict())
+    assert loaded.fc3.weight is loaded.fc2.weight
+    assert isinstance(loaded.fc1.weight, nn.Parameter)
+    assert not loaded.fc1.bias.requires_grad
+    assert loaded.conv1.kernel_size == (5, 5)
+
+
+@pytest.mark.parametrize("cache_hashes", [False, True])
+def test_saving_module_packed_delta(historian: mincepy.Historian, cache_hashes):
+    historian.register_type(TheModelClassHelper(packed=True, cache_hashes=cache_hashes))
+    file_store = historian.archive.file_store
+    model = TheModelClass()
+    model_id = historian.save(model)
+    first = historian.get_current_record(model)
+    assert len(list(file_store.find({}))) == 1
+
+    # Fine-tune the head only
+    with torch.no_grad():
+        model.fc3.weight.add_(1.0)
+        model.fc3.bias.zero_()
+    state_dict = copy.deepcopy(model.state_dict())  # pylint: disable=missing-kwoa
+    historian.save(model)
+
+    state = historian.get_current_record(model).state
+    assert len(state["files"]) == 2
+    assert state["files"][0]["file_id"] == first.state["files"][0]["_file_id"]
+    head_bytes = sum(entry.numel() * entry.element_size() for entry in model.fc3.parameters())
+    assert file_store.find({"_id": state["files"][1]["_file_id"]}).next().length < head_bytes + 128
+    del model
+
+    _compare_dicts(state_dict, historian.load(model_id).state_dict())
+    first_dict = historian.load_snapshot(first.snapshot_id).state_dict()
+    assert not torch.equal(first_dict["fc3.bias"], state_dict["fc3.bias"])
+    assert torch.equal(first_dict["fc1.weight"], state_dict["fc1.weight"])
+
+
+def test_merging_module_packed(historian: mincepy.Historian, other_historian: mincepy.Historian):
+    historian.register_type(TheModelClassHelper(packed=True))
+    other_historian.register_type(TheModelClassHelper(packed=True))
+    model = TheModelClass()
+    model_id = historian.save(model)
+    first = historian.get_snapshot_id(model)
+    first_dict = copy.deepcopy(model.state_dict())  # pylint: disable=missing-kwoa
+    with torch.no_grad():
+        model.fc3.bias.zero_()
+    historian.save(model)
+    state_dict = copy.deepcopy(model.state_dict())  # pylint: disable=missing-kwoa
+
+    # Merging the latest version should bring along the first, which has the unchanged tensors
+    other_historian.merge(historian.objects.find())
+    _compare_dicts(state_dict, other_historian.load(model_id).state_dict())
+    _compare_dicts(first_dict, other_historian.load_snapshot(first).state_dict())
+
+
+def test_saving_module_packed_equal_tensors(historian: mincepy.Historian):
+    historian.register_type(pytorch_types.ModuleListHelper(packed=True))
+    model = nn.ModuleList([nn.Linear(4, 4), nn.Linear(4, 4)])
+    with torch.no_grad():
+        for layer in model:
+            layer.bias.zero_()
+    model_id = historian.save(model)
+    # The zero biases are reused from the first save, both at the same place in its file
+    with torch.no_grad():
+        model[0].weight.add_(1.0)
+    historian.save(model)
+    del model
+
+    loaded = historian.load(model_id)
+    with torch.no_grad():
+        loaded[0].bias.add_(1.0)
+    assert torch.equal(loaded[1].bias, torch.zeros(4))
+
+
+def test_tensor_digest():
+    tensor = torch.rand(10)
+    digest = pytorch_types.tensor_digest(tensor, cache=True)
+    assert pytorch_types.tensor_digest(tensor, cache=True) == digest
+    assert pytorch_types.tensor_digest(tensor.clone()) == digest
+
+    tensor.add_(1.0)
+    assert pytorch_types.tensor_digest(tensor, cache=True) != digest
+    assert pytorch_types.tensor_digest(tensor, cache=True) == pytorch_types.tensor_digest(tensor)
+
+
+def test_checkpoint_writer(historian: mincepy.Historian):
+    historian.register_type(TheModelClassHelper)
+    model = TheModelClass()
+
+    with pytorch_types.CheckpointWriter(historian, max_pending=2) as writer:
+        futures = []
+        state_dicts = []
+        for _ in range(3):
+            futures.append(writer.save(model))
+            state_dicts.append(copy.deepcopy(model.state_dict()))
+            with torch.no_grad():
+                # Changing the model straight away shouldn't affect the checkpoint
+                for param in model.parameters():
+                    param.add_(1.0)
+        writer.wait()
+
+        model.unsavable = lambda: None
+        failed = writer.save(model)
+
+    assert isinstance(failed.exception(), Exception)
+    ids = [future.result() for future in futures]
+    # The checkpoints are versions of one object
+    assert [snapshot_id.version for snapshot_id in ids] == [0, 1, 2]
+    assert len({snapshot_id.obj_id for snapshot_id in ids}) == 1
+    for snapshot_id, state_dict in zip(ids, state_dicts):
+        _compare_dicts(state_dict, historian.load(snapshot_id).state_dict())
+
+
+def test_checkpoint_writer_packed_delta(historian: mincepy.Historian):
+    historian.register_type(TheModelClassHelper(packed=True))
+    file_store = historian.archive.file_store
+    model = TheModelClass()
+
+    with pytorch_types.CheckpointWriter(historian) as writer:
+        first = writer.save(model)
+        with torch.no_grad():
+            model.fc3.bias.add_(1.0)
+        second = writer.save(model)
+        other = writer.save(TheModelClass())
+        writer.wait()
+
+    assert second.result().obj_id == first.result().obj_id
+    assert other.result().obj_id != first.result().obj_id
+    # Only the changed tensors are written for the second checkpoint
+    state = historian.archive.load(second.result()).state
+    first_state = historian.archive.load(first.result()).state
+    assert state["files"][0]["file_id"] == first_state["files"][0]["_file_id"]
+    assert len(list(file_store.find({}))) == 3
+
+
+def test_snapshot():
+    model = TheModelClass()
+    model.fc3.weight = model.fc2.weight
+    copied = pytorch_types.snapshot(model)
+
+    assert copied.fc3.weight is copied.fc2.weight
+    assert isinstance(copied.fc1.weight, nn.Parameter)
+    _compare_dicts(model.state_dict(), copied.state_dict())
+    with torch.no_grad():
+        model.fc1.weight.add_(1.0)
+    assert not torch.equal(model.fc1.weight, copied.fc1.weight)
+
+
+@pytest.mark.parametrize(
+    "dtype", [name for name in pytorch_types.torch_dtypes if name != "float4_e2m1fn_x2"]
+)
+def test_saving_tensor_dtypes(historian: mincepy.Historian, dtype):
+    # Use random bytes that are valid for every dtype, including bool
+    tensor = torch.randint(0, 2, (192,), dtype=torch.uint8)
+    tensor = tensor.view(pytorch_types.torch_dtypes[dtype]).reshape(3, -1)
+    expected = tensor.clone()
+    tensor_id = historian.save(tensor)
+    del tensor
+
+    loaded = historian.load(tensor_id)
+    assert loaded.dtype == expected.dtype
+    assert torch.equal(loaded.view(torch.uint8), expected.view(torch.uint8))
+
+
+def test_saving_tensor_compact(historian: mincepy.Historian):
+    historian.register_type(pytorch_types.TensorHelper(file_threshold=0))
+    base = torch.rand(1000, 100)
+    tensors = [base.expand(5, 1000, 100), base[::10, 1:3], torch.rand(4, 1).expand(4, 1000)]
+    expected = [tensor.clone() for tensor in tensors]
+    ids = historian.save(*tensors)
+
+    file_store = historian.archive.file_store
+    sizes = [file.length for file in file_store.find({})]
+    del tensors
+    assert sizes == [1000 * 100 * 4, 100 * 2 * 4, 4 * 4]
+    for obj_id, tensor in zip(ids, expected):
+        assert torch.equal(historian.load(obj_id), tensor)
+
+
+@pytest.mark.parametrize(
+    "tensor",
+    [
+        torch.sparse_coo_tensor([[0, 2, 2], [1, 0, 0]], [1.0, 2.0, 3.0], (3, 3)),
+        torch.sparse_coo_tensor([[0, 2], [1, 0]], [1.0, 2.0], (3, 3)).coalesce(),
+        torch.eye(4).to_sparse_csr(),
+        torch.eye(4).to_sparse_csc(),
+    ],
+)
+def test_saving_sparse_tensor(historian: mincepy.Historian, tensor):
+    expected = tensor.clone()
+    tensor_id = historian.save(tensor)
+    del tensor
+
+    loaded = historian.load(tensor_id)
+    assert loaded.layout == expected.layout
+    assert torch.equal(loaded.to_dense(), expected.to_dense())
+    if expected.layout == torch.sparse_coo:
+        assert loaded.is_coalesced() == expected.is_coalesced()
+
+
+def test_loading_tensor_map_location(historian: mincepy.Historian):
+    tensor = torch.rand(10, 3)
+    expected = tensor.clone()
+    tensor_id = historian.save(tensor)
+    del tensor
+
+    devices = []
+
+    def map_location(device):
+        devices.append(device)
+        return "cpu"
+
+    historian.register_type(
+        pytorch_types.TensorHelper(
+            map_location=map_location, map_dtype={torch.float32: torch.bfloat16}
+        )
+    )
+    loaded = historian.load(tensor_id)
+    assert devices == [torch.device("cpu")]
+    assert loaded.dtype == torch.bfloat16
+    assert torch.equal(loaded, expected.to(torch.bfloat16))